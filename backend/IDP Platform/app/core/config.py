@@ -21,3 +21,24 @@ node_collection = db["node_extractions"]
 # GridFS bucket for file storage
 fs_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="documents")
 
+
+# Background extraction jobs (/api/pipelines/extract-zip/jobs)
+EXTRACTION_JOB_WORKERS = int(os.getenv("EXTRACTION_JOB_WORKERS", "2"))
+# Active jobs are touched this often; a job not touched for
+# EXTRACTION_JOB_STALE_SECONDS lost its process and is recovered on startup
+EXTRACTION_JOB_HEARTBEAT_SECONDS = int(os.getenv("EXTRACTION_JOB_HEARTBEAT_SECONDS", "30"))
+EXTRACTION_JOB_STALE_SECONDS = int(os.getenv("EXTRACTION_JOB_STALE_SECONDS", "120"))
+# Spool files older than this that no active job owns are deleted on startup
+ORPHAN_SPOOL_MAX_AGE_SECONDS = int(os.getenv("ORPHAN_SPOOL_MAX_AGE_SECONDS", str(24 * 3600)))
+
+# PDFs of one ZIP batch extracted concurrently (CPU work goes to the
+# process pool sized by BATCH_CPU_WORKERS, LLM calls overlap in threads)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# A Queued/Running pdf_files record untouched for this long is taken to be
+# abandoned; before that, a ZIP resume leaves it to the batch that owns it
+PDF_IN_FLIGHT_STALE_SECONDS = int(os.getenv("PDF_IN_FLIGHT_STALE_SECONDS", "1800"))
+
+# ZIP upload guards (zip bombs): PDF member count and total uncompressed size
+MAX_ZIP_MEMBERS = int(os.getenv("MAX_ZIP_MEMBERS", "1000"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_BYTES", str(4 * 1024 ** 3)))
@@ -36,8 +36,12 @@
 
 
 
+import asyncio
+import threading
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from starlette.middleware.wsgi import WSGIMiddleware
 
 from app.routers import (
@@ -50,9 +54,13 @@ from app.routers import (
     metrics
 )
 
-# Dash app import
-from app.dashboard.dash_app import create_dash_app
-from app.dashboard.callbacks import register_callbacks
+from app.services.extraction_jobs import job_manager
+from app.services.cpu_pool import shutdown_process_pool
+from app.services.batch_extraction import ensure_indexes
+from app.services.openrouter_client import openrouter
+from app.services.pipeline_builder import close_qdrant_client
+from app.services.warmup import warm_up, readiness, WARMUP_ENGINES
+from app.services.telemetry import RequestMetricsMiddleware
 
 
 
@@ -77,6 +85,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms per route (outermost, so CORS is included)
+app.add_middleware(RequestMetricsMiddleware)
+
 # -------------------------------------------------
 # API Routers
 # -------------------------------------------------
@@ -90,17 +101,72 @@ app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
 # 🔥 NEW: Metrics API
 app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
 
+# Prometheus scrapes /metrics by default
+app.add_api_route("/metrics", metrics.get_prometheus_metrics, include_in_schema=False)
+
 # -------------------------------------------------
 # Dashboard (Dash inside FastAPI)
 # -------------------------------------------------
 
-dash_app = create_dash_app()
-register_callbacks(dash_app)
+class LazyWSGIApp:
+    """Builds the wrapped WSGI app on its first request (Dash/plotly/pandas are slow to import)."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = self.factory()
+        return self._app(environ, start_response)
+
+
+def build_dashboard():
+    # Dash app import
+    from app.dashboard.dash_app import create_dash_app
+    from app.dashboard.callbacks import register_callbacks
+
+    dash_app = create_dash_app()
+    register_callbacks(dash_app)
+    return dash_app.server
+
+
 app.mount(
     "/dashboard",
-    WSGIMiddleware(dash_app.server)
+    WSGIMiddleware(LazyWSGIApp(build_dashboard))
 )
 
+# -------------------------------------------------
+# Startup / shutdown
+# -------------------------------------------------
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+
+@app.on_event("startup")
+async def recover_extraction_jobs():
+    # Jobs interrupted by the last shutdown/crash are re-queued or failed
+    await job_manager.recover()
+
+
+@app.on_event("startup")
+async def start_warmup():
+    # Models load in the background; /ready reports when they are warm
+    if WARMUP_ENGINES:
+        app.state.warmup_task = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_extraction_workers():
+    await job_manager.shutdown()
+    shutdown_process_pool()
+    await openrouter.aclose()
+    close_qdrant_client()
+
 # -------------------------------------------------
 # Health Check
 # -------------------------------------------------
@@ -112,3 +178,9 @@ def health_check():
         "dashboard": "/dashboard",
         "metrics_api": "/api/metrics"
     }
+
+
+@app.get("/ready")
+def readiness_check():
+    ready, report = readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=report)
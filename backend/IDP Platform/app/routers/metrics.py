@@ -1,11 +1,22 @@
-from fastapi import APIRouter
-from datetime import datetime
+import asyncio
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from datetime import datetime, timedelta
 from collections import Counter, defaultdict
 
-from app.core.config import db
+from app.core.config import db, extractions_collection
+from app.services.llm_cache import llm_cache
+from app.services.invoice_packer import invoice_packer
+from app.services.llm_policy import llm_policy
+from app.services.timings import stage_percentiles
+from app.services.telemetry import render_metrics, CONTENT_TYPE
 
 router = APIRouter()
 pdf_files_collection = db["pdf_files"]
+layout_templates_collection = db["layout_templates"]
+
+TIMINGS_MAX_DOCS = 50000
 
 
 @router.get("/")
@@ -20,21 +31,25 @@ async def get_metrics():
                 "total": 0,
                 "success": 0,
                 "failed": 0,
-                "avg_pages": 0
+                "avg_pages": 0,
+                "dedup_hits": 0
             },
             "timeseries": [],
             "status": {},
             "folders": {},
-            "zips": {}
+            "zips": {},
+            "routes": {}
         }
 
     # ---------------- KPIs ----------------
     total = len(docs)
     success = sum(1 for d in docs if d.get("status") == "Success")
-    failed = sum(1 for d in docs if d.get("status") != "Success")
+    failed = sum(1 for d in docs if d.get("status") == "Failed")
     avg_pages = round(
         sum(d.get("page_count", 0) for d in docs) / total, 2
     )
+    # Uploads whose extraction was reused from an identical earlier PDF
+    dedup_hits = sum(1 for d in docs if d.get("deduplicated"))
 
     # ---------------- Time Series ----------------
     date_counter = defaultdict(int)
@@ -66,15 +81,105 @@ async def get_metrics():
         for d in docs
     )
 
+    # ---------------- Extraction Routes ----------------
+    route_counts = Counter(
+        d["routing"]["route"]
+        for d in docs if d.get("routing")
+    )
+
     return {
         "kpis": {
             "total": total,
             "success": success,
             "failed": failed,
-            "avg_pages": avg_pages
+            "avg_pages": avg_pages,
+            "dedup_hits": dedup_hits
         },
         "timeseries": timeseries,
         "status": dict(status_counts),
         "folders": dict(folder_counts),
-        "zips": dict(zip_counts)
+        "zips": dict(zip_counts),
+        "routes": dict(route_counts)
+    }
+
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    stats = await asyncio.to_thread(llm_cache.stats)
+    return {**stats, "packing": invoice_packer.stats()}
+
+
+@router.get("/llm-policy")
+async def get_llm_policy_stats():
+    return llm_policy.stats()
+
+
+@router.get("/layout-templates")
+async def get_layout_templates():
+    templates = await layout_templates_collection.find(
+        {}, {"samples": 0}
+    ).sort("hits", -1).to_list(length=1000)
+
+    return {
+        "total": len(templates),
+        "ready": sum(1 for t in templates if t.get("status") == "ready"),
+        "templates": [
+            {
+                "fingerprint": t["fingerprint"],
+                "suppliers": t.get("suppliers", []),
+                "status": t.get("status"),
+                "sample_count": t.get("sample_count", 0),
+                "hits": t.get("hits", 0),
+                "misses": t.get("misses", 0),
+                "fields": sorted(
+                    path for path, region in (t.get("regions") or {}).items() if "bbox" in region
+                ),
+                "last_used_at": t.get("last_used_at"),
+            }
+            for t in templates
+        ]
     }
+
+
+@router.get("/timings")
+async def get_stage_timings(
+    source: str = Query("batch", pattern="^(batch|playground)$"),
+    hours: float = Query(24, gt=0),
+    route: Optional[str] = None,
+    include_deduplicated: bool = False
+):
+    """Per-stage latency percentiles (seconds) of extractions finished in the last `hours`."""
+    until = datetime.utcnow()
+    since = until - timedelta(hours=hours)
+
+    if source == "batch":
+        collection = pdf_files_collection
+        query = {"status": "Success", "finished_at": {"$gte": since}}
+        if route:
+            query["routing.route"] = route
+    else:
+        collection = extractions_collection
+        query = {"created_at": {"$gte": since}}
+
+    query["timings"] = {"$exists": True}
+    # Reused results only have read/lookup stages and would skew the rest
+    if not include_deduplicated:
+        query["deduplicated"] = {"$ne": True}
+
+    docs = await collection.find(query, {"timings": 1}).to_list(length=TIMINGS_MAX_DOCS)
+
+    return {
+        "source": source,
+        "since": since,
+        "until": until,
+        "documents": len(docs),
+        "stages": stage_percentiles([d["timings"] for d in docs])
+    }
+
+
+# ---------------------------------------------------------------------
+# Prometheus scrape target (also served at /metrics)
+# ---------------------------------------------------------------------
+@router.get("/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
@@ -1,454 +1,244 @@
-# # fastapi_app.py
-
-# import os
-# import json
-# import time
-# import traceback
-# from fastapi import APIRouter, UploadFile, File, Form
-# from fastapi.responses import JSONResponse
-
-# # Import your existing extraction functions
-# from app.services.pipeline_builder import (
-#     extract_invoice_large_pdf,
-#     extract_invoice_text,
-#     extract_invoice_from_text,
-#     extract_pdf_pages_for_rag,
-#     remove_nulls,
-#     get_pdf_files
-# )
-
-# import fitz
-
-# router = APIRouter()
-
-# @router.post("/extract-file")
-# async def extract_from_file(file: UploadFile = File(...)):
-#     try:
-#         # Save temp file
-#         temp_path = f"temp_{int(time.time())}.pdf"
-#         with open(temp_path, "wb") as f:
-#             f.write(await file.read())
-
-#         # Count pages
-#         doc = fitz.open(temp_path)
-#         page_count = len(doc)
-#         doc.close()
-
-#         # Extraction logic
-#         if page_count > 5:
-#             output = extract_invoice_large_pdf(temp_path)
-#         else:
-#             text = extract_invoice_text(temp_path)
-#             if not text or len(text.strip()) < 10:
-#                 # fallback OCR for small PDFs
-#                 docs, _, _ = extract_pdf_pages_for_rag(temp_path)
-#                 text = "\n\n".join(docs)
-#             output = extract_invoice_from_text(text)
-
-#         clean_output = remove_nulls(output)
-
-#         # Cleanup temp file
-#         os.remove(temp_path)
-
-#         return JSONResponse(content=clean_output)
-
-#     except Exception as e:
-#         traceback.print_exc()
-#         return JSONResponse(
-#             status_code=500,
-#             content={"error": str(e)}
-#         )
-
-# @router.post("/extract-folder")
-# def extract_from_folder(folder_path: str = Form(...)):
-#     try:
-#         if not os.path.exists(folder_path):
-#             return JSONResponse(
-#                 status_code=400,
-#                 content={"error": "Folder does not exist"}
-#             )
-
-#         pdf_list = get_pdf_files(folder_path)
-#         results = {}
-
-#         for pdf_path in pdf_list:
-#             try:
-#                 doc = fitz.open(pdf_path)
-#                 page_count = len(doc)
-#                 doc.close()
-
-#                 if page_count > 5:
-#                     output = extract_invoice_large_pdf(pdf_path)
-#                 else:
-#                     text = extract_invoice_text(pdf_path)
-#                     if not text or len(text.strip()) < 10:
-#                         docs, _, _ = extract_pdf_pages_for_rag(pdf_path)
-#                         text = "\n\n".join(docs)
-#                     output = extract_invoice_from_text(text)
-
-#                 clean_output = remove_nulls(output)
-#                 results[os.path.basename(pdf_path)] = clean_output
-
-#             except Exception as inner_e:
-#                 results[os.path.basename(pdf_path)] = {
-#                     "error": str(inner_e)
-#                 }
-
-#         return JSONResponse(content=results)
-
-#     except Exception as e:
-#         traceback.print_exc()
-#         return JSONResponse(
-#             status_code=500,
-#             content={"error": str(e)}
-#         )
-
-
-# import os
-# import zipfile
-# import fitz
-# from uuid import uuid4
-# from fastapi import FastAPI, UploadFile, File, APIRouter
-# from fastapi.responses import JSONResponse
-
-# # Import your extraction functions
-# from app.services.pipeline_builder import (
-#     extract_invoice_text,
-#     extract_pdf_pages_for_rag,
-#     extract_invoice_from_text,
-#     extract_invoice_large_pdf,
-#     remove_nulls
-# )
-
-# router = APIRouter()
-
-# # ----------------------------------------------
-# # BASE PATH FOR LOCAL STORAGE
-# # ----------------------------------------------
-# BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# LOCAL_UPLOAD_DIR = os.path.join(BASE_DIR, "uploaded_files")
-# os.makedirs(LOCAL_UPLOAD_DIR, exist_ok=True)
-
-
-# # ----------------------------------------------
-# # 1️⃣ Save uploaded file to local project folder
-# # ----------------------------------------------
-# def save_uploaded_file_locally(uploaded_file: UploadFile) -> str:
-#     upload_id = str(uuid4())[:8]
-
-#     upload_folder = os.path.join(LOCAL_UPLOAD_DIR, upload_id)
-#     os.makedirs(upload_folder, exist_ok=True)
-
-#     saved_path = os.path.join(upload_folder, uploaded_file.filename)
-
-#     with open(saved_path, "wb") as f:
-#         f.write(uploaded_file.file.read())
-
-#     print(f"[DEBUG] Uploaded file saved to: {saved_path}")
-#     return saved_path
-
-
-# # ----------------------------------------------
-# # 2️⃣ Extract ZIP locally and return PDF file paths
-# # ----------------------------------------------
-# def extract_zip_and_get_pdfs(zip_path: str):
-#     extract_id = str(uuid4())[:8]
-#     extract_folder = os.path.join(LOCAL_UPLOAD_DIR, f"zip_{extract_id}")
-#     os.makedirs(extract_folder, exist_ok=True)
-
-#     with zipfile.ZipFile(zip_path, 'r') as z:
-#         z.extractall(extract_folder)
-
-#     print(f"[DEBUG] ZIP extracted to: {extract_folder}")
-
-#     pdf_list = []
-#     for root, dirs, files in os.walk(extract_folder):
-#         for f in files:
-#             if f.lower().endswith(".pdf"):
-#                 pdf_list.append(os.path.join(root, f))
-
-#     return pdf_list
-
-
-# # ----------------------------------------------
-# # 3️⃣ Small PDF → Text + OCR fallback
-# # ----------------------------------------------
-# def extract_small_pdf(pdf_path):
-#     text = extract_invoice_text(pdf_path)
-
-#     if not text or len(text.strip()) < 10:
-#         docs, _, _ = extract_pdf_pages_for_rag(pdf_path)
-#         if docs:
-#             text = "\n\n".join(docs)
-
-#     return extract_invoice_from_text(text)
-
-
-# # ====================================================================
-# # 4️⃣ API — Upload PDF or ZIP
-# # ====================================================================
-# @router.post("/extract-zip")
-# async def extract_file(file: UploadFile = File(...)):
-#     uploaded_path = save_uploaded_file_locally(file)
-#     filename = file.filename.lower()
-
-#     results = {}
-
-#     # ZIP file uploaded
-#     if filename.endswith(".zip"):
-#         pdf_files = extract_zip_and_get_pdfs(uploaded_path)
-
-#         if not pdf_files:
-#             return JSONResponse({"error": "No PDF files found inside ZIP."})
-
-#     # Single PDF uploaded
-#     elif filename.endswith(".pdf"):
-#         pdf_files = [uploaded_path]
-
-#     else:
-#         return JSONResponse({"error": "Only PDF or ZIP files allowed."})
-
-#     # Process each PDF
-#     for pdf_path in pdf_files:
-#         try:
-#             doc = fitz.open(pdf_path)
-#             page_count = len(doc)
-#             doc.close()
-
-#             if page_count > 5:
-#                 output = extract_invoice_large_pdf(pdf_path)
-#             else:
-#                 output = extract_small_pdf(pdf_path)
-
-#             clean_output = remove_nulls(output)
-#             results[os.path.basename(pdf_path)] = clean_output
-
-#         except Exception as e:
-#             results[os.path.basename(pdf_path)] = {"error": str(e)}
-
-#     return JSONResponse(results)
-
-import os
-import zipfile
-from io import BytesIO
-import tempfile
-from uuid import uuid4
-import fitz
-from datetime import datetime
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import JSONResponse
-
-from app.core.config import db, fs_bucket, node_collection
-
-# Import unmodified pipeline_builder methods
-from app.services.pipeline_builder import (
-    extract_invoice_text,
-    extract_pdf_pages_for_rag,
-    extract_invoice_from_text,
-    extract_invoice_large_pdf,
-    remove_nulls
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+from app.core.config import db, fs_bucket
+from app.services.batch_extraction import (
+    spool_upload,
+    remove_spool,
+    list_zip_pdfs,
+    save_to_gridfs,
+    iter_batch,
+    spool_gridfs_file,
+    plan_resume
 )
+from app.services.extraction_jobs import job_manager, job_progress
+from app.services.event_stream import format_event, STREAM_MEDIA_TYPES, STREAM_HEADERS
+from app.services.telemetry import GRIDFS_BYTES
 
 router = APIRouter()
 pdf_files_collection = db["pdf_files"]
 
 
 # ---------------------------------------------------------------------
-# Create temporary file from bytes (deleted later)
+# Spool an upload to disk and list the PDFs to process (+ stored ZIP id)
 # ---------------------------------------------------------------------
-def create_temp_pdf(bytes_data: bytes) -> str:
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    tmp.write(bytes_data)
-    tmp.close()
-    return tmp.name
+async def collect_pdf_files(file: UploadFile):
 
+    filename = file.filename.lower()
+
+    if not filename.endswith((".zip", ".pdf")):
+        return None, None, None, JSONResponse({"error": "Only PDF or ZIP allowed"})
+
+    spool_path = await asyncio.to_thread(spool_upload, file.file)
 
-# ---------------------------------------------------------------------
-# Delete temporary file
-# ---------------------------------------------------------------------
-def remove_temp(path: str):
     try:
-        os.remove(path)
-    except:
-        pass
+        # -------------------------------------------------------
+        # Case 1: ZIP file uploaded
+        # -------------------------------------------------------
+        if filename.endswith(".zip"):
+            pdf_files = await asyncio.to_thread(list_zip_pdfs, spool_path)
 
+            if not pdf_files:
+                remove_spool(spool_path)
+                return None, None, None, JSONResponse({"error": "ZIP contains no PDF files"})
 
-# ---------------------------------------------------------------------
-# Save file bytes (PDF or ZIP) to GridFS
-# ---------------------------------------------------------------------
-async def save_to_gridfs(file_bytes: bytes, filename: str, folder_path: str):
-    return await fs_bucket.upload_from_stream(
-        filename,
-        BytesIO(file_bytes),
-        metadata={"folder_path": folder_path}
-    )
+            with open(spool_path, "rb") as stream:
+                zip_id = await save_to_gridfs(stream, file.filename, folder_path="")
 
+        # -------------------------------------------------------
+        # Case 2: Single PDF uploaded
+        # -------------------------------------------------------
+        else:
+            pdf_files = [{
+                "filename": file.filename,
+                "folder_path": "",
+                "path": spool_path
+            }]
+            zip_id = None
+    except Exception:
+        remove_spool(spool_path)
+        raise
+
+    return spool_path, pdf_files, zip_id, None
 
-# ---------------------------------------------------------------------
-# Save extracted JSON result to MongoDB
-# ---------------------------------------------------------------------
-async def save_extraction_json(pdf_file_id, json_data):
-    doc = {
-        "pdf_file_id": pdf_file_id,
-        "extracted_json": json_data,
-    }
-    result = await node_collection.insert_one(doc)
-    return result.inserted_id
 
 # ---------------------------------------------------------------------
-# Extract PDFs from ZIP (entirely in memory)
+# Streaming output — one event per file as soon as it is recorded
 # ---------------------------------------------------------------------
-def extract_zip_to_memory(zip_bytes: bytes):
-    pdf_files = []
+async def stream_batch(fmt: str, spool_path: str, pdf_files: list, zip_id):
+    succeeded = failed = 0
 
-    with zipfile.ZipFile(BytesIO(zip_bytes)) as z:
-        for zipinfo in z.infolist():
-            if zipinfo.filename.lower().endswith(".pdf"):
-                pdf_files.append({
-                    "filename": os.path.basename(zipinfo.filename),
-                    "folder_path": os.path.dirname(zipinfo.filename),
-                    "data": z.read(zipinfo.filename)
-                })
+    try:
+        yield format_event(fmt, "batch", {
+            "zip_id": str(zip_id) if zip_id else None,
+            "total_files": len(pdf_files)
+        })
 
-    return pdf_files
+        async for result in iter_batch(pdf_files, zip_id, ordered=False, capture_errors=True):
+            if "error" in result:
+                failed += 1
+            else:
+                succeeded += 1
+            yield format_event(fmt, "file", result)
+
+        yield format_event(fmt, "done", {
+            "zip_id": str(zip_id) if zip_id else None,
+            "succeeded": succeeded,
+            "failed": failed
+        })
+    finally:
+        remove_spool(spool_path)
 
 
 # ---------------------------------------------------------------------
-# For PDFs with <=5 pages — extract text + OCR fallback
+# MAIN API — Upload ZIP or PDF and run extraction
 # ---------------------------------------------------------------------
-def process_small_pdf(pdf_bytes: bytes):
-
-    pdf_path = create_temp_pdf(pdf_bytes)
-
-    text = extract_invoice_text(pdf_path)
-
-    if not text or len(text.strip()) < 10:
-        docs, _, _ = extract_pdf_pages_for_rag(pdf_path)
-        text = "\n\n".join(docs) if docs else ""
+@router.post("/extract-zip")
+async def extract_file(
+    file: UploadFile = File(...),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|sse)$")
+):
 
-    result = remove_nulls(extract_invoice_from_text(text))
+    spool_path, pdf_files, zip_id, error = await collect_pdf_files(file)
+    if error:
+        return error
 
-    remove_temp(pdf_path)
-    return result
+    return await batch_response(stream, spool_path, pdf_files, zip_id)
 
 
 # ---------------------------------------------------------------------
-# For PDFs with >5 pages — use RAG pipeline
+# RESUME — re-run only the members of a stored ZIP that did not succeed
 # ---------------------------------------------------------------------
-def process_large_pdf(pdf_bytes: bytes):
+@router.post("/zips/{zip_id}/resume")
+async def resume_zip(
+    zip_id: str,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|sse)$")
+):
+
+    if not ObjectId.is_valid(zip_id):
+        raise HTTPException(status_code=400, detail="Invalid ZIP ID")
+    oid = ObjectId(zip_id)
 
-    pdf_path = create_temp_pdf(pdf_bytes)
+    try:
+        spool_path = await spool_gridfs_file(oid)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="ZIP not found")
+
+    try:
+        pdf_files = await asyncio.to_thread(list_zip_pdfs, spool_path)
+        pending = await plan_resume(oid, pdf_files)
+    except Exception:
+        remove_spool(spool_path)
+        raise
 
-    result = extract_invoice_large_pdf(pdf_path)
+    print(f"Resuming ZIP {zip_id}: {len(pending)}/{len(pdf_files)} files left")
 
-    remove_temp(pdf_path)
-    return result
+    return await batch_response(stream, spool_path, pending, oid)
 
 
 # ---------------------------------------------------------------------
-# MAIN API — Upload ZIP or PDF and run extraction
+# Run a batch and answer with a streamed or a single JSON response
 # ---------------------------------------------------------------------
-@router.post("/extract-zip")
-async def extract_file(file: UploadFile = File(...)):
-
-    uploaded_bytes = await file.read()
-    filename = file.filename.lower()
-
-    result_list = []
+async def batch_response(stream: Optional[str], spool_path: str, pdf_files: list, zip_id):
 
     # -------------------------------------------------------
-    # Case 1: ZIP file uploaded
+    # ?stream=ndjson|sse — emit each file's result as it completes
     # -------------------------------------------------------
-    if filename.endswith(".zip"):
-        pdf_files = extract_zip_to_memory(uploaded_bytes)
-
-        if not pdf_files:
-            return JSONResponse({"error": "ZIP contains no PDF files"})
+    if stream:
+        return StreamingResponse(
+            stream_batch(stream, spool_path, pdf_files, zip_id),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers=STREAM_HEADERS
+        )
 
-        zip_id = await save_to_gridfs(uploaded_bytes, file.filename, folder_path="")
+    result_list = []
+    failed_list = []
 
     # -------------------------------------------------------
-    # Case 2: Single PDF uploaded
+    # Process every PDF from ZIP or single PDF input
+    # (members are read from the spool one at a time; failures
+    # are checkpointed in pdf_files and can be resumed)
     # -------------------------------------------------------
-    elif filename.endswith(".pdf"):
-        pdf_files = [{
-            "filename": file.filename,
-            "folder_path": "",
-            "data": uploaded_bytes
-        }]
-        zip_id = None
-
-    else:
-        return JSONResponse({"error": "Only PDF or ZIP allowed"})
+    try:
+        async for result in iter_batch(pdf_files, zip_id, capture_errors=True):
+            if "error" in result:
+                failed_list.append(result)
+            else:
+                result_list.append(result)
+    finally:
+        remove_spool(spool_path)
 
 
     # -------------------------------------------------------
-    # Process every PDF from ZIP or single PDF input
+    # Return final response
     # -------------------------------------------------------
-    for pdf in pdf_files:
-
-        pdf_bytes = pdf["data"]
-        pdf_name = pdf["filename"]
-        folder_path = pdf["folder_path"]
+    return JSONResponse({
+        "zip_id": str(zip_id) if zip_id else None,
+        "files_processed": result_list,
+        "files_failed": failed_list
+    })
 
-        # Store original PDF in GridFS
-        pdf_file_id = await save_to_gridfs(pdf_bytes, pdf_name, folder_path)
 
-        # Determine page count using temp file
-        temp_pdf_path = create_temp_pdf(pdf_bytes)
+# ---------------------------------------------------------------------
+# JOB MODE — queue the upload and return immediately
+# ---------------------------------------------------------------------
+@router.post("/extract-zip/jobs")
+async def submit_extract_job(file: UploadFile = File(...)):
+
+    spool_path, pdf_files, zip_id, error = await collect_pdf_files(file)
+    if error:
+        return error
+
+    # The job owns the spool from here on and removes it when finished
+    job_id = await job_manager.submit(file.filename, pdf_files, zip_id, spool_path)
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": str(job_id),
+            "status": "queued",
+            "zip_id": str(zip_id) if zip_id else None,
+            "total_files": len(pdf_files),
+            "status_url": f"/api/pipelines/jobs/{job_id}",
+            "results_url": f"/api/pipelines/jobs/{job_id}/results"
+        }
+    )
 
-        doc = fitz.open(temp_pdf_path)
-        page_count = len(doc)
-        doc.close()
 
-        remove_temp(temp_pdf_path)
+@router.get("/jobs/{job_id}")
+async def get_extract_job(job_id: str):
 
-        # -------------------------------------------------------
-        # Run pipeline (small or large)
-        # -------------------------------------------------------
-        if page_count > 5:
-            extracted_json = process_large_pdf(pdf_bytes)
-        else:
-            extracted_json = process_small_pdf(pdf_bytes)
-
-        # Save extracted JSON in MongoDB
-        json_id = await save_extraction_json(pdf_file_id, extracted_json)
-
-        # Save metadata in collection
-        await pdf_files_collection.insert_one({
-            "status" : "Success",
-            "filename": pdf_name,
-            "folder_path": folder_path,
-            "pdf_gridfs_id": pdf_file_id,
-            "json_id": json_id,
-            "zip_id": zip_id,
-            "page_count": page_count,
-            "extracted_json":extracted_json,
-            "created_at": datetime.utcnow()
-        })
+    job = await job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-        result_list.append({
-            "filename": pdf_name,
-            "folder": folder_path,
-            "pdf_file_id": str(pdf_file_id),
-            "json_id": str(json_id),
-            "page_count": page_count
+    return job_progress(job)
 
-        })
 
+@router.get("/jobs/{job_id}/results")
+async def get_extract_job_results(job_id: str):
 
-    # -------------------------------------------------------
-    # Return final response
-    # -------------------------------------------------------
-    return JSONResponse({
-        "zip_id": str(zip_id) if zip_id else None,
-        "files_processed": result_list
-    })
+    job = await job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "zip_id": str(job["zip_id"]) if job.get("zip_id") else None,
+        "files_processed": [
+            f["result"] for f in job["files"] if f["status"] == "success"
+        ],
+        "files_failed": [
+            {"filename": f["filename"], "folder": f["folder"], "error": f.get("error")}
+            for f in job["files"] if f["status"] == "failed"
+        ]
+    }
 
-from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
-from bson import ObjectId
 
 @router.get("/download/pdf/{file_id}")
 async def download_pdf(file_id: str):
@@ -462,6 +252,7 @@ async def download_pdf(file_id: str):
 
     if not stream:
         raise HTTPException(status_code=404, detail="PDF not found")
+    GRIDFS_BYTES.inc(stream.length, direction="out")
 
     return StreamingResponse(
         stream,
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, Response, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, Response, HTTPException, Query
 from bson import ObjectId
 
 from fastapi.responses import JSONResponse
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import json
 import tempfile
 import os
 
 from app.schemas.models import FileUploadResponse, ExtractionRequest, ExtractionResponse
 from app.services.playground_service import PlaygroundService
+from app.services.timings import StageTimer
+from app.services.telemetry import EXTRACTIONS_IN_FLIGHT
+from app.services.event_stream import format_event, STREAM_MEDIA_TYPES, STREAM_HEADERS
 from app.core.dependencies import get_gridfs, get_projects_collection, get_extractions_collection
 
 from dotenv import load_dotenv
@@ -34,21 +37,29 @@ async def upload_and_extract(
     file: UploadFile = File(...),
     service: PlaygroundService = Depends(get_service)
 ):
+    timer = StageTimer()
+
     # Step 1: Upload the file
-    upload_result = await service.upload_file(project_id, file)
+    with timer.span("gridfs_upload"):
+        upload_result = await service.upload_file(project_id, file)
     file_id = upload_result["file_id"]
 
     # Step 2: Run extraction
-    extraction_full = await service.run_extraction(
-        project_id=project_id,
-        document_type=document_type,
-        file_id=file_id
-    )
+    with EXTRACTIONS_IN_FLIGHT.track(pipeline="playground"):
+        extraction_full = await service.run_extraction(
+            project_id=project_id,
+            document_type=document_type,
+            file_id=file_id,
+            timer=timer
+        )
 
     # Build trimmed extraction result
     extraction_result = {
         "status": extraction_full.get("status"),
-        "extracted_data": extraction_full.get("extracted_data")
+        "extracted_data": extraction_full.get("extracted_data"),
+        "deduplicated": extraction_full.get("deduplicated", False),
+        "compaction": extraction_full.get("compaction"),
+        "timings": extraction_full.get("timings")
     }
 
     # Step 3: Return only what you want
@@ -57,6 +68,39 @@ async def upload_and_extract(
         "extraction_result": extraction_result
     }
 
+@router.post("/extract/stream")
+async def upload_and_extract_stream(
+    project_id: str = Form(...),
+    document_type: str = Form(...),
+    file: UploadFile = File(...),
+    format: str = Query("sse", pattern="^(ndjson|sse)$"),
+    service: PlaygroundService = Depends(get_service)
+):
+    # Same as /extract, but fields are pushed as the LLM produces them
+    timer = StageTimer()
+    with timer.span("gridfs_upload"):
+        upload_result = await service.upload_file(project_id, file)
+    file_id = upload_result["file_id"]
+
+    async def events():
+        try:
+            with EXTRACTIONS_IN_FLIGHT.track(pipeline="playground"):
+                async for event, data in service.run_extraction_stream(
+                    project_id=project_id,
+                    document_type=document_type,
+                    file_id=file_id,
+                    timer=timer
+                ):
+                    yield format_event(format, event, data)
+        except HTTPException as e:
+            yield format_event(format, "error", {"detail": e.detail})
+
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers=STREAM_HEADERS
+    )
+
 @router.get("/download/{file_id}")
 async def download_file(file_id: str, service: PlaygroundService = Depends(get_service)):
     grid_out, data = await service.download_file(file_id)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.schemas.models import ConnectRequest, IndexRequest, SearchRequest, IndexStatusResponse
 from app.services.vector_manager import VectorManager
-from app.services.embedding_service import EmbeddingService
+from app.services.embedding_service import get_embedding_service
 
 router = APIRouter()
 
@@ -22,14 +22,11 @@ def connect_vector(request: ConnectRequest):
     except Exception as e:
         raise HTTPException(400, str(e))
 
-embedding_model = EmbeddingService("BAAI/bge-small-en-v1.5")  
-# OR: embedding_model = EmbeddingService("BAAI/bge-large-en-v1.5")
-
 @router.post("/index")
 def index_doc(req: IndexRequest):
 
     # Generate real embedding
-    vector = embedding_model.embed(req.text)
+    vector = get_embedding_service().embed(req.text)
 
     # Send to selected Vector DB
     manager.index(
@@ -48,7 +45,7 @@ def search(req: SearchRequest):
 
     # InstructorXL requires instruction + query
     instruction = "Represent the query for retrieval:"
-    query_embedding = embedding_model.model.encode(
+    query_embedding = get_embedding_service().model.encode(
         [[instruction, req.query]]
     )[0].tolist()
 
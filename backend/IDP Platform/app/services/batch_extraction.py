@@ -0,0 +1,737 @@
+import os
+import time
+import posixpath
+import hashlib
+import shutil
+import asyncio
+import traceback
+import zipfile
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from app.core.config import (
+    db,
+    extractions_collection,
+    fs_bucket,
+    node_collection,
+    BATCH_CONCURRENCY,
+    MAX_ZIP_MEMBERS,
+    MAX_ZIP_UNCOMPRESSED_BYTES,
+    PDF_IN_FLIGHT_STALE_SECONDS
+)
+from app.services.cpu_pool import run_cpu, prepare_pdf, complete_deferred_ocr
+from app.services.text_compaction import log_compaction
+from app.services.timings import StageTimer
+from app.services.telemetry import (
+    EXTRACTIONS_IN_FLIGHT,
+    GRIDFS_BYTES,
+    record_ocr,
+    record_cache_lookup,
+)
+from app.services.extraction_router import MAP_CONCURRENCY, RAG_TOP_K
+from app.services.invoice_packer import invoice_packer
+from app.services.rule_extractor import low_confidence_fields, llm_paths, merge_fast_path
+from app.services.layout_templates import (
+    apply_template,
+    template_sample,
+    learn_regions,
+    template_ready,
+    TEMPLATE_MAX_SAMPLES
+)
+from app.services.pipeline_builder import (
+    extract_invoice_from_text,
+    extract_invoice_map_reduce,
+    extract_invoice_fields,
+    INVOICE_FIELDS,
+    retrieve_invoice_context,
+    remove_nulls
+)
+from app.services.pipeline_version import PIPELINE_VERSION
+
+pdf_files_collection = db["pdf_files"]
+layout_templates_collection = db["layout_templates"]
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+# ---------------------------------------------------------------------
+# Indexes used by the batch pipeline (called on startup)
+# ---------------------------------------------------------------------
+async def ensure_indexes():
+    await pdf_files_collection.create_index(
+        [("content_hash", 1), ("pipeline_version", 1)]
+    )
+    await pdf_files_collection.create_index([("zip_id", 1), ("status", 1)])
+    await pdf_files_collection.create_index("finished_at")
+    await extractions_collection.create_index(
+        [("content_hash", 1), ("prompt_version", 1)]
+    )
+    await extractions_collection.create_index("created_at")
+    await layout_templates_collection.create_index("fingerprint", unique=True)
+
+
+# ---------------------------------------------------------------------
+# Spool an upload to a temp file on disk (caller removes it)
+# ---------------------------------------------------------------------
+def spool_upload(file_obj) -> str:
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".upload")
+    with tmp:
+        shutil.copyfileobj(file_obj, tmp, SPOOL_CHUNK_SIZE)
+    return tmp.name
+
+
+def remove_spool(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_orphan_spools(keep: set, max_age_seconds: float) -> int:
+    """Delete old *.upload spools in the temp dir that are not in `keep`."""
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    spool_dir = tempfile.gettempdir()
+
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        if not name.endswith(".upload") or path in keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# ---------------------------------------------------------------------
+# List PDF members of a spooled ZIP (metadata only, nothing decompressed)
+# ---------------------------------------------------------------------
+def list_zip_pdfs(zip_path: str):
+    try:
+        z = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+
+    pdf_files = []
+    total_size = 0
+
+    with z:
+        for zipinfo in z.infolist():
+            if zipinfo.is_dir() or not zipinfo.filename.lower().endswith(".pdf"):
+                continue
+
+            # ZipExtFile never returns more than file_size bytes, so the
+            # header sizes are a hard bound on what we will decompress
+            total_size += zipinfo.file_size
+            if len(pdf_files) + 1 > MAX_ZIP_MEMBERS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"ZIP contains more than {MAX_ZIP_MEMBERS} PDF files"
+                )
+            if total_size > MAX_ZIP_UNCOMPRESSED_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"ZIP uncompressed size exceeds {MAX_ZIP_UNCOMPRESSED_BYTES} bytes"
+                )
+
+            pdf_files.append({
+                "filename": os.path.basename(zipinfo.filename),
+                "folder_path": os.path.dirname(zipinfo.filename),
+                "path": zip_path,
+                "member": zipinfo.filename,
+            })
+
+    return pdf_files
+
+
+# ---------------------------------------------------------------------
+# Lazy access to one PDF (ZIP member or spooled single PDF)
+# ---------------------------------------------------------------------
+@contextmanager
+def open_pdf_stream(pdf: dict):
+    if pdf.get("member"):
+        with zipfile.ZipFile(pdf["path"]) as z:
+            with z.open(pdf["member"]) as stream:
+                yield stream
+    else:
+        with open(pdf["path"], "rb") as stream:
+            yield stream
+
+
+def read_pdf_bytes(pdf: dict) -> bytes:
+    with open_pdf_stream(pdf) as stream:
+        return stream.read()
+
+
+# ---------------------------------------------------------------------
+# Save a stream (PDF or ZIP) to GridFS
+# ---------------------------------------------------------------------
+class CountingReader:
+    """File-like wrapper counting the bytes read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+async def save_to_gridfs(source, filename: str, folder_path: str):
+    reader = CountingReader(source)
+    file_id = await fs_bucket.upload_from_stream(
+        filename,
+        reader,
+        metadata={"folder_path": folder_path}
+    )
+    GRIDFS_BYTES.inc(reader.bytes_read, direction="in")
+    return file_id
+
+
+# ---------------------------------------------------------------------
+# Save extracted JSON result to MongoDB
+# ---------------------------------------------------------------------
+async def save_extraction_json(pdf_file_id, json_data):
+    doc = {
+        "pdf_file_id": pdf_file_id,
+        "extracted_json": json_data,
+    }
+    result = await node_collection.insert_one(doc)
+    return result.inserted_id
+
+
+# ---------------------------------------------------------------------
+# Extraction for one PDF: CPU stage in the process pool, Qdrant in a
+# thread, LLM call on the shared async client (rate limited per model)
+# ---------------------------------------------------------------------
+async def extract_pdf(pdf_bytes: bytes, name: str = "document.pdf", timer: StageTimer = None):
+    timer = timer or StageTimer()
+
+    # Worker stages come back in `timings`; the rest is pool queueing/pickling
+    started = time.perf_counter()
+    prepared = await run_cpu(prepare_pdf, pdf_bytes, name)
+    worker_timings = prepared.pop("timings", {})
+    timer.merge(worker_timings)
+    timer.add("cpu_wait", max(0.0, time.perf_counter() - started - sum(worker_timings.values())))
+
+    if prepared.get("ocr_pending"):
+        prepared = await complete_deferred_ocr(pdf_bytes, name, prepared, timer)
+
+    # DocTR ran in the pool (or split across it); its seconds are in the timer
+    record_ocr("doctr", prepared["routing"]["ocr_pages"], timer.stages.get("ocr", 0.0))
+
+    fast_path = None
+    template = None
+    routing = prepared["routing"]
+    print(f"🧭 {name}: {routing['route']} — {routing['reason']}")
+    log_compaction(name, prepared["compaction"])
+
+    if prepared["route"] == "rag":
+        print("\n⚡ Large PDF detected — using FastEmbed + Qdrant Retrieval\n")
+        with timer.span("qdrant"):
+            context = await asyncio.to_thread(
+                retrieve_invoice_context, prepared["docs"], prepared["metadata"], RAG_TOP_K
+            )
+        with timer.span("llm"):
+            extracted_json = await extract_invoice_from_text(context)
+    elif prepared["route"] == "map_reduce":
+        with timer.span("llm"):
+            extracted_json = remove_nulls(
+                await extract_invoice_map_reduce(prepared["chunks"], MAP_CONCURRENCY)
+            )
+    else:
+        fast = prepared.get("fast_path")
+        layout = prepared.get("layout")
+
+        # Known supplier layout: read its learned regions instead of asking the LLM
+        if layout:
+            with timer.span("template"):
+                fast, template = await apply_layout_template(name, layout, fast)
+
+        with timer.span("llm"):
+            if fast:
+                extracted_json, fast_path = await extract_fast_path(name, prepared["text"], fast)
+                extracted_json = remove_nulls(extracted_json)
+            else:
+                # Small documents may share one request with others (PACKING_ENABLED)
+                extracted_json = remove_nulls(
+                    await invoice_packer.extract(prepared["text"])
+                )
+
+        # LLM results of layouts without a working template teach it;
+        # rule values merged in would only teach the rules back
+        paths = None if fast_path is None else fast_path["llm_paths"]
+        if layout and paths != [] and not (template and template["used"]):
+            with timer.span("template"):
+                await learn_layout_template(layout, extracted_json, paths)
+
+    details = {
+        "routing": routing,
+        "compaction": prepared["compaction"],
+        "fast_path": fast_path,
+        "template": template,
+    }
+    return prepared["page_count"], extracted_json, details
+
+
+# ---------------------------------------------------------------------
+# Rule/layout fields first, LLM only for the low-confidence ones
+# ---------------------------------------------------------------------
+async def extract_fast_path(name: str, text: str, fast: dict):
+    confidence = fast["confidence"]
+    llm_fields = low_confidence_fields(confidence)
+
+    if not llm_fields:
+        print(f"⚡ {name}: every field found by layout rules — LLM skipped")
+        invoice = fast["invoice"]
+        paths = []
+    elif len(llm_fields) == len(INVOICE_FIELDS):
+        invoice = await invoice_packer.extract(text)
+        paths = None
+    else:
+        print(f"⚡ {name}: layout rules filled all but {llm_fields}")
+        llm_result = await extract_invoice_fields(text, llm_fields)
+        invoice = merge_fast_path(fast["invoice"], llm_result, confidence)
+        paths = llm_paths(fast["invoice"], llm_result, confidence)
+
+    return invoice, {
+        "llm_fields": llm_fields,
+        # Values the LLM returned (None: all of them); only these teach templates
+        "llm_paths": paths,
+        "llm_skipped": not llm_fields,
+        "confidence": confidence,
+    }
+
+
+# ---------------------------------------------------------------------
+# Supplier layout templates (layout_templates collection)
+#   LLM-verified extractions → learned field regions → region lookup
+# ---------------------------------------------------------------------
+async def apply_layout_template(name: str, layout: dict, fast: dict):
+    """
+    Returns (fast-path result, template details). With a ready template
+    for the layout, its regions are read on top of the rule result; if
+    the document does not validate against it, `fast` is kept as is.
+    """
+    fingerprint = layout["fingerprint"]
+    template = await layout_templates_collection.find_one(
+        {"fingerprint": fingerprint, "status": "ready"}
+    )
+    if not template:
+        record_cache_lookup("layout_template", False)
+        return fast, None
+
+    applied = apply_template(template, layout["lines"], fast)
+    used = not applied["errors"]
+    record_cache_lookup("layout_template", used)
+
+    await layout_templates_collection.update_one(
+        {"_id": template["_id"]},
+        {"$inc": {"hits" if used else "misses": 1}, "$set": {"last_used_at": datetime.utcnow()}}
+    )
+
+    details = {
+        "fingerprint": fingerprint,
+        "used": used,
+        "fields": applied["fields"],
+        "errors": applied["errors"],
+    }
+
+    if not used:
+        print(f"🧩 {name}: layout {fingerprint} failed validation ({'; '.join(applied['errors'])}) — using the LLM")
+        return fast, details
+
+    print(f"🧩 {name}: {len(applied['fields'])} fields read from layout {fingerprint}")
+    return applied, details
+
+
+async def learn_layout_template(layout: dict, invoice: dict, paths=None):
+    sample = template_sample(layout["lines"], invoice, paths)
+    if not sample:
+        return
+
+    now = datetime.utcnow()
+    update = {
+        "$push": {"samples": {"$each": [sample], "$slice": -TEMPLATE_MAX_SAMPLES}},
+        "$setOnInsert": {"created_at": now, "status": "learning"},
+        "$set": {"updated_at": now},
+    }
+    supplier = (invoice.get("supplier") or {}).get("name")
+    if supplier:
+        update["$addToSet"] = {"suppliers": supplier}
+
+    template = await layout_templates_collection.find_one_and_update(
+        {"fingerprint": layout["fingerprint"]},
+        update,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+    regions = learn_regions(template["samples"])
+    status = "ready" if template_ready(template["samples"], regions) else "learning"
+    if status != template["status"]:
+        print(f"🧩 Layout {layout['fingerprint']} ({supplier}): {template['status']} → {status}")
+
+    await layout_templates_collection.update_one(
+        {"_id": template["_id"]},
+        {"$set": {"regions": regions, "status": status, "sample_count": len(template["samples"])}}
+    )
+
+
+# ---------------------------------------------------------------------
+# Per-file status checkpoints in pdf_files
+#   Queued → Running → Success | Failed (with error)
+# ---------------------------------------------------------------------
+async def register_pdfs(pdf_files: list, zip_id=None):
+    """Insert a Queued record (in input order) for every PDF not yet registered."""
+    new = [pdf for pdf in pdf_files if "record_id" not in pdf]
+    if not new:
+        return
+
+    now = datetime.utcnow()
+    result = await pdf_files_collection.insert_many(
+        [
+            {
+                "status": "Queued",
+                "filename": pdf["filename"],
+                "folder_path": pdf["folder_path"],
+                "zip_id": zip_id,
+                "zip_member": pdf.get("member"),
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now
+            }
+            for pdf in new
+        ],
+        ordered=True
+    )
+
+    for pdf, record_id in zip(new, result.inserted_ids):
+        pdf["record_id"] = record_id
+
+
+async def mark_running(pdf: dict):
+    now = datetime.utcnow()
+    await pdf_files_collection.update_one(
+        {"_id": pdf["record_id"]},
+        {
+            "$set": {"status": "Running", "started_at": now, "updated_at": now, "error": None},
+            "$inc": {"attempts": 1}
+        }
+    )
+
+
+async def mark_failed(pdf: dict, error: Exception):
+    now = datetime.utcnow()
+    await pdf_files_collection.update_one(
+        {"_id": pdf["record_id"]},
+        {"$set": {"status": "Failed", "error": str(error), "finished_at": now, "updated_at": now}}
+    )
+
+
+# ---------------------------------------------------------------------
+# Previous successful extraction of identical bytes (same pipeline)
+# ---------------------------------------------------------------------
+async def find_duplicate(content_hash: str):
+    return await pdf_files_collection.find_one(
+        {
+            "content_hash": content_hash,
+            "pipeline_version": PIPELINE_VERSION,
+            "status": "Success",
+        },
+        sort=[("created_at", 1)]
+    )
+
+
+# ---------------------------------------------------------------------
+# Read, fingerprint and extract one PDF — or reuse an earlier result
+# ---------------------------------------------------------------------
+async def extract_or_reuse(pdf: dict):
+    timer = StageTimer()
+
+    with timer.span("read"):
+        pdf_bytes = await asyncio.to_thread(read_pdf_bytes, pdf)
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+
+    with timer.span("dedup_lookup"):
+        duplicate = await find_duplicate(content_hash)
+    record_cache_lookup("batch_dedup", duplicate is not None)
+
+    if duplicate:
+        print(f"♻️ {pdf['filename']} matches {duplicate['_id']} — reusing extraction")
+        return {
+            "content_hash": content_hash,
+            "duplicate_of": duplicate,
+            "page_count": duplicate.get("page_count"),
+            "extracted_json": duplicate.get("extracted_json"),
+            "routing": duplicate.get("routing"),
+            "compaction": duplicate.get("compaction"),
+            "fast_path": duplicate.get("fast_path"),
+            "template": duplicate.get("template"),
+            "timer": timer,
+        }
+
+    with EXTRACTIONS_IN_FLIGHT.track(pipeline="batch"):
+        page_count, extracted_json, details = await extract_pdf(pdf_bytes, pdf["filename"], timer)
+    return {
+        "content_hash": content_hash,
+        "duplicate_of": None,
+        "page_count": page_count,
+        "extracted_json": extracted_json,
+        "timer": timer,
+        **details,
+    }
+
+
+# ---------------------------------------------------------------------
+# Persist one extracted PDF (GridFS + node_extractions + pdf_files)
+# ---------------------------------------------------------------------
+async def record_pdf(pdf: dict, zip_id, outcome: dict):
+
+    pdf_name = pdf["filename"]
+    folder_path = pdf["folder_path"]
+    page_count = outcome["page_count"]
+    extracted_json = outcome["extracted_json"]
+    duplicate = outcome["duplicate_of"]
+    timer = outcome.get("timer") or StageTimer()
+
+    if duplicate:
+        # Same bytes already stored and extracted — link to them
+        pdf_file_id = duplicate["pdf_gridfs_id"]
+        json_id = duplicate["json_id"]
+    else:
+        # Store original PDF in GridFS (streamed from the spool)
+        with timer.span("gridfs"):
+            with open_pdf_stream(pdf) as stream:
+                pdf_file_id = await save_to_gridfs(stream, pdf_name, folder_path)
+
+        # Save extracted JSON in MongoDB
+        with timer.span("mongo"):
+            json_id = await save_extraction_json(pdf_file_id, extracted_json)
+
+    # Complete the file's checkpoint record
+    timings = timer.as_dict()
+    now = datetime.utcnow()
+    await pdf_files_collection.update_one(
+        {"_id": pdf["record_id"]},
+        {"$set": {
+            "status" : "Success",
+            "pdf_gridfs_id": pdf_file_id,
+            "json_id": json_id,
+            "zip_id": zip_id,
+            "page_count": page_count,
+            "extracted_json":extracted_json,
+            "content_hash": outcome["content_hash"],
+            "pipeline_version": PIPELINE_VERSION,
+            "deduplicated": duplicate is not None,
+            "dedup_of": duplicate["_id"] if duplicate else None,
+            "routing": outcome.get("routing"),
+            "compaction": outcome.get("compaction"),
+            "fast_path": outcome.get("fast_path"),
+            "template": outcome.get("template"),
+            "timings": timings,
+            "error": None,
+            "finished_at": now,
+            "updated_at": now
+        }}
+    )
+
+    return {
+        "record_id": str(pdf["record_id"]),
+        "filename": pdf_name,
+        "folder": folder_path,
+        "pdf_file_id": str(pdf_file_id),
+        "json_id": str(json_id),
+        "page_count": page_count,
+        "route": (outcome.get("routing") or {}).get("route"),
+        "deduplicated": duplicate is not None,
+        "timings": timings
+    }
+
+
+# ---------------------------------------------------------------------
+# Store, extract and record a single PDF from a ZIP or direct upload
+# ---------------------------------------------------------------------
+async def process_pdf(pdf: dict, zip_id=None):
+    await register_pdfs([pdf], zip_id)
+    await mark_running(pdf)
+
+    try:
+        outcome = await extract_or_reuse(pdf)
+        return await record_pdf(pdf, zip_id, outcome)
+    except Exception as e:
+        await mark_failed(pdf, e)
+        raise
+
+
+# ---------------------------------------------------------------------
+# Run a batch with up to `concurrency` PDFs in flight
+# ---------------------------------------------------------------------
+async def iter_batch(pdf_files, zip_id=None, concurrency: int = BATCH_CONCURRENCY,
+                     ordered: bool = True, capture_errors: bool = False):
+    """
+    Extract PDFs concurrently and yield one result per file.
+
+    ordered=True records and yields strictly in input order, so
+    pdf_files / node_extractions are written deterministically; finished
+    results wait in a bounded window behind a slow head file.
+    ordered=False records and yields each file as soon as it finishes
+    (results carry their input `index`).
+
+    With capture_errors a failing file yields {"error": ...} instead of
+    aborting the batch.
+    """
+    concurrency = max(1, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    window = concurrency * 4
+
+    # PDF bytes are only read once a slot is free, so at most
+    # `concurrency` members are decompressed in memory at a time
+    async def run(index, pdf):
+        async with semaphore:
+            started = time.perf_counter()
+            await mark_running(pdf)
+            try:
+                return index, pdf, started, await extract_or_reuse(pdf), None
+            except Exception as e:
+                await mark_failed(pdf, e)
+                if not capture_errors:
+                    raise
+                traceback.print_exc()
+                return index, pdf, started, None, e
+
+    # Recording happens here, in the order results are yielded
+    async def finish(index, pdf, started, outcome, error):
+        if error is None:
+            try:
+                result = await record_pdf(pdf, zip_id, outcome)
+            except Exception as e:
+                await mark_failed(pdf, e)
+                if not capture_errors:
+                    raise
+                traceback.print_exc()
+                error = e
+
+        if error is not None:
+            result = {
+                "record_id": str(pdf["record_id"]),
+                "filename": pdf["filename"],
+                "folder": pdf["folder_path"],
+                "error": str(error)
+            }
+
+        result["index"] = index
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    pdf_iter = enumerate(pdf_files)
+    pending = deque()
+
+    def fill():
+        while len(pending) < window:
+            item = next(pdf_iter, None)
+            if item is None:
+                return
+            pending.append(asyncio.create_task(run(*item)))
+
+    # Every file is visible as Queued before any work starts
+    await register_pdfs(pdf_files, zip_id)
+
+    try:
+        fill()
+        while pending:
+            if ordered:
+                item = await pending[0]
+                pending.popleft()
+                yield await finish(*item)
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                for task in done:
+                    yield await finish(*task.result())
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# ---------------------------------------------------------------------
+# Spool a stored GridFS file (e.g. an uploaded ZIP) back to disk
+# ---------------------------------------------------------------------
+async def spool_gridfs_file(file_id) -> str:
+    grid_out = await fs_bucket.open_download_stream(file_id)
+
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".upload")
+    with tmp:
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            tmp.write(chunk)
+            GRIDFS_BYTES.inc(len(chunk), direction="out")
+    return tmp.name
+
+
+# ---------------------------------------------------------------------
+# Members of a ZIP that still need work (failed, unfinished or missing)
+# ---------------------------------------------------------------------
+async def plan_resume(zip_id, pdf_files: list):
+    records = await pdf_files_collection.find({"zip_id": zip_id}).to_list(length=None)
+
+    # Records created before checkpointing have no zip_member
+    by_member = {}
+    for record in records:
+        member = record.get("zip_member") or posixpath.join(
+            record.get("folder_path") or "", record["filename"]
+        )
+        if by_member.get(member, {}).get("status") != "Success":
+            by_member[member] = record
+
+    pending = []
+    in_flight = 0
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=PDF_IN_FLIGHT_STALE_SECONDS)
+    for pdf in pdf_files:
+        record = by_member.get(pdf["member"])
+
+        if record and record.get("status") == "Success":
+            continue
+
+        if record:
+            # Queued/Running and recently touched: another batch still owns it
+            updated_at = record.get("updated_at")
+            if record.get("status") in ("Queued", "Running") and updated_at and updated_at >= stale:
+                in_flight += 1
+                continue
+
+            # Claimed only if nobody touched it since we read it (concurrent resumes)
+            claimed = await pdf_files_collection.find_one_and_update(
+                {"_id": record["_id"], "status": record.get("status"), "updated_at": updated_at},
+                {"$set": {
+                    "status": "Queued",
+                    "zip_member": pdf["member"],
+                    "error": None,
+                    "updated_at": now
+                }}
+            )
+            if not claimed:
+                in_flight += 1
+                continue
+            pdf["record_id"] = record["_id"]
+
+        pending.append(pdf)
+
+    if in_flight:
+        print(f"⏳ ZIP {zip_id}: {in_flight} files still in flight elsewhere — not resumed")
+    return pending
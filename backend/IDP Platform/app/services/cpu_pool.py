@@ -0,0 +1,220 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.pdf_document import PdfDocument
+from app.services.ocr_handle import get_doctr_model
+from app.services.text_compaction import compact_pages
+from app.services.extraction_router import estimate_route, decide_route, pack_chunks
+from app.services.rule_extractor import rule_extract, FAST_PATH_ENABLED
+from app.services.layout_templates import extract_layout, TEMPLATES_ENABLED
+from app.services.timings import StageTimer
+from app.services.pipeline_builder import (
+    invoice_page_texts,
+    native_page_texts,
+    find_ocr_pages,
+    ocr_pdf_pages,
+    build_rag_pages
+)
+
+BATCH_CPU_WORKERS = int(os.getenv("BATCH_CPU_WORKERS", str(os.cpu_count() or 1)))
+
+# Scanned documents with this many OCR pages are split across workers
+OCR_PARALLEL_MIN_PAGES = int(os.getenv("OCR_PARALLEL_MIN_PAGES", "12"))
+OCR_PAGES_PER_WORKER = int(os.getenv("OCR_PAGES_PER_WORKER", "8"))
+
+_pool = None
+_pool_warm = False
+
+
+# ---------------------------------------------------------------------
+# Shared process pool for CPU-bound parsing / OCR
+# ---------------------------------------------------------------------
+def get_process_pool():
+    global _pool
+
+    if _pool is None:
+        # spawn: forking a process that already runs an event loop,
+        # Mongo client threads and torch is not safe
+        _pool = ProcessPoolExecutor(
+            max_workers=max(1, BATCH_CPU_WORKERS),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def run_cpu(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), fn, *args)
+
+
+def warm_worker():
+    # Loads DocTR inside a pool worker so the first scanned page is fast
+    get_doctr_model()
+    return os.getpid()
+
+
+def warm_process_pool():
+    """Start every pool worker and load its OCR model (blocking)."""
+    global _pool_warm
+
+    pool = get_process_pool()
+    futures = [pool.submit(warm_worker) for _ in range(max(1, BATCH_CPU_WORKERS))]
+    pids = {f.result() for f in futures}
+    _pool_warm = True
+    return len(pids)
+
+
+def process_pool_warm() -> bool:
+    return _pool_warm
+
+
+def shutdown_process_pool():
+    global _pool, _pool_warm
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_warm = False
+
+
+# ---------------------------------------------------------------------
+# CPU stage for one PDF — runs inside a pool worker
+# ---------------------------------------------------------------------
+def prepare_pdf(pdf_bytes: bytes, name: str = "document.pdf"):
+    """
+    Parse (and OCR if needed) one PDF, pick its extraction route (see
+    extraction_router.decide_route) and return everything the LLM stage
+    needs: the prompt text (direct routes), chunks (map_reduce) or pages
+    for Qdrant indexing (rag).
+
+    When at least OCR_PARALLEL_MIN_PAGES pages need OCR, the OCR is left
+    to the caller (`ocr_pending` + `page_texts`) so it can be spread over
+    several pool workers with `ocr_page_chunk`.
+
+    `timings` holds the seconds spent per stage in the worker.
+    """
+    timer = StageTimer()
+
+    with timer.span("parse"):
+        pdf = PdfDocument(pdf_bytes, name)
+
+    with pdf:
+        page_count = pdf.page_count
+
+        # Only pages classified as scanned are OCR-ed; blank pages cost nothing
+        with timer.span("parse"):
+            ocr_pages = find_ocr_pages(pdf)
+
+        with timer.span("text"):
+            page_texts = invoice_page_texts(pdf)
+
+        with timer.span("route"):
+            routing = estimate_route(page_count, page_texts, len(ocr_pages))
+
+        # Qdrant indexes the plain page text, as before
+        if routing["route"] == "rag":
+            with timer.span("text"):
+                page_texts = native_page_texts(pdf)
+
+        if len(ocr_pages) >= OCR_PARALLEL_MIN_PAGES:
+            return {
+                "page_count": page_count,
+                "routing": routing,
+                "page_texts": page_texts,
+                "ocr_pending": ocr_pages,
+                "timings": timer.stages,
+            }
+
+        with timer.span("ocr"):
+            ocr_texts = ocr_pdf_pages(pdf, ocr_pages) if ocr_pages else {}
+
+        with timer.span("compaction"):
+            docs, metadata, _ = build_rag_pages(page_texts, ocr_texts, name)
+            prepared = finish_prepared(page_count, routing, docs, metadata)
+
+        # Clean digital invoices: fill what the layout makes obvious, the
+        # LLM is then only asked for the low-confidence fields
+        if not ocr_pages and prepared["route"] in ("direct", "compacted_direct"):
+            if FAST_PATH_ENABLED:
+                with timer.span("rules"):
+                    prepared["fast_path"] = rule_extract(pdf)
+            # Fingerprint + line boxes for supplier templates
+            if TEMPLATES_ENABLED:
+                with timer.span("layout"):
+                    prepared["layout"] = extract_layout(pdf)
+
+        prepared["timings"] = timer.stages
+        return prepared
+
+
+def finish_prepared(page_count: int, routing: dict, docs, metadata):
+    compacted, compaction = compact_pages(docs)
+
+    # The route was picked on estimated OCR text; re-check with the real one
+    if routing["estimated"]:
+        previous = routing["route"]
+        routing = decide_route(
+            page_count,
+            compaction["tokens_before"],
+            compaction["tokens_after"],
+            routing["ocr_pages"]
+        )
+        if routing["route"] != previous:
+            routing["reason"] += f" (re-routed from {previous} after OCR)"
+
+    prepared = {
+        "page_count": page_count,
+        "route": routing["route"],
+        "routing": routing,
+        "compaction": compaction,
+    }
+
+    if routing["route"] == "direct":
+        prepared["text"] = "\n\n".join(docs)
+        prepared["compaction"] = {
+            "enabled": False,
+            "tokens_before": compaction["tokens_before"],
+            "tokens_after": compaction["tokens_before"],
+        }
+
+    elif routing["route"] == "compacted_direct":
+        prepared["text"] = "\n\n".join(t for t in compacted if t)
+
+    elif routing["route"] == "map_reduce":
+        prepared["chunks"] = pack_chunks(compacted)
+
+    else:
+        # Compacted pages are indexed, so retrieved context is compact too
+        kept = [i for i, text in enumerate(compacted) if text]
+        prepared["docs"] = [compacted[i] for i in kept]
+        prepared["metadata"] = [metadata[i] for i in kept]
+
+    return prepared
+
+
+def ocr_page_chunk(pdf_bytes: bytes, page_indexes: list):
+    with PdfDocument(pdf_bytes) as pdf:
+        return ocr_pdf_pages(pdf, page_indexes)
+
+
+# ---------------------------------------------------------------------
+# Run deferred OCR of one document across several pool workers
+# ---------------------------------------------------------------------
+async def complete_deferred_ocr(pdf_bytes: bytes, name: str, prepared: dict, timer: StageTimer = None):
+    timer = timer or StageTimer()
+    pages = prepared["ocr_pending"]
+    chunks = [
+        pages[i:i + OCR_PAGES_PER_WORKER]
+        for i in range(0, len(pages), OCR_PAGES_PER_WORKER)
+    ]
+
+    ocr_texts = {}
+    with timer.span("ocr"):
+        for part in await asyncio.gather(*(run_cpu(ocr_page_chunk, pdf_bytes, c) for c in chunks)):
+            ocr_texts.update(part)
+
+    with timer.span("compaction"):
+        docs, metadata, _ = build_rag_pages(prepared["page_texts"], ocr_texts, name)
+        return finish_prepared(prepared["page_count"], prepared["routing"], docs, metadata)
@@ -1,10 +1,34 @@
-from sentence_transformers import SentenceTransformer
+import threading
+
 
 class EmbeddingService:
 
     def __init__(self, model_name="BAAI/bge-small-en-v1.5"):
+        from sentence_transformers import SentenceTransformer
+
         print(f"Loading embedding model: {model_name}")
         self.model = SentenceTransformer(model_name)
 
     def embed(self, text: str):
         return self.model.encode(text).tolist()
+
+
+# Shared instance for the vector-store API, created on first use
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+# OR: EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+
+_embedding_service = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _embedding_service
+
+    with _embedding_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService(EMBEDDING_MODEL_NAME)
+        return _embedding_service
+
+
+def embedding_loaded() -> bool:
+    return _embedding_service is not None
@@ -0,0 +1,347 @@
+import os
+import asyncio
+import traceback
+from uuid import uuid4
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.core.config import (
+    db,
+    EXTRACTION_JOB_WORKERS,
+    EXTRACTION_JOB_HEARTBEAT_SECONDS,
+    EXTRACTION_JOB_STALE_SECONDS,
+    ORPHAN_SPOOL_MAX_AGE_SECONDS,
+)
+from app.services.batch_extraction import (
+    process_pdf,
+    register_pdfs,
+    mark_failed,
+    remove_spool,
+    remove_orphan_spools,
+    spool_gridfs_file,
+)
+
+jobs_collection = db["extraction_jobs"]
+
+ACTIVE_STATUSES = ["queued", "running"]
+# File entries that still need work after a restart
+UNFINISHED_FILE_STATUSES = ["queued", "running", "interrupted"]
+
+
+class ExtractionJobManager:
+    """
+    Background ZIP/PDF extraction jobs.
+
+    Each job is persisted in `extraction_jobs` (one entry per PDF under
+    `files`), and its PDFs are pushed onto a process-local queue that is
+    drained by a fixed number of worker tasks. Progress is read back from
+    Mongo, so any API worker can answer a status poll.
+
+    The queue itself dies with the process: on shutdown unfinished entries
+    are marked "interrupted", and on startup interrupted jobs and jobs whose
+    owner stopped sending heartbeats are re-queued from their spool (or the
+    stored ZIP), or failed when their input is gone.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_JOB_WORKERS):
+        self.workers = max(1, workers)
+        self.instance_id = uuid4().hex
+        self._queue = None
+        self._tasks = []
+
+    def _ensure_workers(self):
+        if self._tasks:
+            return
+
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(n))
+            for n in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def submit(self, filename: str, pdf_files: list, zip_id=None, spool_path: str = None):
+        self._ensure_workers()
+
+        # pdf_files checkpoints exist (Queued) before any worker starts
+        await register_pdfs(pdf_files, zip_id)
+
+        now = datetime.utcnow()
+        job = {
+            "status": "queued",
+            "filename": filename,
+            "zip_id": zip_id,
+            "spool_path": spool_path,
+            "owner": self.instance_id,
+            "heartbeat_at": now,
+            "total": len(pdf_files),
+            "completed": 0,
+            "failed": 0,
+            "files": [
+                {
+                    "filename": pdf["filename"],
+                    "folder": pdf["folder_path"],
+                    "member": pdf.get("member"),
+                    "record_id": pdf["record_id"],
+                    "status": "queued",
+                }
+                for pdf in pdf_files
+            ],
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        result = await jobs_collection.insert_one(job)
+        job_id = result.inserted_id
+
+        for index, pdf in enumerate(pdf_files):
+            await self._queue.put((job_id, index, zip_id, pdf))
+
+        return job_id
+
+    async def _worker(self, worker_no: int):
+        while True:
+            job_id, index, zip_id, pdf = await self._queue.get()
+            try:
+                await self._run_item(job_id, index, zip_id, pdf)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(EXTRACTION_JOB_HEARTBEAT_SECONDS)
+            try:
+                await jobs_collection.update_many(
+                    {"owner": self.instance_id, "status": {"$in": ACTIVE_STATUSES}},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception:
+                traceback.print_exc()
+
+    async def _run_item(self, job_id, index: int, zip_id, pdf: dict):
+        now = datetime.utcnow()
+
+        await jobs_collection.update_one(
+            {"_id": job_id, "started_at": None},
+            {"$set": {"status": "running", "started_at": now}}
+        )
+        await jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                f"files.{index}.status": "running",
+                f"files.{index}.started_at": now,
+            }}
+        )
+
+        try:
+            result = await process_pdf(pdf, zip_id)
+            update = {
+                "$set": {
+                    f"files.{index}.status": "success",
+                    f"files.{index}.result": result,
+                    f"files.{index}.finished_at": datetime.utcnow(),
+                },
+                "$inc": {"completed": 1},
+            }
+        except Exception as e:
+            traceback.print_exc()
+            update = {
+                "$set": {
+                    f"files.{index}.status": "failed",
+                    f"files.{index}.error": str(e),
+                    f"files.{index}.finished_at": datetime.utcnow(),
+                },
+                "$inc": {"failed": 1},
+            }
+
+        job = await jobs_collection.find_one_and_update(
+            {"_id": job_id},
+            update,
+            return_document=ReturnDocument.AFTER
+        )
+        await self._finish_if_done(job)
+
+    async def _finish_if_done(self, job: dict):
+        if job["completed"] + job["failed"] >= job["total"]:
+            await jobs_collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "status": "completed" if job["failed"] == 0 else "completed_with_errors",
+                    "finished_at": datetime.utcnow(),
+                }}
+            )
+            if job.get("spool_path"):
+                remove_spool(job["spool_path"])
+
+    async def get_job(self, job_id: str):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await jobs_collection.find_one({"_id": ObjectId(job_id)})
+
+    # -----------------------------------------------------------------
+    # Restart handling
+    # -----------------------------------------------------------------
+    async def recover(self):
+        """Re-queue (or fail) jobs left unfinished by a stopped process, then drop orphaned spools."""
+        stale = datetime.utcnow() - timedelta(seconds=EXTRACTION_JOB_STALE_SECONDS)
+        candidates = await jobs_collection.find({
+            "$or": [
+                {"status": "interrupted"},
+                {"status": {"$in": ACTIVE_STATUSES}, "heartbeat_at": {"$not": {"$gte": stale}}},
+            ]
+        }).to_list(length=None)
+
+        for job in candidates:
+            # Claim it, so only one API worker recovers each job
+            claimed = await jobs_collection.find_one_and_update(
+                {"_id": job["_id"], "owner": job.get("owner"), "status": job["status"]},
+                {"$set": {
+                    "owner": self.instance_id,
+                    "heartbeat_at": datetime.utcnow(),
+                    "status": "running" if job.get("started_at") else "queued",
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if claimed:
+                try:
+                    await self._resume_job(claimed)
+                except Exception:
+                    traceback.print_exc()
+
+        active = await jobs_collection.find(
+            {"status": {"$in": ACTIVE_STATUSES}, "spool_path": {"$ne": None}},
+            {"spool_path": 1}
+        ).to_list(length=None)
+        removed = await asyncio.to_thread(
+            remove_orphan_spools, {j["spool_path"] for j in active}, ORPHAN_SPOOL_MAX_AGE_SECONDS
+        )
+        if removed:
+            print(f"🧹 Removed {removed} orphaned spool files")
+
+    async def _resume_job(self, job: dict):
+        pending = [
+            index for index, f in enumerate(job["files"])
+            if f["status"] in UNFINISHED_FILE_STATUSES
+        ]
+        if not pending:
+            await self._finish_if_done(job)
+            return
+
+        spool_path = job.get("spool_path")
+        zip_id = job.get("zip_id")
+        if not (spool_path and os.path.exists(spool_path)) and zip_id:
+            # The stored ZIP is the source of truth; spool it back to disk
+            spool_path = await spool_gridfs_file(zip_id)
+            await jobs_collection.update_one({"_id": job["_id"]}, {"$set": {"spool_path": spool_path}})
+
+        resumable = spool_path and os.path.exists(spool_path)
+        pdfs = []
+        for index in pending:
+            f = job["files"][index]
+            pdf = {"filename": f["filename"], "folder_path": f["folder"], "path": spool_path}
+            if f.get("record_id"):
+                pdf["record_id"] = f["record_id"]
+            if f.get("member"):
+                pdf["member"] = f["member"]
+            # ZIP entries from before `member` was stored cannot be located again
+            pdfs.append((index, pdf, resumable and (f.get("member") or not zip_id)))
+
+        lost = [(index, pdf) for index, pdf, ok in pdfs if not ok]
+        if lost:
+            await self._fail_items(job, lost, "Interrupted by a restart and the upload is no longer available")
+
+        requeue = [(index, pdf) for index, pdf, ok in pdfs if ok]
+        if not requeue:
+            return
+
+        await jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {f"files.{index}.status": "queued" for index, _ in requeue}}
+        )
+        self._ensure_workers()
+        for index, pdf in requeue:
+            await self._queue.put((job["_id"], index, zip_id, pdf))
+        print(f"🔁 Job {job['_id']}: re-queued {len(requeue)} unfinished files")
+
+    async def _fail_items(self, job: dict, items: list, reason: str):
+        now = datetime.utcnow()
+        update = {f"files.{index}.status": "failed" for index, _ in items}
+        update.update({f"files.{index}.error": reason for index, _ in items})
+        update.update({f"files.{index}.finished_at": now for index, _ in items})
+
+        job = await jobs_collection.find_one_and_update(
+            {"_id": job["_id"]},
+            {"$set": update, "$inc": {"failed": len(items)}},
+            return_document=ReturnDocument.AFTER
+        )
+        for _, pdf in items:
+            if pdf.get("record_id"):
+                await mark_failed(pdf, RuntimeError(reason))
+        await self._finish_if_done(job)
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        # Unfinished entries are picked up again by recover() on the next start
+        try:
+            await jobs_collection.update_many(
+                {"owner": self.instance_id, "status": {"$in": ACTIVE_STATUSES}},
+                {"$set": {
+                    "status": "interrupted",
+                    "interrupted_at": datetime.utcnow(),
+                    "files.$[f].status": "interrupted",
+                }},
+                array_filters=[{"f.status": {"$in": ACTIVE_STATUSES}}]
+            )
+        except Exception:
+            traceback.print_exc()
+
+
+# ---------------------------------------------------------------------
+# Progress summary with ETA for a job document
+# ---------------------------------------------------------------------
+def job_progress(job: dict):
+    total = job["total"]
+    done = job["completed"] + job["failed"]
+
+    eta_seconds = None
+    if job.get("started_at") and not job.get("finished_at") and done:
+        elapsed = (datetime.utcnow() - job["started_at"]).total_seconds()
+        eta_seconds = round(elapsed / done * (total - done), 1)
+    elif job.get("finished_at"):
+        eta_seconds = 0
+
+    files = []
+    for f in job["files"]:
+        duration = None
+        if f.get("started_at") and f.get("finished_at"):
+            duration = round((f["finished_at"] - f["started_at"]).total_seconds(), 2)
+
+        files.append({
+            "filename": f["filename"],
+            "folder": f["folder"],
+            "status": f["status"],
+            "error": f.get("error"),
+            "duration_seconds": duration,
+        })
+
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "zip_id": str(job["zip_id"]) if job.get("zip_id") else None,
+        "total": total,
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "progress": round(done / total * 100, 1) if total else 100.0,
+        "eta_seconds": eta_seconds,
+        "files": files,
+    }
+
+
+job_manager = ExtractionJobManager()
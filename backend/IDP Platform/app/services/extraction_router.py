@@ -0,0 +1,164 @@
+import os
+import json
+import math
+
+from app.services.pipeline_builder import EXTRACTION_MODEL, SYSTEM_PROMPT
+from app.services.text_compaction import compact_pages, estimate_tokens
+
+# ---------------------------------------------------------------------
+# Model limits and budgets (all overridable from the environment)
+# ---------------------------------------------------------------------
+# Context window per model, e.g. '{"amazon/nova-2-lite-v1:free": 300000}'
+MODEL_CONTEXT_LIMITS = json.loads(os.getenv("MODEL_CONTEXT_LIMITS", "{}"))
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("ROUTER_DEFAULT_CONTEXT_TOKENS", "32000"))
+# Kept free for the completion (large invoices have long line_items)
+OUTPUT_RESERVE_TOKENS = int(os.getenv("ROUTER_OUTPUT_RESERVE_TOKENS", "4000"))
+
+# Below this the raw text is sent as-is, compaction is not worth the risk
+DIRECT_MAX_TOKENS = int(os.getenv("ROUTER_DIRECT_MAX_TOKENS", "3000"))
+# Above this a single prompt gets slow/unreliable even if it fits
+MAX_PROMPT_TOKENS = int(os.getenv("ROUTER_MAX_PROMPT_TOKENS", "24000"))
+
+LATENCY_BUDGET_SECONDS = float(os.getenv("ROUTER_LATENCY_BUDGET_SECONDS", "90"))
+
+# Latency model used to compare routes
+LLM_BASE_SECONDS = float(os.getenv("ROUTER_LLM_BASE_SECONDS", "3"))
+LLM_SECONDS_PER_1K_TOKENS = float(os.getenv("ROUTER_LLM_SECONDS_PER_1K_TOKENS", "0.6"))
+OCR_SECONDS_PER_PAGE = float(os.getenv("ROUTER_OCR_SECONDS_PER_PAGE", "1.5"))
+EMBED_SECONDS_PER_PAGE = float(os.getenv("ROUTER_EMBED_SECONDS_PER_PAGE", "0.15"))
+# Text an OCR page is expected to yield before it has been OCR-ed
+OCR_TOKENS_PER_PAGE = int(os.getenv("ROUTER_OCR_TOKENS_PER_PAGE", "600"))
+
+# Map-reduce: chunk size, max chunks and how many run at once
+MAP_CHUNK_TOKENS = int(os.getenv("ROUTER_MAP_CHUNK_TOKENS", "8000"))
+MAP_MAX_CHUNKS = int(os.getenv("ROUTER_MAP_MAX_CHUNKS", "8"))
+MAP_CONCURRENCY = int(os.getenv("ROUTER_MAP_CONCURRENCY", "4"))
+
+# RAG sends the top_k retrieved pages
+RAG_TOP_K = 7
+
+ROUTES = ("direct", "compacted_direct", "rag", "map_reduce")
+
+
+def prompt_budget(model: str = EXTRACTION_MODEL) -> int:
+    context = MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_TOKENS)
+    budget = context - OUTPUT_RESERVE_TOKENS - estimate_tokens(SYSTEM_PROMPT)
+    return max(1000, min(budget, MAX_PROMPT_TOKENS))
+
+
+def llm_seconds(tokens: int) -> float:
+    return LLM_BASE_SECONDS + tokens / 1000 * LLM_SECONDS_PER_1K_TOKENS
+
+
+# ---------------------------------------------------------------------
+# Route decision from token counts
+# ---------------------------------------------------------------------
+def decide_route(page_count: int, raw_tokens: int, compacted_tokens: int,
+                 ocr_pages: int = 0, estimated: bool = False):
+    """
+    Pick the cheapest route that fits the context window and latency budget:
+
+    - direct:           raw text is small, send it untouched
+    - compacted_direct: compacted text fits one prompt within budget
+    - map_reduce:       too big for one prompt, split into chunks extracted
+                        concurrently and merged (keeps every page)
+    - rag:              too big/slow even for map-reduce, index the pages
+                        and send only the top-k retrieved ones
+    """
+    budget = prompt_budget()
+    ocr_s = ocr_pages * OCR_SECONDS_PER_PAGE
+
+    decision = {
+        "page_count": page_count,
+        "ocr_pages": ocr_pages,
+        "raw_tokens": raw_tokens,
+        "compacted_tokens": compacted_tokens,
+        "prompt_budget": budget,
+        "latency_budget_seconds": LATENCY_BUDGET_SECONDS,
+        "estimated": estimated,
+        "model": EXTRACTION_MODEL,
+    }
+
+    def pick(route, seconds, reason):
+        decision.update(route=route, estimated_seconds=round(seconds, 1), reason=reason)
+        return decision
+
+    direct_s = ocr_s + llm_seconds(raw_tokens)
+    if raw_tokens <= min(DIRECT_MAX_TOKENS, budget) and direct_s <= LATENCY_BUDGET_SECONDS:
+        return pick("direct", direct_s,
+                    f"~{raw_tokens} tokens ≤ direct limit {DIRECT_MAX_TOKENS}")
+
+    compacted_s = ocr_s + llm_seconds(compacted_tokens)
+    if compacted_tokens <= budget and compacted_s <= LATENCY_BUDGET_SECONDS:
+        return pick("compacted_direct", compacted_s,
+                    f"~{compacted_tokens} compacted tokens fit prompt budget {budget}")
+
+    chunk_tokens = min(MAP_CHUNK_TOKENS, budget)
+    chunks = max(1, math.ceil(compacted_tokens / chunk_tokens))
+    map_s = ocr_s + math.ceil(chunks / max(1, MAP_CONCURRENCY)) * llm_seconds(chunk_tokens)
+
+    if chunks <= MAP_MAX_CHUNKS and map_s <= LATENCY_BUDGET_SECONDS:
+        return pick("map_reduce", map_s,
+                    f"~{compacted_tokens} tokens exceed one prompt "
+                    f"({budget} budget, {compacted_s:.0f}s est.); {chunks} chunks of ≤{chunk_tokens}")
+
+    rag_tokens = min(compacted_tokens, math.ceil(compacted_tokens / max(1, page_count) * RAG_TOP_K))
+    rag_s = ocr_s + page_count * EMBED_SECONDS_PER_PAGE + llm_seconds(rag_tokens)
+    return pick("rag", rag_s,
+                f"~{compacted_tokens} tokens would need {chunks} map-reduce chunks "
+                f"({map_s:.0f}s est.); retrieving top {RAG_TOP_K} pages instead")
+
+
+def estimate_route(page_count: int, page_texts: list, ocr_pages: int = 0):
+    """Route a document before OCR, counting each OCR page as OCR_TOKENS_PER_PAGE."""
+    compacted, _ = compact_pages(page_texts)
+    ocr_tokens = ocr_pages * OCR_TOKENS_PER_PAGE
+
+    return decide_route(
+        page_count,
+        sum(estimate_tokens(t) for t in page_texts) + ocr_tokens,
+        sum(estimate_tokens(t) for t in compacted) + ocr_tokens,
+        ocr_pages,
+        estimated=ocr_pages > 0,
+    )
+
+
+# ---------------------------------------------------------------------
+# Split compacted pages into map-reduce chunks
+# ---------------------------------------------------------------------
+def pack_chunks(pages: list, max_tokens: int = None) -> list:
+    """Pages packed in order into chunks of ≤ max_tokens (oversized pages split by line)."""
+    max_tokens = max_tokens or min(MAP_CHUNK_TOKENS, prompt_budget())
+
+    chunks, current, used = [], [], 0
+
+    def flush():
+        nonlocal current, used
+        if current:
+            chunks.append("\n\n".join(current))
+        current, used = [], 0
+
+    for page in pages:
+        if not page:
+            continue
+
+        pieces = [page]
+        if estimate_tokens(page) > max_tokens:
+            pieces, part = [], []
+            for line in page.splitlines():
+                if part and estimate_tokens("\n".join(part + [line])) > max_tokens:
+                    pieces.append("\n".join(part))
+                    part = []
+                part.append(line)
+            if part:
+                pieces.append("\n".join(part))
+
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and used + tokens > max_tokens:
+                flush()
+            current.append(piece)
+            used += tokens
+
+    flush()
+    return chunks
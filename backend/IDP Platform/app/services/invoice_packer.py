@@ -0,0 +1,181 @@
+import os
+import json
+import asyncio
+import traceback
+
+from app.services.llm_cache import llm_cache
+from app.services.text_compaction import estimate_tokens
+from app.services.pipeline_builder import (
+    SYSTEM_PROMPT,
+    invoice_payload,
+    payload_cache_key,
+    complete_json,
+    clean_llm_json,
+    extract_invoice_from_text
+)
+
+PACKING_ENABLED = os.getenv("PACKING_ENABLED", "false").lower() == "true"
+PACK_MAX_DOCS = int(os.getenv("PACK_MAX_DOCS", "5"))
+# Only documents up to this size are packed; the whole request stays under PACK_MAX_TOKENS
+PACK_DOC_MAX_TOKENS = int(os.getenv("PACK_DOC_MAX_TOKENS", "1500"))
+PACK_MAX_TOKENS = int(os.getenv("PACK_MAX_TOKENS", "6000"))
+# How long the first document waits for others to share its request
+PACK_WINDOW_SECONDS = float(os.getenv("PACK_WINDOW_MS", "150")) / 1000
+
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+You will receive SEVERAL independent invoices. Each one starts with a line
+<<<DOCUMENT id>>> and ends with a line <<<END id>>>.
+Extract every document separately and return STRICT JSON only, in this form:
+{
+  "documents": [
+    {"id": "<id>", "invoice": { ...expected JSON format above... }}
+  ]
+}
+Return exactly one entry per id. Never mix data between documents.
+"""
+
+
+def pack_documents(texts: dict) -> str:
+    return "\n\n".join(
+        f"<<<DOCUMENT {doc_id}>>>\n{text}\n<<<END {doc_id}>>>"
+        for doc_id, text in texts.items()
+    )
+
+
+def split_packed_response(parsed, doc_ids) -> dict:
+    """{id: invoice} for every well-formed entry of a packed response."""
+    entries = parsed.get("documents") if isinstance(parsed, dict) else None
+    if not isinstance(entries, list):
+        return {}
+
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        doc_id = str(entry.get("id"))
+        if doc_id in doc_ids and isinstance(entry.get("invoice"), dict):
+            results.setdefault(doc_id, entry["invoice"])
+    return results
+
+
+class InvoicePacker:
+    """
+    Micro-batcher in front of extract_invoice_from_text.
+
+    Small documents extracted concurrently (e.g. by iter_batch) are held
+    for up to PACK_WINDOW_SECONDS and sent together as one request with
+    delimited documents and a keyed JSON response. Each caller gets only
+    its own invoice back. Documents missing from (or malformed in) the
+    packed response — or the whole group if it does not parse — fall back
+    to single-document calls.
+    """
+
+    def __init__(self, enabled: bool = PACKING_ENABLED, max_docs: int = PACK_MAX_DOCS,
+                 max_tokens: int = PACK_MAX_TOKENS, window_seconds: float = PACK_WINDOW_SECONDS):
+        self.enabled = enabled
+        self.max_docs = max(1, max_docs)
+        self.max_tokens = max_tokens
+        self.window_seconds = window_seconds
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+        self._tasks = set()
+        self.requests = 0
+        self.packed_documents = 0
+        self.fallbacks = 0
+
+    async def extract(self, invoice_text: str):
+        tokens = estimate_tokens(invoice_text)
+        if not self.enabled or tokens > PACK_DOC_MAX_TOKENS:
+            return await extract_invoice_from_text(invoice_text)
+
+        # Already extracted on its own before — no need to pack it
+        cached = await llm_cache.aget(payload_cache_key(invoice_payload(invoice_text)))
+        if cached is not None:
+            return json.loads(clean_llm_json(cached))
+
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((invoice_text, future))
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_docs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        group, self._pending, self._pending_tokens = self._pending, [], 0
+        if group:
+            task = asyncio.create_task(self._run_group(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_group(self, group):
+        try:
+            if len(group) == 1:
+                text, future = group[0]
+                results = {"1": await extract_invoice_from_text(text)}
+            else:
+                results = await self._extract_packed(group)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # A failed fallback call only fails its own document
+        for doc_id, (text, future) in enumerate(group, start=1):
+            if future.done():
+                continue
+            result = results[str(doc_id)]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _extract_packed(self, group):
+        texts = {str(doc_id): text for doc_id, (text, _) in enumerate(group, start=1)}
+
+        payload = invoice_payload(pack_documents(texts), PACKED_SYSTEM_PROMPT)
+        self.requests += 1
+
+        try:
+            results = split_packed_response(await complete_json(payload, ["documents"]), set(texts))
+        except Exception:
+            traceback.print_exc()
+            results = {}
+
+        self.packed_documents += len(results)
+
+        missing = [doc_id for doc_id in texts if doc_id not in results]
+        if missing:
+            print(f"📦 Packed response missing {len(missing)}/{len(texts)} documents — "
+                  f"falling back to single calls")
+            self.fallbacks += len(missing)
+            singles = await asyncio.gather(
+                *(extract_invoice_from_text(texts[d]) for d in missing), return_exceptions=True
+            )
+            results.update(zip(missing, singles))
+
+        return results
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "max_docs": self.max_docs,
+            "packed_requests": self.requests,
+            "packed_documents": self.packed_documents,
+            "fallback_documents": self.fallbacks,
+        }
+
+
+invoice_packer = InvoicePacker()
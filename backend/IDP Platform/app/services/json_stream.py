@@ -0,0 +1,189 @@
+import os
+import json
+
+STREAM_MAX_CHARS = int(os.getenv("LLM_STREAM_MAX_CHARS", "40000"))
+# Chat before the opening "{" (e.g. "Here is the JSON:" or a ```json fence)
+STREAM_MAX_PREFIX_CHARS = int(os.getenv("LLM_STREAM_MAX_PREFIX_CHARS", "200"))
+STREAM_MAX_UNKNOWN_KEYS = int(os.getenv("LLM_STREAM_MAX_UNKNOWN_KEYS", "3"))
+STREAM_MAX_DEPTH = 20
+
+WHITESPACE = " \t\r\n"
+
+
+class JSONStreamAbort(ValueError):
+    """Raised as soon as a streamed completion is clearly not the JSON we asked for."""
+
+
+class IncrementalJSONParser:
+    """
+    Parses a streamed JSON object one chunk at a time.
+
+    `feed()` returns the top-level (key, value) pairs completed by that
+    chunk, so fields can be shown as they arrive. Output is aborted early
+    (JSONStreamAbort) when it cannot become a valid object, repeats a key,
+    keeps producing keys outside the schema, nests too deep or grows past
+    `max_chars`. Anything after the closing "}" (e.g. a fence) is ignored.
+    """
+
+    def __init__(self, schema_keys=None, max_chars: int = STREAM_MAX_CHARS,
+                 max_prefix_chars: int = STREAM_MAX_PREFIX_CHARS,
+                 max_unknown_keys: int = STREAM_MAX_UNKNOWN_KEYS):
+        self.schema_keys = set(schema_keys) if schema_keys else None
+        self.max_chars = max_chars
+        self.max_prefix_chars = max_prefix_chars
+        self.max_unknown_keys = max_unknown_keys
+
+        self.text = ""
+        self.fields = {}
+        self.unknown_keys = 0
+
+        self._pos = 0
+        self._phase = "prefix"
+        self._start = None
+        self._key = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._scalar = False
+
+    @property
+    def done(self) -> bool:
+        return self._phase == "done"
+
+    def _abort(self, reason: str):
+        raise JSONStreamAbort(f"{reason} (after {len(self.text)} chars)")
+
+    def feed(self, chunk: str) -> list:
+        if self.done or not chunk:
+            return []
+
+        self.text += chunk
+        if len(self.text) > self.max_chars:
+            self._abort(f"response exceeds {self.max_chars} chars")
+
+        completed = []
+        while self._pos < len(self.text) and not self.done:
+            field = self._step(self.text[self._pos])
+            if field:
+                completed.append(field)
+
+        return completed
+
+    def _step(self, ch: str):
+        i = self._pos
+        self._pos += 1
+        phase = self._phase
+
+        # Inside a string (key or value): only watch for the closing quote
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if phase == "key":
+                    return self._finish_key(i + 1)
+                if phase == "value" and self._depth == 0:
+                    return self._finish_value(i + 1)
+            return None
+
+        if phase == "prefix":
+            if ch == "{":
+                self._phase = "key_or_end"
+            elif i >= self.max_prefix_chars:
+                self._abort("no JSON object at the start of the response")
+            return None
+
+        if phase == "value":
+            if self._scalar:
+                if ch in ",}" or ch in WHITESPACE:
+                    self._pos -= 1
+                    return self._finish_value(i)
+                return None
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth > STREAM_MAX_DEPTH:
+                    self._abort("nesting too deep")
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    return self._finish_value(i + 1)
+            return None
+
+        if ch in WHITESPACE:
+            return None
+
+        if phase == "key_or_end":
+            if ch == '"':
+                self._phase, self._start, self._in_string = "key", i, True
+            elif ch == "}" and not self.fields:
+                self._phase = "done"
+            else:
+                self._abort(f"expected a key, got {ch!r}")
+
+        elif phase == "colon":
+            if ch != ":":
+                self._abort(f"expected ':', got {ch!r}")
+            self._phase = "value_start"
+
+        elif phase == "value_start":
+            self._phase, self._start = "value", i
+            self._depth, self._scalar = 0, False
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth = 1
+            elif ch in "-0123456789tfn":
+                self._scalar = True
+            else:
+                self._abort(f"invalid value start {ch!r}")
+
+        elif phase == "comma_or_end":
+            if ch == ",":
+                self._phase = "next_key"
+            elif ch == "}":
+                self._phase = "done"
+            else:
+                self._abort(f"expected ',' or '}}', got {ch!r}")
+
+        elif phase == "next_key":
+            if ch != '"':
+                self._abort(f"expected a key, got {ch!r}")
+            self._phase, self._start, self._in_string = "key", i, True
+
+        return None
+
+    def _finish_key(self, end: int):
+        key = json.loads(self.text[self._start:end])
+
+        if key in self.fields:
+            self._abort(f"key {key!r} repeated")
+
+        if self.schema_keys is not None and key not in self.schema_keys:
+            self.unknown_keys += 1
+            if self.unknown_keys > self.max_unknown_keys:
+                self._abort(f"{self.unknown_keys} keys outside the schema")
+
+        self._key = key
+        self._phase = "colon"
+        return None
+
+    def _finish_value(self, end: int):
+        raw = self.text[self._start:end]
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self._abort(f"invalid value for {self._key!r}")
+
+        self.fields[self._key] = value
+        self._phase = "comma_or_end"
+        return self._key, value
+
+    def result(self) -> dict:
+        if not self.done:
+            self._abort("response ended before the JSON object was closed")
+        return dict(self.fields)
@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import hashlib
+
+from app.services.pdf_document import PdfDocument
+from app.services.pipeline_builder import INVOICE_FIELDS
+from app.services.rule_extractor import (
+    FAST_PATH_MIN_CONFIDENCE,
+    LABEL_RES,
+    CUSTOMER_RE,
+    SUPPLIER_RE,
+    parse_value,
+    close,
+)
+
+TEMPLATES_ENABLED = os.getenv("LAYOUT_TEMPLATES_ENABLED", "true").lower() == "true"
+# Bump when fingerprints, stored regions or how they are applied change;
+# it is part of the fingerprint, so templates learned before are not reused
+TEMPLATE_SCHEMA_VERSION = 1
+# LLM-verified extractions of one layout needed before its regions are trusted
+TEMPLATE_MIN_SAMPLES = int(os.getenv("LAYOUT_TEMPLATE_MIN_SAMPLES", "3"))
+TEMPLATE_MAX_SAMPLES = int(os.getenv("LAYOUT_TEMPLATE_MAX_SAMPLES", "10"))
+# Confidence given to a value read from a learned region
+TEMPLATE_FIELD_CONFIDENCE = float(os.getenv("LAYOUT_TEMPLATE_FIELD_CONFIDENCE", "0.95"))
+
+# Fingerprint: label positions in the header part of the first page
+# (totals and everything below move with the number of line items)
+FINGERPRINT_GRID = 40
+FINGERPRINT_TOP_SHARE = 0.5
+FINGERPRINT_SKIP_LABELS = {"subtotal", "tax_amount", "total_amount"}
+FINGERPRINT_MIN_LABELS = 3
+
+# Share of the page a field may move between samples and still be "the same region"
+REGION_TOLERANCE = 0.015
+
+# Single-line fields that can be learned as regions (addresses span
+# several lines and line items move; those stay with the rules / LLM)
+TEMPLATE_FIELDS = (
+    "invoice_number", "invoice_date", "due_date", "purchase_order_number",
+    "payment_terms", "subtotal", "tax_amount", "total_amount",
+    "supplier.name", "supplier.tax_id", "customer.name", "customer.tax_id",
+)
+REQUIRED_FIELDS = ("invoice_number", "total_amount", "supplier.name")
+
+PARTY_KEYS = ("name", "address", "tax_id")
+
+
+# ---------------------------------------------------------------------
+# First-page lines with page-normalised boxes — runs in a pool worker
+# ---------------------------------------------------------------------
+def layout_lines(pdf: PdfDocument):
+    text_pages = pdf.pages_with_action("text")
+    if not text_pages:
+        return []
+
+    index = text_pages[0]
+    rect = pdf.page(index).rect
+    width, height = rect.width or 1, rect.height or 1
+
+    lines = []
+    for block in pdf.page_dict(index)["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            text = re.sub(r"\s+", " ", " ".join(span["text"] for span in line["spans"])).strip()
+            if not text:
+                continue
+            x0, y0, x1, y1 = line["bbox"]
+            lines.append({
+                "text": text,
+                "bbox": [round(x0 / width, 4), round(y0 / height, 4),
+                         round(x1 / width, 4), round(y1 / height, 4)],
+            })
+
+    lines.sort(key=lambda l: (l["bbox"][1], l["bbox"][0]))
+    return lines
+
+
+def label_kind(text: str):
+    for field, label_re in LABEL_RES.items():
+        if label_re.match(text):
+            return field
+    if CUSTOMER_RE.match(text):
+        return "customer"
+    if SUPPLIER_RE.match(text):
+        return "supplier"
+    return None
+
+
+def layout_fingerprint(lines: list):
+    """
+    Hash of which labels sit where in the header, on a coarse grid.
+    Values, names and line items do not enter it, so every invoice a
+    supplier renders from the same layout gets the same fingerprint.
+    """
+    cells = set()
+    for line in lines:
+        x0, y0 = line["bbox"][:2]
+        kind = label_kind(line["text"])
+        if kind and kind not in FINGERPRINT_SKIP_LABELS and y0 <= FINGERPRINT_TOP_SHARE:
+            cells.add((kind, round(x0 * FINGERPRINT_GRID), round(y0 * FINGERPRINT_GRID)))
+
+    if len(cells) < FINGERPRINT_MIN_LABELS:
+        return None
+
+    raw = json.dumps([TEMPLATE_SCHEMA_VERSION, sorted(cells)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def extract_layout(pdf: PdfDocument):
+    """{"fingerprint", "lines"} for documents with enough labels, else None."""
+    lines = layout_lines(pdf)
+    fingerprint = layout_fingerprint(lines)
+    if fingerprint is None:
+        return None
+    return {"fingerprint": fingerprint, "lines": lines}
+
+
+# ---------------------------------------------------------------------
+# Field paths ("supplier.name") on invoice dicts
+# ---------------------------------------------------------------------
+def get_path(invoice: dict, path: str):
+    value = invoice
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def value_field(path: str) -> str:
+    # rule_extractor.parse_value field for a template path
+    return "tax_id" if path.endswith(".tax_id") else path
+
+
+def normalise(text) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip(" .,:;").casefold()
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return parse_value("total_amount", value)
+    return None
+
+
+def same_value(path: str, found, expected) -> bool:
+    if found is None or expected is None:
+        return False
+    if path in ("subtotal", "tax_amount", "total_amount"):
+        return close(to_number(found), to_number(expected))
+    return normalise(found) == normalise(expected)
+
+
+# ---------------------------------------------------------------------
+# Validation shared by learning (is this LLM result trustworthy?) and
+# lookup (does this document really follow the template?)
+# ---------------------------------------------------------------------
+def amount_errors(invoice: dict) -> list:
+    subtotal, tax, total = (
+        to_number(invoice.get(f)) for f in ("subtotal", "tax_amount", "total_amount")
+    )
+    errors = []
+
+    if subtotal is not None and total is not None and not close(subtotal + (tax or 0), total):
+        errors.append("subtotal + tax_amount != total_amount")
+
+    items = invoice.get("line_items") or []
+    line_totals = [to_number(i.get("line_total")) for i in items if isinstance(i, dict)]
+    base = subtotal if subtotal is not None else total
+    if line_totals and None not in line_totals and base is not None and not close(sum(line_totals), base):
+        errors.append("line items do not add up")
+
+    return errors
+
+
+def verify_invoice(invoice: dict) -> list:
+    missing = [f"{path} missing" for path in REQUIRED_FIELDS if get_path(invoice, path) in (None, "")]
+    return missing + amount_errors(invoice)
+
+
+# ---------------------------------------------------------------------
+# Learning: where each field of a verified extraction sits on the page
+# ---------------------------------------------------------------------
+def locate_value(lines: list, path: str, value):
+    """{"bbox", "label"} of the one line holding `value` (label = text before it)."""
+    field = value_field(path)
+    matches = []
+
+    for line in lines:
+        tokens = line["text"].split()
+        # Shortest matching suffix, so everything before it counts as the label
+        for k in reversed(range(len(tokens))):
+            if same_value(path, parse_value(field, " ".join(tokens[k:])), value):
+                matches.append({"bbox": line["bbox"], "label": normalise(" ".join(tokens[:k]))})
+                break
+
+    # Amounts repeat (line totals, subtotal = total): prefer a labelled line
+    labelled = [m for m in matches if m["label"]]
+    if len(labelled) == 1:
+        return labelled[0]
+    if len(matches) == 1:
+        return matches[0]
+    return None
+
+
+def template_sample(lines: list, invoice: dict, paths=None):
+    """
+    Regions of every template field of a verified extraction: a region,
+    None for a field the invoice does not have, left out when the value
+    could not be found unambiguously or is not in `paths` (when given).
+    None if the extraction fails verify_invoice.
+    """
+    if verify_invoice(invoice):
+        return None
+
+    sample = {}
+    for path in TEMPLATE_FIELDS:
+        if paths is not None and path not in paths and path.split(".")[0] not in paths:
+            continue
+        value = get_path(invoice, path)
+        if value in (None, ""):
+            sample[path] = None
+            continue
+        region = locate_value(lines, path, value)
+        if region is not None:
+            sample[path] = region
+
+    return sample
+
+
+def same_region(a: dict, b: dict) -> bool:
+    return a["label"] == b["label"] and all(
+        abs(p - q) <= REGION_TOLERANCE for p, q in zip(a["bbox"][:2], b["bbox"][:2])
+    )
+
+
+def learn_regions(samples: list) -> dict:
+    """
+    Fields found in the same place (or absent) in the last
+    TEMPLATE_MIN_SAMPLES samples. Region boxes are the union of the
+    sample boxes, widened by REGION_TOLERANCE.
+    """
+    regions = {}
+
+    for path in TEMPLATE_FIELDS:
+        seen = [s[path] for s in samples if path in s][-TEMPLATE_MIN_SAMPLES:]
+        if len(seen) < TEMPLATE_MIN_SAMPLES:
+            continue
+
+        if all(r is None for r in seen):
+            regions[path] = {"absent": True}
+        elif None not in seen and all(same_region(seen[0], r) for r in seen[1:]):
+            boxes = [r["bbox"] for r in seen]
+            regions[path] = {
+                "bbox": [
+                    round(min(b[0] for b in boxes) - REGION_TOLERANCE, 4),
+                    round(min(b[1] for b in boxes) - REGION_TOLERANCE, 4),
+                    round(max(b[2] for b in boxes) + REGION_TOLERANCE, 4),
+                    round(max(b[3] for b in boxes) + REGION_TOLERANCE, 4),
+                ],
+                "label": seen[0]["label"],
+            }
+
+    return regions
+
+
+def template_ready(samples: list, regions: dict) -> bool:
+    return len(samples) >= TEMPLATE_MIN_SAMPLES and any("bbox" in r for r in regions.values())
+
+
+# ---------------------------------------------------------------------
+# Lookup: read the learned regions of a matching document
+# ---------------------------------------------------------------------
+def read_region(lines: list, path: str, region: dict):
+    x0, y0, x1, y1 = region["bbox"]
+    label_tokens = len(region["label"].split())
+
+    for line in lines:
+        lx0, ly0, lx1, ly1 = line["bbox"]
+        cx, cy = (lx0 + lx1) / 2, (ly0 + ly1) / 2
+        if not (x0 <= cx <= x1 and y0 <= cy <= y1):
+            continue
+
+        tokens = line["text"].split()
+        if normalise(" ".join(tokens[:label_tokens])) != region["label"]:
+            continue
+
+        value = parse_value(value_field(path), " ".join(tokens[label_tokens:]))
+        if value is not None:
+            return value
+
+    return None
+
+
+def empty_invoice():
+    invoice = {
+        field: {key: None for key in PARTY_KEYS} if field in ("supplier", "customer") else None
+        for field in INVOICE_FIELDS
+    }
+    confidence = {}
+    for field in INVOICE_FIELDS:
+        if field in ("supplier", "customer"):
+            confidence.update({f"{field}.{key}": 0.0 for key in PARTY_KEYS})
+        else:
+            confidence[field] = 0.0
+    return invoice, confidence
+
+
+def apply_template(template: dict, lines: list, fast: dict = None):
+    """
+    Template regions on top of the rule-based result (`fast`, may be
+    None). Returns a fast-path style {"invoice", "confidence"} plus
+    "fields" (read from regions) and "errors": a learned region without
+    a readable value or inconsistent amounts mean the document does not
+    follow the template.
+    """
+    if fast:
+        invoice = {k: dict(v) if isinstance(v, dict) else v for k, v in fast["invoice"].items()}
+        confidence = dict(fast["confidence"])
+    else:
+        invoice, confidence = empty_invoice()
+
+    def put(path, value):
+        if "." in path:
+            parent, key = path.split(".")
+            invoice[parent] = dict(invoice.get(parent) or {})
+            invoice[parent][key] = value
+        else:
+            invoice[path] = value
+        confidence[path] = TEMPLATE_FIELD_CONFIDENCE
+
+    read, errors = [], []
+    for path, region in template.get("regions", {}).items():
+        if region.get("absent"):
+            # Absent in every sample; a value the rules are sure of still wins
+            if confidence.get(path, 0.0) < FAST_PATH_MIN_CONFIDENCE:
+                put(path, None)
+            continue
+
+        value = read_region(lines, path, region)
+        if value is None:
+            errors.append(f"no {path} in its region")
+        else:
+            put(path, value)
+            read.append(path)
+
+    errors += amount_errors(invoice)
+    return {"invoice": invoice, "confidence": confidence, "fields": read, "errors": errors}
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+
+from app.services.telemetry import record_cache_lookup
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+# Seconds to wait on another writer's lock before treating the call as a miss
+LLM_CACHE_BUSY_TIMEOUT = float(os.getenv("LLM_CACHE_BUSY_TIMEOUT", "2"))
+# TTL / LRU eviction runs once per this many writes, not on every set
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM completions.
+
+    Keys are a hash of (model, temperature, messages, extra request
+    options), values are the raw completion text. Entries expire after
+    `ttl_seconds`; once `max_entries` is exceeded the least recently used
+    rows are evicted (checked every `evict_every` writes, so the table
+    may briefly hold up to that many extra rows). SQLite keeps it usable from the blocking pipeline
+    threads and the async playground path alike, and shared between
+    uvicorn workers on one host. Async code uses aget/aset, which run in a
+    thread so a locked database never stalls the event loop; a lock held
+    longer than LLM_CACHE_BUSY_TIMEOUT counts as a miss / skipped write.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED,
+                 evict_every: int = LLM_CACHE_EVICT_EVERY):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.evict_every = max(1, evict_every)
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=LLM_CACHE_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)"
+            )
+            conn.commit()
+            # Kept only once the schema exists; a locked setup is retried next call
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, temperature, messages: list, **options) -> str:
+        raw = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "messages": messages,
+                "options": options,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        try:
+            return self._get(key)
+        except sqlite3.OperationalError as e:
+            # Locked by another writer for too long — a miss is cheaper than waiting
+            print(f"⚠️ LLM cache read skipped: {e}")
+            self._rollback()
+            self.misses += 1
+            record_cache_lookup("llm", False)
+            return None
+
+    def _get(self, key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT content, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                record_cache_lookup("llm", False)
+                return None
+
+            content, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                record_cache_lookup("llm", False)
+                return None
+
+            conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            record_cache_lookup("llm", True)
+            return content
+
+    def set(self, key: str, content: str, model: str = None):
+        if not self.enabled:
+            return
+
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, model, content, created_at, last_used_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model, content, now, now),
+                )
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(conn, now)
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ LLM cache write skipped: {e}")
+            self._rollback()
+
+    def _rollback(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.rollback()
+
+    # Event-loop callers: SQLite calls (and lock waits) run in a thread
+    async def aget(self, key: str):
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, content: str, model: str = None):
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.set, key, content, model)
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_used_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self):
+        """Blocking (COUNT(*) under the lock); async callers use a thread."""
+        entries = 0
+        if self.enabled:
+            try:
+                with self._lock:
+                    (entries,) = self._connection().execute(
+                        "SELECT COUNT(*) FROM llm_cache"
+                    ).fetchone()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ LLM cache count skipped: {e}")
+                self._rollback()
+                entries = None
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,203 @@
+import os
+import json
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import aclosing
+
+from app.services.openrouter_client import openrouter
+from app.services.json_stream import IncrementalJSONParser, JSONStreamAbort
+
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+
+# Secondary model per primary, e.g. '{"amazon/nova-2-lite-v1:free": "z-ai/glm-4.5-air:free"}';
+# LLM_SECONDARY_MODEL applies to every primary not listed
+LLM_SECONDARY_MODELS = json.loads(os.getenv("LLM_SECONDARY_MODELS", "{}"))
+LLM_SECONDARY_MODEL = os.getenv("LLM_SECONDARY_MODEL", "")
+
+# The hedge fires once the primary is slower than this latency percentile
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "30"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))
+LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Stream completions and abort malformed/runaway JSON early (see json_stream)
+LLM_STREAM_RESPONSES = os.getenv("LLM_STREAM_RESPONSES", "false").lower() == "true"
+
+# With a secondary available, the primary is not retried: errors fail over
+PRIMARY_RETRIES_WITH_SECONDARY = int(os.getenv("LLM_PRIMARY_RETRIES_WITH_SECONDARY", "0"))
+
+
+class LLMRequestPolicy:
+    """
+    Hedged requests with fast failover.
+
+    The primary model gets a head start of its own recent p95 latency;
+    if it has not produced valid output by then, the same prompt is sent
+    to the secondary model and the first valid result wins (the other
+    request is cancelled). Any primary error — HTTP, transport or output
+    that fails `parse` — starts the secondary at once instead of waiting
+    out retries. Without a secondary model this is a plain call.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGE_ENABLED):
+        self.enabled = enabled
+        self._latencies = {}
+        self.calls = 0
+        self.hedges = 0
+        self.failovers = 0
+        self.secondary_wins = 0
+        self.stream_aborts = 0
+
+    def secondary_for(self, model: str):
+        secondary = LLM_SECONDARY_MODELS.get(model, LLM_SECONDARY_MODEL)
+        return secondary if secondary and secondary != model else None
+
+    def record_latency(self, model: str, seconds: float):
+        self._latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, model: str) -> float:
+        samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+
+        index = min(len(samples) - 1, math.ceil(HEDGE_PERCENTILE * len(samples)) - 1)
+        return max(HEDGE_MIN_DELAY, samples[index])
+
+    async def _stream_content(self, payload: dict, api_key: str, schema_keys, **kwargs):
+        parser = IncrementalJSONParser(schema_keys)
+
+        try:
+            async with aclosing(openrouter.stream_chat_completion(payload, api_key, **kwargs)) as deltas:
+                async for delta in deltas:
+                    parser.feed(delta)
+                    # Stop reading (and paying) once the object is closed
+                    if parser.done:
+                        break
+        except JSONStreamAbort as e:
+            self.stream_aborts += 1
+            print(f"✋ Aborted {payload['model']} stream: {e}")
+            raise
+
+        return parser.text
+
+    async def _attempt(self, payload: dict, api_key: str, parse, max_retries=None,
+                       stream=False, schema_keys=None, **kwargs):
+        model = payload["model"]
+        started = time.perf_counter()
+        # Cancelled (the hedge won) or failed attempts still count, capped at
+        # the head start they were given, so the percentile is not built
+        # from fast successes only
+        cap = self.hedge_delay(model)
+        elapsed = None
+
+        try:
+            if stream:
+                content = await self._stream_content(
+                    payload, api_key, schema_keys, max_retries=max_retries, **kwargs
+                )
+            else:
+                data = await openrouter.chat_completion(payload, api_key, max_retries=max_retries, **kwargs)
+
+                if "choices" not in data:
+                    print("API ERROR RESPONSE:")
+                    print(json.dumps(data, indent=2))
+                    raise ValueError("API returned an error — 'choices' missing")
+
+                content = data["choices"][0]["message"]["content"]
+
+            parsed = parse(content)
+            elapsed = time.perf_counter() - started
+            return content, parsed
+        finally:
+            if elapsed is None:
+                elapsed = min(time.perf_counter() - started, cap)
+            self.record_latency(model, elapsed)
+
+    async def complete(self, payload: dict, api_key: str, parse, stream: bool = None,
+                       schema_keys=None, **kwargs):
+        """
+        Returns (content, parsed, model) from the first request whose
+        content `parse` accepts. With `stream` the completion is parsed as
+        it arrives and abandoned once it is clearly invalid (schema_keys
+        bounds the expected top-level keys). Other kwargs go to the
+        OpenRouterClient call.
+        """
+        self.calls += 1
+        kwargs["stream"] = LLM_STREAM_RESPONSES if stream is None else stream
+        kwargs["schema_keys"] = schema_keys
+        primary = payload["model"]
+        secondary = self.secondary_for(primary) if self.enabled else None
+
+        if not secondary:
+            content, parsed = await self._attempt(payload, api_key, parse, **kwargs)
+            return content, parsed, primary
+
+        tasks = {
+            asyncio.create_task(self._attempt(
+                payload, api_key, parse, max_retries=PRIMARY_RETRIES_WITH_SECONDARY, **kwargs
+            )): primary
+        }
+
+        secondary_started = False
+
+        def start_secondary():
+            nonlocal secondary_started
+            secondary_started = True
+            task = asyncio.create_task(
+                self._attempt({**payload, "model": secondary}, api_key, parse, **kwargs)
+            )
+            tasks[task] = secondary
+
+        last_error = None
+        try:
+            # Head start for the primary
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+
+            if not done:
+                self.hedges += 1
+                print(f"⏱️ {primary} slower than p{HEDGE_PERCENTILE * 100:.0f} — hedging with {secondary}")
+                start_secondary()
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    model = tasks.pop(task)
+                    try:
+                        content, parsed = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if model == primary and not secondary_started:
+                            self.failovers += 1
+                            print(f"↪️ {primary} failed ({e!r}) — failing over to {secondary}")
+                            start_secondary()
+                        continue
+
+                    if model != primary:
+                        self.secondary_wins += 1
+                    return content, parsed, model
+        finally:
+            # Cancel whichever request lost
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "secondary_wins": self.secondary_wins,
+            "stream_aborts": self.stream_aborts,
+            "hedge_delay_seconds": {
+                model: round(self.hedge_delay(model), 2) for model in self._latencies
+            },
+        }
+
+
+llm_policy = LLMRequestPolicy()
@@ -1,10 +1,30 @@
-from doctr.io import DocumentFile
-from doctr.models import ocr_predictor
+import os
+import threading
 import numpy as np
-import cv2
 
-# Load DocTR OCR (best available model)
-doctr_model = ocr_predictor(pretrained=True)
+# Pages handed to the predictor per forward pass
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+
+# DocTR (and torch) load on first use, not at import
+_doctr_model = None
+_doctr_lock = threading.Lock()
+
+
+def get_doctr_model():
+    global _doctr_model
+
+    with _doctr_lock:
+        if _doctr_model is None:
+            from doctr.models import ocr_predictor
+
+            # Load DocTR OCR (best available model)
+            _doctr_model = ocr_predictor(pretrained=True)
+        return _doctr_model
+
+
+def doctr_loaded() -> bool:
+    return _doctr_model is not None
+
 
 def doctr_ocr_image(image_bytes):
     """
@@ -12,6 +32,9 @@ def doctr_ocr_image(image_bytes):
     Works for scanned invoices, photos, stamps, low-quality images.
     """
 
+    import cv2
+    from doctr.io import DocumentFile
+
     # Convert bytes → NumPy image
     nparr = np.frombuffer(image_bytes, np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -22,7 +45,22 @@ def doctr_ocr_image(image_bytes):
     # DocTR expects list of images (as numpy arrays)
     doc = DocumentFile.from_images([img])
 
-    result = doctr_model(doc)
+    result = get_doctr_model()(doc)
     text = result.render()
 
     return text.strip()
+
+
+def doctr_ocr_arrays(images, batch_size=OCR_BATCH_SIZE):
+    """
+    Runs DocTR OCR on already-decoded HxWx3 uint8 page arrays (e.g. PyMuPDF
+    pixmap samples) in batches and returns one text per image, in order.
+    """
+    doctr_model = get_doctr_model()
+    texts = []
+
+    for start in range(0, len(images), batch_size):
+        result = doctr_model(images[start:start + batch_size])
+        texts.extend(page.render().strip() for page in result.pages)
+
+    return texts
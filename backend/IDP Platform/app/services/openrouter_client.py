@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import asyncio
+
+import httpx
+
+from app.services.telemetry import LLM_REQUEST_SECONDS, LLM_REQUESTS
+
+# Point at a local stand-in (scripts/mock_openrouter.py) for load tests
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+CHAT_COMPLETIONS_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "120"))
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "4"))
+OPENROUTER_BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", "1.0"))
+OPENROUTER_BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", "60"))
+
+# Requests/second allowed per model, e.g. '{"amazon/nova-2-lite-v1:free": 0.3}'
+OPENROUTER_DEFAULT_RPS = float(os.getenv("OPENROUTER_DEFAULT_RPS", "2"))
+OPENROUTER_RATE_LIMITS = json.loads(os.getenv("OPENROUTER_RATE_LIMITS", "{}"))
+OPENROUTER_BURST = int(os.getenv("OPENROUTER_BURST", "2"))
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class OpenRouterError(Exception):
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"OpenRouter request failed ({status_code}): {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens/second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OpenRouterClient:
+    """
+    One keep-alive connection pool for every OpenRouter call in the process.
+
+    Each model gets its own token bucket, so throttling one free-tier model
+    only delays requests for that model. 429/5xx responses and transport
+    errors are retried with jittered exponential backoff, honouring
+    Retry-After when the provider sends it.
+    """
+
+    def __init__(self, url: str = CHAT_COMPLETIONS_URL):
+        self.url = url
+        self._client = None
+        self._buckets = {}
+
+    def _http(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENROUTER_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(OPENROUTER_TIMEOUT, connect=30.0),
+            )
+        return self._client
+
+    def _bucket(self, model: str):
+        if model not in self._buckets:
+            rate = OPENROUTER_RATE_LIMITS.get(model, OPENROUTER_DEFAULT_RPS)
+            self._buckets[model] = TokenBucket(rate, OPENROUTER_BURST)
+        return self._buckets[model]
+
+    def _backoff(self, attempt: int, retry_after=None) -> float:
+        delay = random.uniform(0, min(OPENROUTER_BACKOFF_MAX, OPENROUTER_BACKOFF_BASE * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _headers(self, api_key: str, extra_headers: dict = None) -> dict:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+        return headers
+
+    def _record(self, model: str, status: int, started: float):
+        seconds = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(seconds, model=model, status=status)
+        LLM_REQUESTS.inc(model=model, status=status)
+
+    async def chat_completion(self, payload: dict, api_key: str, timeout: float = None,
+                              extra_headers: dict = None, max_retries: int = None) -> dict:
+        headers = self._headers(api_key, extra_headers)
+
+        bucket = self._bucket(payload.get("model", ""))
+        request_timeout = httpx.Timeout(timeout or OPENROUTER_TIMEOUT, connect=30.0)
+
+        if max_retries is None:
+            max_retries = OPENROUTER_MAX_RETRIES
+
+        last_error = None
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+
+            retry_after = None
+            sent_at = time.perf_counter()
+            try:
+                response = await self._http().post(
+                    self.url, json=payload, headers=headers, timeout=request_timeout
+                )
+            except httpx.TransportError as e:
+                self._record(payload.get("model", ""), 0, sent_at)
+                last_error = OpenRouterError(0, repr(e))
+            else:
+                self._record(payload.get("model", ""), response.status_code, sent_at)
+                if response.status_code == 200:
+                    return response.json()
+
+                last_error = OpenRouterError(response.status_code, response.text)
+                if response.status_code not in RETRY_STATUSES:
+                    raise last_error
+                retry_after = response.headers.get("Retry-After")
+
+            if attempt < max_retries:
+                delay = self._backoff(attempt, retry_after)
+                print(f"OpenRouter retry {attempt + 1}/{max_retries} "
+                      f"for {payload.get('model')} in {delay:.1f}s ({last_error.status_code})")
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def stream_chat_completion(self, payload: dict, api_key: str, timeout: float = None,
+                                     extra_headers: dict = None, max_retries: int = None):
+        """
+        Yields content deltas of a streamed completion (SSE). Failures are
+        retried like chat_completion only until the first delta arrives.
+        Close the generator (aclosing) to abort and drop the connection.
+        """
+        headers = self._headers(api_key, extra_headers)
+        bucket = self._bucket(payload.get("model", ""))
+        request_timeout = httpx.Timeout(timeout or OPENROUTER_TIMEOUT, connect=30.0)
+
+        if max_retries is None:
+            max_retries = OPENROUTER_MAX_RETRIES
+
+        last_error = None
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+
+            retry_after = None
+            started = False
+            status = 0
+            sent_at = time.perf_counter()
+            try:
+                async with self._http().stream(
+                    "POST", self.url, json={**payload, "stream": True},
+                    headers=headers, timeout=request_timeout
+                ) as response:
+                    status = response.status_code
+                    if response.status_code == 200:
+                        async for line in response.aiter_lines():
+                            # ": OPENROUTER PROCESSING" keep-alives and blank lines
+                            if not line.startswith("data:"):
+                                continue
+
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+
+                            event = json.loads(data)
+                            if "error" in event:
+                                raise OpenRouterError(
+                                    event["error"].get("code", 0), json.dumps(event["error"])
+                                )
+
+                            delta = event["choices"][0].get("delta", {}).get("content")
+                            if delta:
+                                started = True
+                                yield delta
+                        return
+
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    last_error = OpenRouterError(response.status_code, body)
+                    if response.status_code not in RETRY_STATUSES:
+                        raise last_error
+                    retry_after = response.headers.get("Retry-After")
+            except httpx.TransportError as e:
+                status = 0
+                if started:
+                    raise OpenRouterError(0, repr(e))
+                last_error = OpenRouterError(0, repr(e))
+            finally:
+                # Streams are timed until the last token (or the abort)
+                self._record(payload.get("model", ""), status, sent_at)
+
+            if attempt < max_retries:
+                delay = self._backoff(attempt, retry_after)
+                print(f"OpenRouter stream retry {attempt + 1}/{max_retries} "
+                      f"for {payload.get('model')} in {delay:.1f}s ({last_error.status_code})")
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+openrouter = OpenRouterClient()
@@ -0,0 +1,96 @@
+import fitz  # PyMuPDF
+
+# Page classification thresholds (see PdfDocument.page_plan)
+MIN_TEXT_CHARS = 10          # less embedded text than this is "no text"
+MIN_IMAGE_COVERAGE = 0.05    # share of the page covered by images worth OCR-ing
+MIN_VECTOR_DRAWINGS = 50     # font-less pages drawn as paths (outlined text)
+
+
+class PdfDocument:
+    """
+    A PDF opened once from bytes and shared by every pipeline stage.
+
+    Page text and text dicts are cached, so page counting, text extraction,
+    OCR fallback and RAG page splitting all work off a single parse with
+    no temp files.
+    """
+
+    def __init__(self, data: bytes, name: str = "document.pdf"):
+        self.name = name
+        self.doc = fitz.open(stream=data, filetype="pdf")
+        self._text = {}
+        self._dicts = {}
+        self._plan = None
+
+    @property
+    def page_count(self) -> int:
+        return len(self.doc)
+
+    def page(self, index: int):
+        return self.doc.load_page(index)
+
+    def page_text(self, index: int) -> str:
+        if index not in self._text:
+            self._text[index] = self.page(index).get_text()
+        return self._text[index]
+
+    def page_dict(self, index: int) -> dict:
+        if index not in self._dicts:
+            self._dicts[index] = self.page(index).get_text("dict")
+        return self._dicts[index]
+
+    def render_page(self, index: int, dpi: int = 200):
+        return self.page(index).get_pixmap(dpi=dpi)
+
+    def classify_page(self, index: int) -> dict:
+        """
+        Cheap per-page decision without rendering:
+        - "text": enough embedded text → use it as-is
+        - "ocr":  little/no text but images (or outlined vector text)
+        - "skip": blank page, nothing to extract
+        """
+        page = self.page(index)
+        has_fonts = bool(page.get_fonts())
+
+        # Pages without fonts cannot carry extractable text
+        chars = len(self.page_text(index).strip()) if has_fonts else 0
+
+        page_area = abs(page.rect) or 1
+        image_area = 0
+        for info in page.get_image_info():
+            image_area += abs(fitz.Rect(info["bbox"]) & page.rect)
+        image_coverage = min(1.0, image_area / page_area)
+
+        if chars >= MIN_TEXT_CHARS:
+            action = "text"
+        elif image_coverage >= MIN_IMAGE_COVERAGE:
+            action = "ocr"
+        elif not has_fonts and len(page.get_cdrawings()) >= MIN_VECTOR_DRAWINGS:
+            action = "ocr"
+        else:
+            action = "skip"
+
+        return {
+            "page": index,
+            "action": action,
+            "chars": chars,
+            "has_fonts": has_fonts,
+            "image_coverage": round(image_coverage, 3),
+        }
+
+    def page_plan(self) -> list:
+        if self._plan is None:
+            self._plan = [self.classify_page(i) for i in range(self.page_count)]
+        return self._plan
+
+    def pages_with_action(self, action: str) -> list:
+        return [p["page"] for p in self.page_plan() if p["action"] == action]
+
+    def close(self):
+        self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,24 +1,24 @@
 import os
 import re
 import json
-import time
-import requests
+import asyncio
+import threading
 import fitz  # PyMuPDF
+import numpy as np
 from uuid import uuid4
 from dotenv import load_dotenv
-from pypdf import PdfReader
-from qdrant_client import QdrantClient, models
-from app.services.ocr_handle import doctr_ocr_image
-
-from dotenv import load_dotenv
+from app.services.ocr_handle import doctr_ocr_arrays, OCR_BATCH_SIZE
+from app.services.pdf_document import PdfDocument
+from app.services.llm_cache import llm_cache
+from app.services.llm_policy import llm_policy
+from app.services.text_compaction import compact_text
+from app.services.telemetry import EMBEDDING_BATCH_SIZE
 
 # Load environment variables
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY")
 
-URL = "https://openrouter.ai/api/v1/chat/completions"
-
 SYSTEM_PROMPT = """
 You are an invoice extraction engine.
 Extract structured invoice data and return STRICT JSON only.
@@ -62,6 +62,29 @@ Expected JSON format:
 Note: Don't output markdown fences.
 """
 
+# SYSTEM_PROMPT's JSON format per top-level key, used for prompts that
+# only ask for some of the fields
+INVOICE_FIELD_FORMATS = {
+    "invoice_number": "string or null",
+    "invoice_date": "string or null",
+    "due_date": "string or null",
+    "currency": "string or null",
+    "supplier": '{"name": string or null, "address": string or null, "tax_id": string or null}',
+    "customer": '{"name": string or null, "address": string or null, "tax_id": string or null}',
+    "line_items": '[{"description": string or null, "quantity": number or null, '
+                  '"unit_price": number or null, "line_total": number or null}]',
+    "subtotal": "number or null",
+    "tax_amount": "number or null",
+    "total_amount": "number or null",
+    "payment_terms": "string or null",
+    "purchase_order_number": "string or null",
+    "other_references": "string or null",
+}
+
+INVOICE_FIELDS = list(INVOICE_FIELD_FORMATS)
+
+EXTRACTION_MODEL = "amazon/nova-2-lite-v1:free"
+
 # -----------------------------
 # QDRANT (FastEmbed) SETTINGS
 # -----------------------------
@@ -73,6 +96,8 @@ COLLECTION_NAME = "invoice_large_pdf"
 # QDRANT INITIALIZATION (FASTEMBED MODEL)
 # ======================================================================
 def init_qdrant():
+    from qdrant_client import QdrantClient, models
+
     client = QdrantClient(path=QDRANT_DB_PATH)
 
     # Enable built-in FastEmbed model
@@ -86,41 +111,115 @@ def init_qdrant():
             collection_name=COLLECTION_NAME,
             vectors_config=vector_params
         )
+
+    # Retrieval is always scoped to one document. Existing collections
+    # need the index too, so it is (re)created on every start.
+    try:
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name="file_id",
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+    except Exception as e:
+        print(f"⚠️ Qdrant file_id index not created: {e}")
+
+    # Points indexed before per-document scoping have no file_id; no
+    # filtered search can reach them and nothing else ever deletes them
+    client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="file_id"))])
+        )
+    )
     return client
 
-def extract_pdf_pages_for_rag(pdf_path):
-    reader = PdfReader(pdf_path)
-    docs = []
-    metadata = []
-    file_id = str(uuid4())
 
-    file_name = os.path.basename(pdf_path)
-    abs_path = os.path.abspath(pdf_path)
+def file_id_filter(file_id: str):
+    from qdrant_client import models
 
-    # Use PyMuPDF for page → image rendering
-    doc_mupdf = fitz.open(pdf_path)
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="file_id",
+                match=models.MatchValue(value=file_id)
+            )
+        ]
+    )
 
-    for page_num, page in enumerate(reader.pages, start=1):
 
-        # 1️⃣ Try normal text extraction first
-        text = page.extract_text()
-        if text:
-            text = text.strip()
-        else:
-            text = ""
+# One embedded client + FastEmbed model per process. The local store is
+# not thread-safe and holds a file lock on QDRANT_DB_PATH, so every use
+# goes through QDRANT_LOCK.
+QDRANT_LOCK = threading.RLock()
+_qdrant_client = None
+
+
+def get_qdrant_client():
+    global _qdrant_client
+
+    with QDRANT_LOCK:
+        if _qdrant_client is None:
+            _qdrant_client = init_qdrant()
+        return _qdrant_client
+
+
+def qdrant_loaded() -> bool:
+    return _qdrant_client is not None
+
+
+def close_qdrant_client():
+    global _qdrant_client
+
+    with QDRANT_LOCK:
+        if _qdrant_client is not None:
+            _qdrant_client.close()
+            _qdrant_client = None
+
+# ======================================================================
+# OCR FOR TEXT-LESS PAGES (BATCHED DOCTR)
+# ======================================================================
+def find_ocr_pages(pdf: PdfDocument):
+    """Indexes of pages classified as scanned (see PdfDocument.page_plan)."""
+    return pdf.pages_with_action("ocr")
+
 
-        # 2️⃣ If page is empty → use OCR
-        if not text or len(text) < 10:
-            print(f"⚠️ Page {page_num}: No text → Running DocTR OCR...")
+def pixmap_to_array(pix):
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
 
-            # Render page as high-quality image
-            pix = doc_mupdf.load_page(page_num - 1).get_pixmap(dpi=200)
-            image_bytes = pix.tobytes("png")
 
-            ocr_text = doctr_ocr_image(image_bytes)
+def ocr_pdf_pages(pdf: PdfDocument, page_indexes, dpi=200):
+    """
+    OCR the given pages with DocTR, OCR_BATCH_SIZE pages per forward pass.
+    Pages are rendered straight to RGB arrays (no PNG encode/decode) and
+    only one batch is held in memory at a time.
+    """
+    ocr_texts = {}
 
-            text = ocr_text.strip()
-            print("OCR Text",text)
+    for start in range(0, len(page_indexes), OCR_BATCH_SIZE):
+        batch = page_indexes[start:start + OCR_BATCH_SIZE]
+        print(f"⚠️ Pages {[i + 1 for i in batch]}: No text → Running DocTR OCR...")
+
+        images = [
+            pixmap_to_array(pdf.page(i).get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False))
+            for i in batch
+        ]
+        ocr_texts.update(zip(batch, doctr_ocr_arrays(images)))
+
+    return ocr_texts
+
+
+# ======================================================================
+# PAGE TEXTS → RAG DOCS + METADATA
+# ======================================================================
+def build_rag_pages(page_texts, ocr_texts, file_name):
+    docs = []
+    metadata = []
+    file_id = str(uuid4())
+
+    for page_num, text in enumerate(page_texts, start=1):
+
+        # OCR output replaces pages without usable text
+        text = ocr_texts.get(page_num - 1, text).strip()
 
         if not text:
             continue
@@ -129,42 +228,94 @@ def extract_pdf_pages_for_rag(pdf_path):
         metadata.append({
             "file_id": file_id,
             "file_name": file_name,
-            "page_num": page_num,
-            "path": abs_path
+            "page_num": page_num
         })
 
-    doc_mupdf.close()
     return docs, metadata, file_id
 
+
+def native_page_texts(pdf: PdfDocument):
+    """Embedded text of "text" pages, "" for OCR / blank pages."""
+    return [
+        pdf.page_text(p["page"]) if p["action"] == "text" else ""
+        for p in pdf.page_plan()
+    ]
+
+
+def extract_pdf_pages_for_rag(pdf: PdfDocument):
+    page_texts = native_page_texts(pdf)
+    ocr_texts = ocr_pdf_pages(pdf, find_ocr_pages(pdf))
+    return build_rag_pages(page_texts, ocr_texts, pdf.name)
+
 # ======================================================================
 # INDEX LARGE PDF INTO QDRANT
 # ======================================================================
-def index_pdf_into_qdrant(pdf_path):
-    client = init_qdrant()
+def index_pages_into_qdrant(docs, metadata):
+    EMBEDDING_BATCH_SIZE.observe(len(docs), store="qdrant")
+    with QDRANT_LOCK:
+        get_qdrant_client().add(
+            collection_name=COLLECTION_NAME,
+            documents=docs,
+            metadata=metadata
+        )
+    return len(docs)
 
-    docs, metadata, file_id = extract_pdf_pages_for_rag(pdf_path)
 
-    client.add(
-        collection_name=COLLECTION_NAME,
-        documents=docs,
-        metadata=metadata
-    )
-    client.close()
-    return len(docs)
+def index_pdf_into_qdrant(pdf: PdfDocument):
+    docs, metadata, file_id = extract_pdf_pages_for_rag(pdf)
+    return index_pages_into_qdrant(docs, metadata)
 # ======================================================================
 # RETRIEVAL USING FASTEMBED
 # ======================================================================
-def fastembed_retrieve(query, top_k=5):
-    client = init_qdrant()
-    hits = client.query(
-        collection_name=COLLECTION_NAME,
-        query_text=query,
-        limit=top_k
-    )
-    client.close()
+def fastembed_retrieve(query, top_k=5, file_id=None):
+    with QDRANT_LOCK:
+        hits = get_qdrant_client().query(
+            collection_name=COLLECTION_NAME,
+            query_text=query,
+            query_filter=file_id_filter(file_id) if file_id else None,
+            limit=top_k
+        )
     return [hit.document for hit in hits]
 
 
+# ======================================================================
+# DROP A DOCUMENT'S POINTS ONCE IT HAS BEEN EXTRACTED
+# ======================================================================
+def delete_document_points(file_id: str):
+    from qdrant_client import models
+
+    with QDRANT_LOCK:
+        get_qdrant_client().delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(filter=file_id_filter(file_id))
+        )
+
+
+RETRIEVAL_QUERY = (
+    "Find text related to invoice number, dates, totals, taxes, supplier, "
+    "customer, line items, amounts, payment terms."
+)
+
+
+def retrieve_invoice_context(docs, metadata, top_k=7):
+    if not docs:
+        return ""
+
+    # Pages of one PDF share a file_id; search only those and remove them
+    # afterwards so the collection (and search cost) does not keep growing
+    file_id = metadata[0]["file_id"]
+
+    try:
+        total_pages = index_pages_into_qdrant(docs, metadata)
+        print(f"Indexed {total_pages} pages\n")
+
+        retrieved = fastembed_retrieve(RETRIEVAL_QUERY, top_k=top_k, file_id=file_id)
+    finally:
+        delete_document_points(file_id)
+
+    return "\n\n".join(retrieved)
+
+
 # ======================================================================
 # CLEAN LLM RAW JSON
 # ======================================================================
@@ -186,60 +337,117 @@ def clean_llm_json(raw: str) -> str:
 # ======================================================================
 # LLM CALL FOR INVOICE EXTRACTION
 # ======================================================================
-def extract_invoice_from_text(invoice_text: str):
+def parse_llm_json(content: str):
+    json_text = clean_llm_json(content)
 
-    payload = {
-        "model": "amazon/nova-2-lite-v1:free",
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        print("LLM Raw Output:", json_text)
+        raise
+
+
+def invoice_payload(invoice_text: str, system_prompt: str = SYSTEM_PROMPT):
+    return {
+        "model": EXTRACTION_MODEL,
         "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Extract structured invoice data and return JSON:\n\n{invoice_text}"}
         ],
         "response_format": {"type": "json_object"},
         "temperature": 0.0
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
 
-    response = requests.post(URL, headers=headers, json=payload)
-    result = response.json()
+def payload_cache_key(payload: dict) -> str:
+    return llm_cache.make_key(
+        payload["model"],
+        payload["temperature"],
+        payload["messages"],
+        response_format=payload["response_format"]
+    )
 
-    if "choices" not in result:
-        print("API ERROR RESPONSE:")
-        print(json.dumps(result, indent=2))
-        raise ValueError("API returned an error — 'choices' missing")
 
-    json_text = clean_llm_json(result["choices"][0]["message"]["content"])
+async def complete_json(payload: dict, schema_keys=None):
+    cache_key = payload_cache_key(payload)
+    cached = await llm_cache.aget(cache_key)
+    if cached is not None:
+        return json.loads(clean_llm_json(cached))
 
-    try:
-        return json.loads(json_text)
-    except json.JSONDecodeError:
-        print("LLM Raw Output:", json_text)
-        raise
+    # Hedged against / failing over to a secondary model (see llm_policy)
+    content, parsed, model = await llm_policy.complete(
+        payload, API_KEY, parse_llm_json, schema_keys=schema_keys
+    )
+
+    # Only cache completions that parsed, so a retry can fix bad output
+    await llm_cache.aset(cache_key, content, model=model)
+    return parsed
+
+
+async def extract_invoice_from_text(invoice_text: str):
+    return await complete_json(invoice_payload(invoice_text), INVOICE_FIELDS)
+
+
+def partial_system_prompt(fields) -> str:
+    format_lines = ",\n".join(f'  "{f}": {INVOICE_FIELD_FORMATS[f]}' for f in fields)
+    return f"""
+You are an invoice extraction engine.
+Extract ONLY the fields listed below and return STRICT JSON only.
+If data is missing, return null.
+Expected JSON format:
+{{
+{format_lines}
+}}
+
+Note: Don't output markdown fences.
+"""
+
+
+async def extract_invoice_fields(invoice_text: str, fields):
+    """LLM extraction limited to `fields` (top-level keys of the invoice schema)."""
+    payload = invoice_payload(invoice_text, partial_system_prompt(fields))
+    return await complete_json(payload, list(fields))
 
 
 # ======================================================================
-# LARGE PDF → RAG + LLM
+# MAP-REDUCE: EXTRACT EACH CHUNK, MERGE THE PARTIAL INVOICES
 # ======================================================================
-def extract_invoice_large_pdf(pdf_path):
-    print("\n⚡ Large PDF detected — using FastEmbed + Qdrant Retrieval\n")
+# Totals are printed at the end of an invoice, so the last chunk wins
+LAST_VALUE_FIELDS = {"subtotal", "tax_amount", "total_amount"}
 
-    total_pages = index_pdf_into_qdrant(pdf_path)
-    print(f"Indexed {total_pages} pages\n")
 
-    query = (
-        "Find text related to invoice number, dates, totals, taxes, supplier, "
-        "customer, line items, amounts, payment terms."
-    )
+def merge_invoice_results(results):
+    merged = {}
+
+    for result in results:
+        for key, value in (result or {}).items():
+            if value in (None, "", [], {}):
+                continue
+
+            if key == "line_items":
+                items = merged.setdefault("line_items", [])
+                # Items repeated across a chunk boundary are kept once
+                items.extend(item for item in value if item not in items)
+            elif isinstance(value, dict):
+                target = merged.setdefault(key, {})
+                for k, v in value.items():
+                    if v is not None and target.get(k) is None:
+                        target[k] = v
+            elif key in LAST_VALUE_FIELDS or merged.get(key) is None:
+                merged[key] = value
 
-    retrieved = fastembed_retrieve(query, top_k=7)
+    return merged
 
-    context = "\n\n".join(retrieved)
 
-    print("Sending retrieved chunks to LLM...")
-    return extract_invoice_from_text(context)
+async def extract_invoice_map_reduce(chunks, concurrency=4):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def extract_chunk(chunk):
+        async with semaphore:
+            return await extract_invoice_from_text(chunk)
+
+    results = await asyncio.gather(*(extract_chunk(c) for c in chunks))
+    return merge_invoice_results(results)
 
 
 # ======================================================================
@@ -261,27 +469,50 @@ def remove_nulls(data):
 # ======================================================================
 # TEXT EXTRACTION FOR SMALL PDFs
 # ======================================================================
-def extract_invoice_text(pdf_path):
-    doc = fitz.open(pdf_path)
+def invoice_page_lines(pdf: PdfDocument, page_index: int):
     lines = []
+    page_dict = pdf.page_dict(page_index)
 
-    for page in doc:
-        page_dict = page.get_text("dict")
-
-        for block in page_dict["blocks"]:
-            if block["type"] != 0:
-                continue
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
 
-            for line in block["lines"]:
-                spans = line["spans"]
-                merged = " ".join(span["text"] for span in spans).strip()
-                if merged:
-                    lines.append(merged)
+        for line in block["lines"]:
+            spans = line["spans"]
+            merged = " ".join(span["text"] for span in spans).strip()
+            if merged:
+                lines.append(merged)
 
-    doc.close()
     return "\n".join(lines)
 
 
+def invoice_page_texts(pdf: PdfDocument):
+    """Span-merged lines of "text" pages, "" for OCR / blank pages."""
+    return [
+        invoice_page_lines(pdf, p["page"]) if p["action"] == "text" else ""
+        for p in pdf.page_plan()
+    ]
+
+
+def compact_invoice_text(pdf: PdfDocument, ocr_texts=None):
+    # Native text for text pages, OCR output (if given) for scanned ones,
+    # blank pages skipped; repeated headers/boilerplate compacted away
+    ocr_texts = ocr_texts or {}
+    parts = []
+
+    for page_index, text in enumerate(invoice_page_texts(pdf)):
+        text = ocr_texts.get(page_index, text)
+        if text:
+            parts.append(text)
+
+    return compact_text(parts, "\n")
+
+
+def extract_invoice_text(pdf: PdfDocument, ocr_texts=None):
+    text, _ = compact_invoice_text(pdf, ocr_texts)
+    return text
+
+
 # ======================================================================
 # PROCESSING DRIVER
 # ======================================================================
@@ -298,44 +529,3 @@ def get_pdf_files(path):
             if f.lower().endswith(".pdf"):
                 pdf_list.append(os.path.join(root, f))
     return pdf_list
-
-
-# # ======================================================================
-# # MAIN
-# # ======================================================================
-# if __name__ == "__main__":
-#     #input_path = "D:/Official/OneDrive - Indium Software India Private Limited/Downloads/rich_sample_invoice_10_pages.pdf"
-    
-#     #input_path = "D:/Official/OneDrive - Indium Software India Private Limited/Downloads/invoice"
-#     input_path = "D:/Official/OneDrive - Indium Software India Private Limited/Downloads/archive/2024/us/wholefoods_20240528_002.pdf"
-#     pdf_files = get_pdf_files(input_path)
-
-#     for idx, pdf_path in enumerate(pdf_files, start=1):
-
-#         if idx > 1:
-#             print(f"\nWaiting 45 seconds before processing next file...")
-#             time.sleep(65)
-
-#         print("\n==============================")
-#         print(f"Processing: {pdf_path}")
-#         print("==============================")
-
-#         doc = fitz.open(pdf_path)
-#         page_count = len(doc)
-#         doc.close()
-
-#         print(f"PDF has {page_count} pages.")
-
-#         if page_count > 5:
-#             output = extract_invoice_large_pdf(pdf_path)
-#         else:
-#             print("Small PDF → Extracting directly…")
-#             text = extract_invoice_text(pdf_path)
-#             print(text)
-#             output = extract_invoice_from_text(text)
-
-#         print("Cleaning null values…")
-#         clean_output = remove_nulls(output)
-
-#         print("\nFINAL OUTPUT:")
-#         print(json.dumps(clean_output, indent=2,ensure_ascii=False))
@@ -0,0 +1,63 @@
+"""
+PIPELINE_VERSION identifies everything that shapes an extraction: model,
+prompts, routing limits, compaction, the rule fast path, layout templates
+and packing. A stored result is only reused for an upload whose content
+hash and pipeline version both match, so changing any of these settings
+re-extracts instead of serving results produced under the old ones.
+
+Lives in its own module because those settings are spread over modules
+that all import pipeline_builder.
+"""
+import json
+import hashlib
+
+from app.services import extraction_router, text_compaction, rule_extractor, layout_templates, invoice_packer
+from app.services.pipeline_builder import EXTRACTION_MODEL, SYSTEM_PROMPT
+
+
+def pipeline_settings() -> dict:
+    return {
+        "model": EXTRACTION_MODEL,
+        "system_prompt": SYSTEM_PROMPT,
+        "router": {
+            "model_context_limits": extraction_router.MODEL_CONTEXT_LIMITS,
+            "default_context_tokens": extraction_router.DEFAULT_CONTEXT_TOKENS,
+            "output_reserve_tokens": extraction_router.OUTPUT_RESERVE_TOKENS,
+            "direct_max_tokens": extraction_router.DIRECT_MAX_TOKENS,
+            "max_prompt_tokens": extraction_router.MAX_PROMPT_TOKENS,
+            "latency_budget_seconds": extraction_router.LATENCY_BUDGET_SECONDS,
+            "llm_base_seconds": extraction_router.LLM_BASE_SECONDS,
+            "llm_seconds_per_1k_tokens": extraction_router.LLM_SECONDS_PER_1K_TOKENS,
+            "ocr_seconds_per_page": extraction_router.OCR_SECONDS_PER_PAGE,
+            "embed_seconds_per_page": extraction_router.EMBED_SECONDS_PER_PAGE,
+            "ocr_tokens_per_page": extraction_router.OCR_TOKENS_PER_PAGE,
+            "map_chunk_tokens": extraction_router.MAP_CHUNK_TOKENS,
+            "map_max_chunks": extraction_router.MAP_MAX_CHUNKS,
+            "rag_top_k": extraction_router.RAG_TOP_K,
+        },
+        "compaction": {
+            "enabled": text_compaction.COMPACTION_ENABLED,
+            "header_footer_lines": text_compaction.HEADER_FOOTER_LINES,
+            "repeat_min_share": text_compaction.REPEAT_MIN_SHARE,
+        },
+        "fast_path": {
+            "enabled": rule_extractor.FAST_PATH_ENABLED,
+            "min_confidence": rule_extractor.FAST_PATH_MIN_CONFIDENCE,
+            "absent_field_confidence": rule_extractor.ABSENT_FIELD_CONFIDENCE,
+        },
+        "templates": {
+            "enabled": layout_templates.TEMPLATES_ENABLED,
+            "schema_version": layout_templates.TEMPLATE_SCHEMA_VERSION,
+            "min_samples": layout_templates.TEMPLATE_MIN_SAMPLES,
+            "field_confidence": layout_templates.TEMPLATE_FIELD_CONFIDENCE,
+        },
+        "packing": {
+            "enabled": invoice_packer.PACKING_ENABLED,
+            "system_prompt": invoice_packer.PACKED_SYSTEM_PROMPT,
+        },
+    }
+
+
+PIPELINE_VERSION = hashlib.sha256(
+    json.dumps(pipeline_settings(), sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
@@ -1,27 +1,30 @@
 from fastapi import UploadFile, HTTPException
 from bson import ObjectId
+from datetime import datetime
 import json
 import re
 import io
 import base64
+import hashlib
+import time
+import asyncio
+from contextlib import aclosing
 
-import fitz  # PyMuPDF
 from docx import Document
 from PIL import Image
-from pdf2image import convert_from_bytes
 
-import httpx
-import requests
-import os
-
-from app.services.qdrant_service import QdrantVector
-from app.services.chroma_service import ChromaVector
-from app.services.faiss_service import FaissVector
+from app.services.pdf_document import PdfDocument
+from app.services.llm_cache import llm_cache
+from app.services.openrouter_client import openrouter, OpenRouterError
+from app.services.llm_policy import llm_policy
+from app.services.json_stream import IncrementalJSONParser, JSONStreamAbort
+from app.services.text_compaction import compact_pages, compact_text, log_compaction
+from app.services.timings import StageTimer
+from app.services.telemetry import GRIDFS_BYTES, record_ocr, record_cache_lookup
 from app.core.config import OPENROUTER_API_KEY, OPENROUTER_MODEL
 
 # Separate model for OCR (Gemma-3 vision model)
 OCR_MODEL_NAME = "google/gemma-3-12b-it:free"
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
 from dotenv import load_dotenv
 
@@ -36,8 +39,9 @@ class PlaygroundService:
         self.extractions = extractions_collection
 
     async def upload_file(self, project_id: str, file: UploadFile):
-        # 1) Read file bytes
+        # 1) Read file bytes + content fingerprint (for dedup)
         file_bytes = await file.read()
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
 
         # 2) Store in GridFS
         grid_in = await self.fs.upload_from_stream(
@@ -47,8 +51,10 @@ class PlaygroundService:
                     "project_id": project_id,
                     "content_type": file.content_type,
                     "size": len(file_bytes),
+                    "content_hash": content_hash,
                 }
             )
+        GRIDFS_BYTES.inc(len(file_bytes), direction="in")
 
             # 3) Return response (no local saving)
         return {
@@ -66,10 +72,14 @@ class PlaygroundService:
             raise HTTPException(status_code=404, detail="File not found in GridFS")
 
         data = await grid_out.read()
+        GRIDFS_BYTES.inc(len(data), direction="out")
         filename = grid_out.filename
-        content_type = grid_out.metadata.get("content_type") if grid_out.metadata else None
+        metadata = grid_out.metadata or {}
+        content_type = metadata.get("content_type")
+        # Files uploaded before fingerprinting have no stored hash
+        content_hash = metadata.get("content_hash") or hashlib.sha256(data).hexdigest()
 
-        return data, filename, content_type
+        return data, filename, content_type, content_hash
 
     async def download_file(self, file_id: str):
         try:
@@ -78,25 +88,25 @@ class PlaygroundService:
             raise HTTPException(status_code=404, detail="File not found")
 
         data = await grid_out.read()
+        GRIDFS_BYTES.inc(len(data), direction="out")
         return grid_out, data
-    def _extract_from_pdf(self, data: bytes):
+    def _extract_from_pdf(self, pdf: PdfDocument, page_indexes: list):
         """
-        For searchable PDFs: extract text + tables using PyMuPDF.
+        For searchable pages: extract text + tables using PyMuPDF.
+        Returns {page_index: text} and the tables found.
         """
-        doc = fitz.open(stream=data, filetype="pdf")
-
-        all_text = ""
+        page_texts = {}
         tables = []
 
-        for page in doc:
-            all_text += page.get_text()
+        for page_index in page_indexes:
+            page_texts[page_index] = pdf.page_text(page_index)
 
-            page_tables = page.find_tables()
+            page_tables = pdf.page(page_index).find_tables()
             if page_tables:
                 for table in page_tables.tables:
                     tables.append(table.extract())
 
-        return all_text, tables
+        return page_texts, tables
 
     def _pil_to_data_url(self, img: Image.Image, fmt: str = "PNG") -> str:
         """Convert a PIL Image to base64 data URL."""
@@ -105,7 +115,7 @@ class PlaygroundService:
         b64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
         return f"data:image/{fmt.lower()};base64,{b64}"
 
-    def _call_gemma_image_ocr(self, image_data_url: str) -> str:
+    async def _call_gemma_image_ocr(self, image_data_url: str) -> str:
         """
         Call Gemma-3 (via OpenRouter) with one image (data URL) and get structured text.
         """
@@ -115,11 +125,6 @@ class PlaygroundService:
                 detail="OPENROUTER_API_KEY is not configured on the server.",
             )
 
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
         system_prompt = (
             "You are a document OCR assistant. Convert the input image into structured text.\n"
             "Rules:\n"
@@ -153,51 +158,49 @@ class PlaygroundService:
             "max_tokens": 4096,
         }
 
-        resp = requests.post(OPENROUTER_URL, headers=headers, json=body)
         try:
-            resp.raise_for_status()
-        except Exception as e:
+            data = await openrouter.chat_completion(body, OPENROUTER_API_KEY)
+        except OpenRouterError as e:
             raise HTTPException(
                 status_code=500,
-                detail=f"OCR model request failed: {str(e)} | {resp.text}",
+                detail=f"OCR model request failed: {str(e)}",
             )
 
-        data = resp.json()
         return data["choices"][0]["message"]["content"]
 
-    def _ocr_extract_pdf(self, data: bytes) -> str:
+    async def _ocr_extract_pdf(self, pdf: PdfDocument, page_indexes: list) -> dict:
         """
-        OCR for scanned PDFs:
-        - Convert each page to image using pdf2image
-        - Run Gemma-3 OCR per page
-        - Concatenate with page separators
+        OCR for scanned pages:
+        - Render each page to PNG with PyMuPDF (same document, no re-parse)
+        - Run Gemma-3 OCR per page (concurrently; the client rate-limits)
+        - Return {page_index: text}
         """
-        pages = convert_from_bytes(data, dpi=200)
-        all_page_texts = []
+        async def ocr_page(page_index):
+            png_bytes = pdf.render_page(page_index, dpi=200).tobytes("png")
+            b64 = base64.b64encode(png_bytes).decode("utf-8")
+            data_url = f"data:image/png;base64,{b64}"
+            return await self._call_gemma_image_ocr(data_url)
 
-        for page_index, page_img in enumerate(pages, start=1):
-            data_url = self._pil_to_data_url(page_img, fmt="PNG")
-            page_text = self._call_gemma_image_ocr(data_url)
-            page_block = f"===== PAGE {page_index} =====\n\n{page_text}"
-            all_page_texts.append(page_block)
+        texts = await asyncio.gather(*(ocr_page(i) for i in page_indexes))
+        return dict(zip(page_indexes, texts))
 
-        return "\n\n\n".join(all_page_texts)
-
-    def _ocr_extract_image(self, data: bytes) -> str:
+    async def _ocr_extract_image(self, data: bytes) -> str:
         """OCR for a single image file (JPG/PNG/etc.) using Gemma."""
         img = Image.open(io.BytesIO(data))
         data_url = self._pil_to_data_url(img)
-        return self._call_gemma_image_ocr(data_url)
+        return await self._call_gemma_image_ocr(data_url)
 
-    def _extract_text(self, data: bytes, filename: str, content_type: str):
+    async def _extract_text(self, data: bytes, filename: str, content_type: str, timer: StageTimer = None):
         """
         Main text extraction router:
         - Images        → Gemma OCR
-        - PDFs scanned  → Gemma OCR (per page)
-        - PDFs text     → PyMuPDF (_extract_from_pdf)
+        - PDFs          → per page: PyMuPDF text (_extract_from_pdf),
+                          Gemma OCR for scanned pages, blank pages skipped
         - DOCX          → python-docx
         - TXT           → raw bytes decode
+        Returns (compacted text, compaction stats, tables).
         """
+        timer = timer or StageTimer()
         content_type = content_type or ""
         filename = filename or ""
 
@@ -205,43 +208,70 @@ class PlaygroundService:
 
         # 1) Images → Gemma OCR
         if content_type.startswith("image/"):
-            ocr_text = self._ocr_extract_image(data)
-            return ocr_text, []
+            ocr_started = time.perf_counter()
+            with timer.span("ocr"):
+                ocr_text = await self._ocr_extract_image(data)
+            record_ocr("gemma", 1, time.perf_counter() - ocr_started)
+            with timer.span("compaction"):
+                ocr_text, compaction = compact_text([ocr_text])
+            return ocr_text, compaction, []
 
         # 2) PDFs
         if filename_lower.endswith(".pdf"):
-            # First check if it's searchable or scanned
-            doc = fitz.open(stream=data, filetype="pdf")
-            has_text = False
-
-            for page in doc:
-                page_text = page.get_text().strip()
-                if page_text:
-                    has_text = True
-                    break
-
-            if has_text:
-                # Use standard text+table extraction for searchable PDFs
-                return self._extract_from_pdf(data)
-            else:
-                # Scanned PDF → OCR with Gemma
-                ocr_text = self._ocr_extract_pdf(data)
-                # Tables are embedded as markdown in text
-                return ocr_text, []
+            # Parse once; classification, extraction and OCR share it
+            with timer.span("parse"):
+                pdf = PdfDocument(data, filename)
+
+            with pdf:
+
+                # Per-page plan: native text, OCR (scanned) or skip (blank)
+                with timer.span("parse"):
+                    text_pages = pdf.pages_with_action("text")
+                    ocr_pages = pdf.pages_with_action("ocr")
+
+                # Searchable pages → standard text+table extraction
+                with timer.span("text"):
+                    page_texts, tables = self._extract_from_pdf(pdf, text_pages)
+
+                if not ocr_pages:
+                    with timer.span("compaction"):
+                        text, compaction = compact_text([page_texts[i] for i in text_pages])
+                    return text, compaction, tables
+
+                # Scanned pages → OCR with Gemma
+                # (tables on those pages are embedded as markdown in text)
+                ocr_started = time.perf_counter()
+                with timer.span("ocr"):
+                    page_texts.update(await self._ocr_extract_pdf(pdf, ocr_pages))
+                record_ocr("gemma", len(ocr_pages), time.perf_counter() - ocr_started)
+
+                # Repeated headers/footers and boilerplate removed per page
+                pages = sorted(page_texts)
+                with timer.span("compaction"):
+                    compacted, compaction = compact_pages([page_texts[i] for i in pages])
+
+                all_page_texts = [
+                    f"===== PAGE {i + 1} =====\n\n{text}"
+                    for i, text in zip(pages, compacted)
+                ]
+                return "\n\n\n".join(all_page_texts), compaction, tables
 
         # 3) DOCX
         if filename_lower.endswith(".docx"):
-            f = io.BytesIO(data)
-            doc = Document(f)
-            content = "\n".join(p.text for p in doc.paragraphs)
-            return content, []
+            with timer.span("text"):
+                f = io.BytesIO(data)
+                doc = Document(f)
+                content, compaction = compact_text(["\n".join(p.text for p in doc.paragraphs)])
+            return content, compaction, []
 
         # 4) TXT
         if filename_lower.endswith(".txt"):
-            return data.decode("utf-8", errors="ignore"), []
+            with timer.span("text"):
+                content, compaction = compact_text([data.decode("utf-8", errors="ignore")])
+            return content, compaction, []
 
         # Unknown type
-        return "", []
+        return "", compact_text([])[1], []
 
     def _clean_llm_json(self, text: str):
         """
@@ -285,7 +315,7 @@ class PlaygroundService:
             field_prompts += f"- {field}: {info.get('prompt', '')}\n"
 
         return target_schema, field_prompts
-    async def _run_llm_openrouter(
+    def _build_llm_payload(
         self,
         project_prompt: str,
         field_prompts: str,
@@ -317,14 +347,6 @@ Rules:
 3. Do NOT include explanations.
         """
 
-        url = "https://openrouter.ai/api/v1/chat/completions"
-
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "HTTP-Referer": "http://localhost",
-            "Content-Type": "application/json",
-        }
-
         payload = {
             "model": OPENROUTER_MODEL,
             "max_tokens": 2000,
@@ -333,67 +355,244 @@ Rules:
                 {"role": "user", "content": final_prompt},
             ],
         }
+        return payload
+
+    def _llm_cache_key(self, payload: dict) -> str:
+        return llm_cache.make_key(
+            payload["model"],
+            payload.get("temperature"),
+            payload["messages"],
+            max_tokens=payload["max_tokens"],
+        )
 
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(300.0, connect=60.0,read=300.0, write=60.0)
-        ) as client:
-            response = await client.post(url, json=payload, headers=headers)
+    async def _run_llm_openrouter(
+        self,
+        project_prompt: str,
+        field_prompts: str,
+        schema: dict,
+        extracted_text: str,
+        tables: list,
+    ):
+        payload = self._build_llm_payload(
+            project_prompt, field_prompts, schema, extracted_text, tables
+        )
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail=response.text)
+        cache_key = self._llm_cache_key(payload)
+        cached = await llm_cache.aget(cache_key)
+        if cached is not None:
+            return cached
 
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
-    async def run_extraction(self, project_id: str, document_type: str, file_id: str):
-        # 1) Read file from GridFS
-        data, filename, content_type = await self._read_file_from_gridfs(file_id)
+        # Hedged against / failing over to a secondary model (see llm_policy);
+        # only output that parses wins and is cached
+        try:
+            content, _, model = await llm_policy.complete(
+                payload,
+                OPENROUTER_API_KEY,
+                self._clean_llm_json,
+                schema_keys=list(schema),
+                timeout=300.0,
+                extra_headers={"HTTP-Referer": "http://localhost"},
+            )
+        except OpenRouterError as e:
+            raise HTTPException(status_code=500, detail=e.body)
+
+        await llm_cache.aset(cache_key, content, model=model)
+        return content
 
-        # 2) Extract plain text (via PyMuPDF / DOCX / TXT / Gemma OCR) + tables
-        extracted_text, tables = self._extract_text(data, filename, content_type)
+    def _prompt_version(self, project_prompt: str, field_prompts: str, schema: dict) -> str:
+        """Fingerprint of everything that shapes the LLM output for a project."""
+        raw = json.dumps(
+            {
+                "model": OPENROUTER_MODEL,
+                "prompt": project_prompt,
+                "fields": field_prompts,
+                "schema": schema,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
 
-        # 3) Get project config
-        project = await self.projects.find_one({"_id": ObjectId(project_id)})
+    async def _prepare_extraction(self, project_id: str, file_id: str, timer: StageTimer):
+        # 1) Read file from GridFS
+        with timer.span("gridfs_read"):
+            data, filename, content_type, content_hash = await self._read_file_from_gridfs(file_id)
+
+        # 2) Get project config
+        with timer.span("mongo"):
+            project = await self.projects.find_one({"_id": ObjectId(project_id)})
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
 
         project_prompt = project.get("domain_template", "") or project.get("prompt", "")
         extraction_schema = project.get("extraction_schema", {}) or {}
 
-        # 4) Build target schema + per-field prompts
+        # 3) Build target schema + per-field prompts
         target_schema, field_prompts = self._build_schema_and_prompt(extraction_schema)
+        prompt_version = self._prompt_version(project_prompt, field_prompts, target_schema)
 
-        # 5) Call OpenRouter LLM for structured extraction
-        llm_output = await self._run_llm_openrouter(
-            project_prompt,
-            field_prompts,
-            target_schema,
-            extracted_text,
-            tables,
-        )
+        # 4) Same bytes already extracted with the same prompt → reuse
+        with timer.span("dedup_lookup"):
+            previous = await self.extractions.find_one(
+                {"content_hash": content_hash, "prompt_version": prompt_version},
+                sort=[("_id", 1)],
+            )
+        record_cache_lookup("playground_dedup", previous is not None)
+
+        return {
+            "data": data,
+            "filename": filename,
+            "content_type": content_type,
+            "content_hash": content_hash,
+            "project_prompt": project_prompt,
+            "target_schema": target_schema,
+            "field_prompts": field_prompts,
+            "prompt_version": prompt_version,
+            "previous": previous,
+            "timer": timer,
+        }
 
-        # 6) Clean and parse JSON
-        clean_json = self._clean_llm_json(llm_output)
+    async def _save_extraction(self, ctx: dict, project_id: str, document_type: str, file_id: str,
+                               clean_json, tables, compaction):
+        previous = ctx["previous"]
+        timings = ctx["timer"].as_dict()
 
-        # 7) Persist extraction result
+        # 8) Persist extraction result
         await self.extractions.insert_one(
             {
                 "project_id": project_id,
                 "file_id": file_id,
                 "document_type": document_type,
-                "schema_used": target_schema,
+                "schema_used": ctx["target_schema"],
                 "tables": tables,
                 "result": clean_json,
+                "content_hash": ctx["content_hash"],
+                "prompt_version": ctx["prompt_version"],
+                "deduplicated": previous is not None,
+                "dedup_of": previous["_id"] if previous else None,
+                "compaction": compaction,
+                "timings": timings,
+                "created_at": datetime.utcnow(),
             }
         )
 
-        # 8) Return response
+        # 9) Return response
         return {
             "status": "success",
             "extracted_data": clean_json,
-            "schema_used": target_schema,
+            "schema_used": ctx["target_schema"],
             "tables": tables,
+            "deduplicated": previous is not None,
+            "compaction": compaction,
+            "timings": timings,
         }
 
+    async def run_extraction(self, project_id: str, document_type: str, file_id: str,
+                             timer: StageTimer = None):
+        timer = timer or StageTimer()
+        ctx = await self._prepare_extraction(project_id, file_id, timer)
+        previous = ctx["previous"]
+
+        if previous:
+            clean_json = previous.get("result")
+            tables = previous.get("tables", [])
+            compaction = previous.get("compaction")
+        else:
+            # 5) Extract plain text (via PyMuPDF / DOCX / TXT / Gemma OCR) + tables,
+            #    compacted to cut prompt tokens
+            extracted_text, compaction, tables = await self._extract_text(
+                ctx["data"], ctx["filename"], ctx["content_type"], timer
+            )
+            log_compaction(ctx["filename"], compaction)
+
+            # 6) Call OpenRouter LLM for structured extraction
+            with timer.span("llm"):
+                llm_output = await self._run_llm_openrouter(
+                    ctx["project_prompt"],
+                    ctx["field_prompts"],
+                    ctx["target_schema"],
+                    extracted_text,
+                    tables,
+                )
+
+            # 7) Clean and parse JSON
+            with timer.span("json_cleanup"):
+                clean_json = self._clean_llm_json(llm_output)
+
+        return await self._save_extraction(
+            ctx, project_id, document_type, file_id, clean_json, tables, compaction
+        )
+
+    async def run_extraction_stream(self, project_id: str, document_type: str, file_id: str,
+                                    timer: StageTimer = None):
+        """
+        Same as run_extraction, but yields (event, data) as it goes:
+        "start", one "field" per top-level field as soon as the streamed
+        completion contains it, then "done" with the full result — or
+        "error" if the completion is aborted as invalid/runaway.
+        """
+        timer = timer or StageTimer()
+        ctx = await self._prepare_extraction(project_id, file_id, timer)
+        previous = ctx["previous"]
+        schema_keys = list(ctx["target_schema"])
+
+        yield "start", {"file_id": file_id, "fields": schema_keys, "deduplicated": previous is not None}
+
+        if previous:
+            for key, value in (previous.get("result") or {}).items():
+                yield "field", {"key": key, "value": value}
+
+            yield "done", await self._save_extraction(
+                ctx, project_id, document_type, file_id, previous.get("result"),
+                previous.get("tables", []), previous.get("compaction")
+            )
+            return
+
+        extracted_text, compaction, tables = await self._extract_text(
+            ctx["data"], ctx["filename"], ctx["content_type"], timer
+        )
+        log_compaction(ctx["filename"], compaction)
+
+        # Until the last token, including handing field events to the client
+        llm_started = time.perf_counter()
+        payload = self._build_llm_payload(
+            ctx["project_prompt"], ctx["field_prompts"], ctx["target_schema"], extracted_text, tables
+        )
+        cache_key = self._llm_cache_key(payload)
+        content = await llm_cache.aget(cache_key)
+
+        if content is not None:
+            clean_json = self._clean_llm_json(content)
+            for key, value in clean_json.items():
+                yield "field", {"key": key, "value": value}
+        else:
+            # Single model here: hedging would interleave fields from two answers
+            parser = IncrementalJSONParser(schema_keys)
+            try:
+                async with aclosing(openrouter.stream_chat_completion(
+                    payload,
+                    OPENROUTER_API_KEY,
+                    timeout=300.0,
+                    extra_headers={"HTTP-Referer": "http://localhost"},
+                )) as deltas:
+                    async for delta in deltas:
+                        for key, value in parser.feed(delta):
+                            yield "field", {"key": key, "value": value}
+                        if parser.done:
+                            break
+
+                clean_json = self._clean_llm_json(parser.text)
+            except (JSONStreamAbort, OpenRouterError, HTTPException) as e:
+                yield "error", {"detail": getattr(e, "detail", None) or str(e)}
+                return
+
+            await llm_cache.aset(cache_key, parser.text, model=payload["model"])
+
+        timer.add("llm", time.perf_counter() - llm_started)
+
+        yield "done", await self._save_extraction(
+            ctx, project_id, document_type, file_id, clean_json, tables, compaction
+        )
+
     async def get_history_by_project(self, project_id: str):
         return await self.extractions.find({"project_id": project_id}).to_list(1000)
 
@@ -418,82 +617,3 @@ Rules:
             #"file_id": file_id,
             "extraction_result": extraction_result
         }
-
-
-import requests
-import os
-import json
- 
-API_KEY = "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"
-URL = "https://openrouter.ai/api/v1/chat/completions"
- 
-user_prompt = """
-I want bill number, bill date,
-customer id, vendor name, total amount and currency
-"""
- 
-payload = {
-    "model": "z-ai/glm-4.5-air:free",
-    "messages": [
-        {
-            "role": "system",
-            "content": (
-                "Understand the context clearly and identifiy the feilds in given text"
-                "You generate JSON objects only.\n"
-                "Do NOT use markdown, code blocks, or explanations.\n"
-                "Output must start with { and end with }.\n"
-               
-            )
-        },
-        {
-            "role": "user",
-            "content": (
-                "From the following request, identify the fields and return a JSON object.\n"
-                "User request:\n"
-                f"{user_prompt}"
-            )
-        }
-    ],
-    "max_tokens": 2000,
-    "temperature": 0,
-    "stop": ["```"]
-}
- 
- 
-headers = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json",
-    "HTTP-Referer": "http://localhost",
-    "X-Title": "Prompt to JSON Schema"
-}
- 
-response = requests.post(URL, json=payload, headers=headers)
-data = response.json()
- 
-content = data.get("choices", [{}])[0].get("message", {}).get("content")
- 
-print("OUTPUT JSON:")
- 
-import re
-import json
- 
-def safe_json_parse(text):
-    if not text:
-        return {}
- 
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if not match:
-        return {}
- 
-    try:
-        return json.loads(match.group())
-    except json.JSONDecodeError:
-        return {}
- 
-parsed = safe_json_parse(content)
-print(parsed)
- 
-# print(content)
-# print(json.loads(content))
- 
- 
\ No newline at end of file
@@ -0,0 +1,558 @@
+import os
+import re
+import statistics
+
+from app.services.pdf_document import PdfDocument
+from app.services.pipeline_builder import INVOICE_FIELDS
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+# Fields below this confidence are sent to the LLM
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+# Confidence that an optional field is really absent when nothing in the
+# text even hints at it (ABSENCE_HINTS); otherwise a missed field is 0.0
+ABSENT_FIELD_CONFIDENCE = float(os.getenv("FAST_PATH_ABSENT_CONFIDENCE", "0.85"))
+
+ROW_TOLERANCE = 3.0      # points; segments closer than this vertically share a row
+
+# ---------------------------------------------------------------------
+# Labels (matched at the start of a text segment) per field
+# ---------------------------------------------------------------------
+LABELS = {
+    "invoice_number": r"(tax\s+)?invoice\s*(no\.?|number|num|#|id)|inv\.?\s*(no\.?|#)|bill\s*(no\.?|number|#)",
+    "invoice_date": r"(invoice|issue|bill)\s+date|date\s+of\s+(issue|invoice)|dated?(?!\s*(due|of\s+supply))",
+    "due_date": r"(payment\s+)?due\s+(date|on|by)|pay\s+by",
+    "purchase_order_number": r"(p\.?\s*o\.?|purchase\s+order)\s*(no\.?|number|#|ref(erence)?)?",
+    "payment_terms": r"payment\s+terms|terms\s+of\s+payment|terms(?=\s*:)",
+    "subtotal": r"sub[\s-]?total|total\s+(excl\.?|excluding|before|net)\b[^:]*|net\s+(amount|total)",
+    "tax_amount": r"(total\s+)?(sales\s+tax|tax|vat|gst|igst)(?!\s*(no\b|number|id\b|reg|#|invoice))(\s+amount)?"
+                  r"(\s*\(?\s*\d+(\.\d+)?\s*%\s*\)?)?",
+    "total_amount": r"(grand\s+total|total\s+amount(\s+due)?|total\s+due|amount\s+due|balance\s+due"
+                    r"|total\s+(incl\.?|including)\b[^:]*|total)(?!\s*(tax|vat|gst|excl|before|items?|qty|quantity))",
+    "tax_id": r"((vat|gst|tax|trn|tin|ein|abn|uid)\s*(reg(istration)?\.?\s*)?(no\.?|number|id|#)|gstin|ein|abn)",
+}
+LABEL_RES = {field: re.compile(rf"^\s*(?:{p})\s*[:#.\-]?\s*", re.IGNORECASE) for field, p in LABELS.items()}
+
+# "Customer ID" / "Vendor No." are references, not party blocks
+NOT_PARTY = r"(?!\s*(id|no\.?|number|#|ref|code)\b)"
+CUSTOMER_RE = re.compile(
+    rf"^\s*(bill(ed)?\s+to|sold\s+to|invoice\s+to|customer|buyer|ship\s+to)\b{NOT_PARTY}\s*:?\s*", re.IGNORECASE
+)
+SUPPLIER_RE = re.compile(
+    rf"^\s*(from|supplier|vendor|seller|sold\s+by|bill\s+from)\b{NOT_PARTY}\s*:?\s*", re.IGNORECASE
+)
+
+ID_RE = re.compile(r"^[A-Z0-9][A-Z0-9\-/_.]*\d[A-Z0-9\-/_.]*$", re.IGNORECASE)
+# The whole text must be one amount, optionally with a currency code/symbol
+AMOUNT_RE = re.compile(
+    r"^\(?-?\s*(?:[A-Z]{3}|[$€£₹¥])?\s*-?\s*(\d[\d,.']*)\s*(?:[A-Z]{3}|[$€£₹¥])?\s*\)?$",
+    re.IGNORECASE
+)
+DATE_RE = re.compile(
+    r"\d{4}-\d{1,2}-\d{1,2}"
+    r"|\d{1,2}[/.\-]\d{1,2}[/.\-]\d{2,4}"
+    r"|\d{1,2}[\s\-](jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?[\s\-,]+\d{2,4}"
+    r"|(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(st|nd|rd|th)?,?\s+\d{4}",
+    re.IGNORECASE
+)
+
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "INR", "AUD", "CAD", "JPY", "CHF", "CNY", "SGD",
+    "AED", "NZD", "ZAR", "SEK", "NOK", "DKK", "HKD", "SAR", "MYR", "PLN",
+}
+CURRENCY_SYMBOLS = {"€": "EUR", "£": "GBP", "₹": "INR", "¥": "JPY"}
+
+TABLE_COLUMNS = {
+    "description": r"description|item|product|particulars|details|service",
+    "quantity": r"qty|quantity|units|hrs|hours",
+    "unit_price": r"unit\s*(price|cost)|price|rate",
+    "line_total": r"amount|line\s*total|total|net",
+}
+
+# Fields that may legitimately be missing from an invoice
+OPTIONAL_FIELDS = {
+    "due_date", "purchase_order_number", "payment_terms", "other_references",
+    "supplier.tax_id", "customer.tax_id", "subtotal", "tax_amount",
+}
+
+# Loose words searched anywhere in the text. A missed optional field only
+# counts as absent when none of them occur ("Payment Due:" is not matched
+# by the due_date label, but does hint that a due date is there)
+ABSENCE_HINTS = {
+    "due_date": r"\bdue\b|\bpay(able)?\s+(by|before|until)\b",
+    "purchase_order_number": r"\bp\.?\s*o\b\.?|purchase\s+order|\border\s*(no|number|#|ref)",
+    "payment_terms": r"\bterms?\b|\bnet\s*\d+\b|\bdays?\b",
+    "other_references": r"\bref(erence|\.)?s?\b|\b(contract|project|job|order|delivery|shipment|account)\s*"
+                        r"(no\b|number|#|id\b)",
+    "supplier.tax_id": r"\b(vat|gst|gstin|tax|trn|tin|ein|abn|uid|pan)\b",
+    "customer.tax_id": r"\b(vat|gst|gstin|tax|trn|tin|ein|abn|uid|pan)\b",
+    "subtotal": r"sub[\s-]?total|\bnet\b|\bexcl",
+    "tax_amount": r"\b(tax|vat|gst|igst|cgst|sgst|hst|pst)\b",
+}
+ABSENCE_HINT_RES = {path: re.compile(p, re.IGNORECASE) for path, p in ABSENCE_HINTS.items()}
+
+
+# ---------------------------------------------------------------------
+# Layout: text segments with coordinates, grouped into visual rows
+# ---------------------------------------------------------------------
+def layout_rows(pdf: PdfDocument):
+    """Rows of {text, x0, x1, size} segments per "text" page, top to bottom."""
+    rows = []
+
+    for page_index in pdf.pages_with_action("text"):
+        segments = []
+        for block in pdf.page_dict(page_index)["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                text = " ".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                x0, y0, x1, y1 = line["bbox"]
+                segments.append({
+                    "text": re.sub(r"\s+", " ", text),
+                    "x0": x0, "x1": x1, "y": (y0 + y1) / 2, "h": y1 - y0,
+                    "size": max(span["size"] for span in line["spans"]),
+                })
+
+        segments.sort(key=lambda s: (s["y"], s["x0"]))
+        for seg in segments:
+            if rows and rows[-1]["page"] == page_index and abs(rows[-1]["y"] - seg["y"]) <= ROW_TOLERANCE:
+                rows[-1]["segments"].append(seg)
+            else:
+                rows.append({"page": page_index, "y": seg["y"], "segments": [seg]})
+
+    for row in rows:
+        row["segments"].sort(key=lambda s: s["x0"])
+        row["text"] = "  ".join(s["text"] for s in row["segments"])
+
+    return rows
+
+
+def parse_amount(text: str):
+    text = (text or "").strip()
+    match = AMOUNT_RE.match(text)
+    if not match:
+        return None
+
+    negative = text.startswith(("(", "-")) or "-" in text[:match.start(1)]
+    digits = match.group(1).replace("'", "").rstrip(",.")
+
+    # "1.234,56" / "1,234.56" / "1234,56": the last separator followed by
+    # 1-2 digits is the decimal point
+    last = max(digits.rfind(","), digits.rfind("."))
+    if last != -1 and len(digits) - last - 1 in (1, 2):
+        number = re.sub(r"[,.]", "", digits[:last]) + "." + digits[last + 1:]
+    else:
+        number = re.sub(r"[,.]", "", digits)
+
+    try:
+        value = float(number)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def parse_value(field: str, text: str):
+    text = (text or "").strip(" :#-")
+    if not text:
+        return None
+
+    if field in ("invoice_date", "due_date"):
+        match = DATE_RE.search(text)
+        return match.group(0) if match else None
+
+    if field in ("subtotal", "tax_amount", "total_amount"):
+        return parse_amount(text)
+
+    if field in ("invoice_number", "purchase_order_number", "tax_id"):
+        token = text.split()[0].strip(".,;")
+        if field == "tax_id" and len(token) < 6:
+            return None
+        return token if ID_RE.match(token) else None
+
+    if field == "payment_terms":
+        return text if len(text) <= 120 else None
+
+    return text
+
+
+def rows_below(rows, index, seg, limit=1):
+    """Segments directly below `seg` (overlapping it horizontally)."""
+    found = []
+    for row in rows[index + 1:]:
+        if row["page"] != rows[index]["page"]:
+            break
+        for other in row["segments"]:
+            if other["x0"] < seg["x1"] and other["x1"] > seg["x0"]:
+                found.append((row, other))
+                break
+        if len(found) >= limit:
+            break
+    return found
+
+
+def any_label(text: str) -> bool:
+    return any(r.match(text) for r in LABEL_RES.values()) or bool(
+        CUSTOMER_RE.match(text) or SUPPLIER_RE.match(text)
+    )
+
+
+# ---------------------------------------------------------------------
+# label: value lookup
+# ---------------------------------------------------------------------
+def find_labelled(rows, field: str):
+    """
+    Candidates (value, confidence, row index) for `field`:
+    value after the label in the same segment (0.95), in the next segment
+    of the row (0.9) or right below the label (0.8).
+    """
+    label_re = LABEL_RES[field]
+    candidates = []
+
+    for i, row in enumerate(rows):
+        # "Total" / "Tax" column headers are not labels
+        if classify_header(row):
+            continue
+
+        for k, seg in enumerate(row["segments"]):
+            match = label_re.match(seg["text"])
+            if not match:
+                continue
+
+            value = parse_value(field, seg["text"][match.end():])
+            if value is not None:
+                candidates.append((value, 0.95, i))
+                continue
+
+            if k + 1 < len(row["segments"]):
+                value = parse_value(field, row["segments"][k + 1]["text"])
+                if value is not None:
+                    candidates.append((value, 0.9, i))
+                    continue
+
+            for below_row, below in rows_below(rows, i, seg):
+                value = parse_value(field, below["text"])
+                if value is not None and not any_label(below["text"]):
+                    candidates.append((value, 0.8, i))
+
+    return candidates
+
+
+def pick(candidates, last: bool = False):
+    """Best candidate; disagreeing candidates lower the confidence."""
+    if not candidates:
+        return None, 0.0, None
+
+    ordered = candidates[::-1] if last else candidates
+    value, confidence, index = max(ordered, key=lambda c: c[1])
+
+    if len({str(c[0]) for c in candidates}) > 1:
+        confidence *= 0.7
+    return value, confidence, index
+
+
+# ---------------------------------------------------------------------
+# Parties: "Bill to" / "From" blocks, supplier as the biggest header text
+# ---------------------------------------------------------------------
+def party_block(rows, index, seg, rest: str):
+    name = rest.strip() or None
+    address = []
+
+    previous_y = rows[index]["y"]
+    for row, below in rows_below(rows, index, seg, limit=6):
+        # A label, the table header or a blank gap ends the block
+        if any_label(below["text"]) or classify_header(row):
+            break
+        if row["y"] - previous_y > below["h"] * 2.5:
+            break
+        previous_y = row["y"]
+
+        if name is None:
+            name = below["text"]
+        else:
+            address.append(below["text"])
+        if len(address) >= 4:
+            break
+
+    return name, ", ".join(address) or None
+
+
+def find_party(rows, label_re):
+    for i, row in enumerate(rows):
+        for seg in row["segments"]:
+            match = label_re.match(seg["text"])
+            if match:
+                name, address = party_block(rows, i, seg, seg["text"][match.end():])
+                return name, address, i
+    return None, None, None
+
+
+def find_supplier_header(rows):
+    first_page = [r for r in rows if r["page"] == rows[0]["page"]] if rows else []
+    if not first_page:
+        return None, None, 0.0
+
+    page_bottom = max(r["y"] for r in first_page) or 1
+    sizes = [s["size"] for r in first_page for s in r["segments"]]
+    median = statistics.median(sizes)
+
+    top = [
+        (seg["size"], i, seg)
+        for i, row in enumerate(first_page)
+        if row["y"] <= page_bottom * 0.3
+        for seg in row["segments"]
+        if not re.search(r"\binvoice\b|\breceipt\b|\bbill\b", seg["text"], re.IGNORECASE)
+        and not any_label(seg["text"])
+    ]
+    if not top:
+        return None, None, 0.0
+
+    top.sort(key=lambda t: -t[0])
+    size, index, seg = top[0]
+    unique = len(top) == 1 or top[1][0] < size
+    confidence = 0.85 if size >= median * 1.3 and unique else 0.5
+
+    _, address = party_block(first_page, index, seg, seg["text"])
+    return seg["text"], address, confidence
+
+
+# ---------------------------------------------------------------------
+# Line items from an aligned table (header row → rows until totals)
+# ---------------------------------------------------------------------
+def classify_header(row):
+    columns = {}
+    for seg in row["segments"]:
+        for column, pattern in TABLE_COLUMNS.items():
+            if column not in columns and re.fullmatch(rf"\s*({pattern})\b.*", seg["text"], re.IGNORECASE):
+                columns[column] = seg
+                break
+    if "description" in columns and len(columns) >= 3:
+        return columns
+    return None
+
+
+def find_line_items(rows):
+    items = []
+    columns = None
+    page = None
+
+    for row in rows:
+        if row["page"] != page:
+            columns, page = None, row["page"]
+
+        header = classify_header(row)
+        if header:
+            columns = header
+            continue
+        if columns is None:
+            continue
+
+        # "Subtotal" / "Total: 330.00" ends the table, "Tax consulting" does not
+        first = row["segments"][0]["text"]
+        for f in ("subtotal", "tax_amount", "total_amount"):
+            match = LABEL_RES[f].match(first)
+            rest = first[match.end():].strip() if match else None
+            if match and (not rest or parse_amount(rest) is not None):
+                columns = None
+                break
+        if columns is None:
+            continue
+
+        cells = {}
+        for seg in row["segments"]:
+            center = (seg["x0"] + seg["x1"]) / 2
+            column = min(
+                columns,
+                key=lambda c: 0 if columns[c]["x0"] <= center <= columns[c]["x1"]
+                else min(abs(center - columns[c]["x0"]), abs(center - columns[c]["x1"]))
+            )
+            cells[column] = (cells.get(column, "") + " " + seg["text"]).strip()
+
+        numbers = {c: parse_amount(cells.get(c)) for c in ("quantity", "unit_price", "line_total")}
+
+        if cells.get("description") and all(v is None for v in numbers.values()):
+            # Wrapped description line
+            if items:
+                items[-1]["description"] += " " + cells["description"]
+            continue
+
+        if numbers["line_total"] is None:
+            continue
+
+        items.append({
+            "description": cells.get("description"),
+            "quantity": numbers["quantity"],
+            "unit_price": numbers["unit_price"],
+            "line_total": numbers["line_total"],
+        })
+
+    return items
+
+
+def close(a, b) -> bool:
+    return a is not None and b is not None and abs(a - b) <= max(0.02, abs(b) * 0.005)
+
+
+# ---------------------------------------------------------------------
+# Currency from ISO codes / unambiguous symbols anywhere in the text
+# ---------------------------------------------------------------------
+def find_currency(text: str):
+    codes = set(re.findall(r"\b[A-Z]{3}\b", text)) & CURRENCY_CODES
+    codes |= {code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text}
+
+    if "$" in text and not codes:
+        return "USD", 0.7
+    if len(codes) == 1:
+        return codes.pop(), 0.95
+    if codes:
+        return sorted(codes)[0], 0.5
+    return None, 0.5
+
+
+# ---------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------
+def rule_extract(pdf: PdfDocument):
+    """
+    Fill the invoice schema (pipeline_builder.SYSTEM_PROMPT) from text
+    layout alone. Returns {"invoice": {...}, "confidence": {path: 0..1}};
+    paths are top-level keys or "supplier.name"-style for party fields.
+    """
+    rows = layout_rows(pdf)
+    text = "\n".join(r["text"] for r in rows)
+
+    invoice = {
+        "supplier": {"name": None, "address": None, "tax_id": None},
+        "customer": {"name": None, "address": None, "tax_id": None},
+    }
+    confidence = {}
+
+    def put(path, value, conf):
+        if "." in path:
+            parent, key = path.split(".")
+            invoice[parent][key] = value
+        else:
+            invoice[path] = value
+        # Only a field with no hint anywhere in the text is confidently absent
+        hint = ABSENCE_HINT_RES.get(path)
+        if value is None and path in OPTIONAL_FIELDS and conf == 0.0 and hint and not hint.search(text):
+            conf = ABSENT_FIELD_CONFIDENCE
+        confidence[path] = round(conf, 3)
+
+    # Simple label: value fields
+    for field in ("invoice_number", "invoice_date", "due_date", "purchase_order_number", "payment_terms"):
+        value, conf, _ = pick(find_labelled(rows, field))
+        put(field, value, conf)
+
+    # Totals are printed last; prefer the last occurrence
+    totals = {}
+    for field in ("subtotal", "tax_amount", "total_amount"):
+        value, conf, _ = pick(find_labelled(rows, field), last=True)
+        totals[field] = [value, conf]
+
+    currency, conf = find_currency(text)
+    put("currency", currency, conf)
+
+    # Parties
+    name, address, index = find_party(rows, CUSTOMER_RE)
+    put("customer.name", name, 0.85 if name else 0.5)
+    put("customer.address", address, 0.85 if address else (0.5 if name else 0.0))
+
+    name, address, _ = find_party(rows, SUPPLIER_RE)
+    if name:
+        put("supplier.name", name, 0.85)
+        put("supplier.address", address, 0.85 if address else 0.5)
+    else:
+        name, address, conf = find_supplier_header(rows)
+        put("supplier.name", name, conf)
+        put("supplier.address", address, min(conf, 0.8) if address else 0.0)
+
+    # Tax ids: the one after the customer label belongs to the customer
+    tax_ids = find_labelled(rows, "tax_id")
+    customer_ids = [c for c in tax_ids if index is not None and c[2] > index]
+    supplier_ids = [c for c in tax_ids if c not in customer_ids]
+    for path, found in (("supplier.tax_id", supplier_ids), ("customer.tax_id", customer_ids)):
+        value, conf, _ = pick(found)
+        put(path, value, conf * (0.9 if len(tax_ids) > 1 else 1.0))
+
+    # Line items + arithmetic cross-checks
+    items = find_line_items(rows)
+    items_conf = 0.0
+    if items:
+        consistent = all(
+            close(i["quantity"] * i["unit_price"], i["line_total"])
+            for i in items if i["quantity"] is not None and i["unit_price"] is not None
+        )
+        items_conf = 0.85 if consistent else 0.5
+
+    subtotal, tax, total = (totals[f][0] for f in ("subtotal", "tax_amount", "total_amount"))
+    items_sum = sum(i["line_total"] for i in items) if items else None
+
+    if close((subtotal or 0) + (tax or 0), total) and (subtotal is not None or tax is not None):
+        for field in totals:
+            if totals[field][0] is not None:
+                totals[field][1] = max(totals[field][1], 0.97)
+    elif subtotal is not None and total is not None:
+        for field in totals:
+            totals[field][1] = min(totals[field][1], 0.5)
+
+    if close(items_sum, subtotal if subtotal is not None else total):
+        items_conf = max(items_conf, 0.95)
+        if subtotal is None and total is not None:
+            totals["total_amount"][1] = max(totals["total_amount"][1], 0.95)
+
+    for field, (value, conf) in totals.items():
+        put(field, value, conf)
+    put("line_items", items or None, items_conf)
+
+    # Not extracted by rules; skips the LLM only when nothing looks like a reference
+    put("other_references", None, 0.0)
+
+    return {
+        "invoice": {field: invoice.get(field) for field in INVOICE_FIELDS},
+        "confidence": confidence,
+    }
+
+
+def low_confidence_fields(confidence: dict, threshold: float = FAST_PATH_MIN_CONFIDENCE):
+    """Top-level invoice keys with at least one path below `threshold`."""
+    fields = []
+    for path, conf in confidence.items():
+        top = path.split(".")[0]
+        if conf < threshold and top not in fields:
+            fields.append(top)
+    return fields
+
+
+def llm_paths(invoice: dict, llm_result: dict, confidence: dict,
+              threshold: float = FAST_PATH_MIN_CONFIDENCE):
+    """Paths ("total_amount", "supplier.name") merge_fast_path takes from the LLM."""
+    paths = []
+
+    for field, value in (llm_result or {}).items():
+        if field not in invoice:
+            continue
+
+        if isinstance(invoice[field], dict) and isinstance(value, dict):
+            for key in value:
+                if confidence.get(f"{field}.{key}", 0.0) < threshold or invoice[field].get(key) is None:
+                    paths.append(f"{field}.{key}")
+        elif confidence.get(field, 0.0) < threshold or invoice[field] is None:
+            paths.append(field)
+
+    return paths
+
+
+def merge_fast_path(invoice: dict, llm_result: dict, confidence: dict,
+                    threshold: float = FAST_PATH_MIN_CONFIDENCE):
+    """Rule values where confident, LLM values for the rest."""
+    merged = {field: dict(v) if isinstance(v, dict) else v for field, v in invoice.items()}
+
+    for path in llm_paths(invoice, llm_result, confidence, threshold):
+        field, _, key = path.partition(".")
+        if key:
+            merged[field][key] = llm_result[field][key]
+        else:
+            merged[field] = llm_result[field]
+
+    return merged
@@ -0,0 +1,257 @@
+"""
+In-process counters, gauges and histograms rendered in the Prometheus
+text exposition format (GET /metrics).
+
+Recording is a dict lookup and an add under a per-metric lock, cheap
+enough for every request and LLM call. Pool workers have their own
+memory: what they measure comes back in `prepared` and is recorded here.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+THROUGHPUT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50)
+
+REGISTRY = []
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key: tuple, extra=()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        """Yields (name suffix, label text, value)."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", self._label_text(key), value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """+1 while the block runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [per-bucket counts (last one is +Inf), sum]
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", self._label_text(key, [("le", format_value(bound))]), cumulative
+            yield "_sum", self._label_text(key), total
+            yield "_count", self._label_text(key), cumulative
+
+
+# ---------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "idp_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "idp_http_requests_in_flight", "HTTP requests currently being served."
+)
+EXTRACTIONS_IN_FLIGHT = Gauge(
+    "idp_extractions_in_flight", "Documents currently being extracted.", ("pipeline",)
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "idp_llm_request_duration_seconds", "OpenRouter call latency per attempt (streams until the last token).",
+    ("model", "status"),
+)
+LLM_REQUESTS = Counter(
+    "idp_llm_requests_total", "OpenRouter calls per attempt by HTTP status (0 = transport error).",
+    ("model", "status"),
+)
+OCR_PAGES = Counter(
+    "idp_ocr_pages_total", "Pages OCR-ed.", ("engine",)
+)
+OCR_SECONDS = Counter(
+    "idp_ocr_seconds_total", "Seconds spent OCR-ing; pages/sec = rate(pages) / rate(seconds).", ("engine",)
+)
+OCR_PAGES_PER_SECOND = Histogram(
+    "idp_ocr_pages_per_second", "OCR throughput per document.", ("engine",), buckets=THROUGHPUT_BUCKETS
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "idp_embedding_batch_size", "Texts embedded per call.", ("store",), buckets=SIZE_BUCKETS
+)
+GRIDFS_BYTES = Counter(
+    "idp_gridfs_bytes_total", "Bytes written to (in) and read from (out) GridFS.", ("direction",)
+)
+CACHE_LOOKUPS = Counter(
+    "idp_cache_lookups_total", "Cache lookups by result (hit/miss).", ("cache", "result")
+)
+CACHE_HIT_RATIO = Gauge(
+    "idp_cache_hit_ratio", "Hits / lookups since process start.", ("cache",)
+)
+
+
+def record_ocr(engine: str, pages: int, seconds: float):
+    if not pages:
+        return
+    OCR_PAGES.inc(pages, engine=engine)
+    OCR_SECONDS.inc(seconds, engine=engine)
+    if seconds > 0:
+        OCR_PAGES_PER_SECOND.observe(pages / seconds, engine=engine)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    # Ratios are derived from the lookup counters at scrape time
+    lookups = {}
+    for (cache, result), count in CACHE_LOOKUPS.values().items():
+        hits, total = lookups.get(cache, (0, 0))
+        lookups[cache] = (hits + (count if result == "hit" else 0), total + count)
+    for cache, (hits, total) in lookups.items():
+        CACHE_HIT_RATIO.set(round(hits / total, 4) if total else 0.0, cache=cache)
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------
+# Request latency per route template (pure ASGI, works with streaming)
+# ---------------------------------------------------------------------
+class RequestMetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route_template(scope, root_path),
+                status=status,
+            )
+
+
+def route_template(scope, root_path: str) -> str:
+    # Set by the router on match; templates keep the label count bounded
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+
+    # Mounted apps (e.g. /dashboard) extend root_path
+    mounted = scope.get("root_path", "")[len(root_path):]
+    return mounted or "unmatched"
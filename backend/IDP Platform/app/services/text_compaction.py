@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+
+COMPACTION_ENABLED = os.getenv("COMPACTION_ENABLED", "true").lower() == "true"
+
+# Only the first/last lines of a page are treated as header/footer candidates
+HEADER_FOOTER_LINES = int(os.getenv("COMPACTION_HEADER_FOOTER_LINES", "5"))
+# A candidate line is "repeated" when it is on at least this share of pages
+REPEAT_MIN_SHARE = float(os.getenv("COMPACTION_REPEAT_MIN_SHARE", "0.5"))
+
+# Rough chars-per-token for invoice text with the models we use
+CHARS_PER_TOKEN = 4
+
+# Page markers; only matched on the first/last line of a page
+PAGE_MARKER_PATTERNS = [
+    r"^(page|pg\.?)\s*\d+(\s*(of|/)\s*\d+)?$",
+    r"^\d+\s*/\s*\d+$",
+]
+# A bare number ("3", "- 3 -") is a quantity or a table cell as often as a
+# page number; it is only dropped when it counts up with the pages
+BARE_NUMBER_PATTERN = r"^-?\s*(\d+)\s*-?$"
+
+# Lines with money/amounts are never deduplicated: running totals and
+# "carried forward" lines look alike from page to page
+AMOUNT_PATTERN = r"\d[\d,.' ]*[.,]\d{2}\b|[$€£¥₹]\s*\d"
+
+# Lines that never carry invoice data. Extra patterns can be added with
+# COMPACTION_BOILERPLATE_PATTERNS='["^confidential$", ...]'
+BOILERPLATE_PATTERNS = [
+    r"^\(?continued( on next page)?\.*\)?$",
+    r"^this is a (computer|system)[- ]generated (invoice|document|bill)\b.*$",
+    r"^(no|does not require( a)?) signature( is)? required\.?$",
+    r"^thank you for (your business|shopping with us|your order)[.!]*$",
+    r"^e\.?\s*&\s*o\.?\s*e\.?$",
+    r"^subject to .{0,40} jurisdiction\.?$",
+] + json.loads(os.getenv("COMPACTION_BOILERPLATE_PATTERNS", "[]"))
+
+
+def _any_of(patterns):
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+_PAGE_MARKER_RE = _any_of(PAGE_MARKER_PATTERNS)
+_BOILERPLATE_RE = _any_of(BOILERPLATE_PATTERNS)
+_BARE_NUMBER_RE = re.compile(BARE_NUMBER_PATTERN)
+_AMOUNT_RE = re.compile(AMOUNT_PATTERN)
+_SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def is_boilerplate(line: str, outermost: bool = False) -> bool:
+    if outermost and _PAGE_MARKER_RE.match(line):
+        return True
+    return bool(_BOILERPLATE_RE.match(line))
+
+
+def _collapse_lines(text: str) -> list:
+    """Whitespace runs → one space, blank-line runs → one blank line."""
+    lines = []
+    for raw in text.splitlines():
+        line = _SPACES_RE.sub(" ", raw).strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _repeat_key(line: str):
+    """Exact (normalised) text; None for lines that must never be collapsed."""
+    if _AMOUNT_RE.search(line) or _BARE_NUMBER_RE.match(line):
+        return None
+    return line.lower()
+
+
+def _edge_lines(lines: list) -> set:
+    content = [l for l in lines if l]
+    return set(content[:HEADER_FOOTER_LINES] + content[-HEADER_FOOTER_LINES:])
+
+
+def _outermost_lines(lines: list) -> set:
+    content = [l for l in lines if l]
+    return {content[0], content[-1]} if content else set()
+
+
+def _page_number_offsets(page_lines: list, min_pages: int) -> set:
+    """
+    Offsets (number - page index) shared by bare numbers on the first/last
+    line of at least min_pages pages, i.e. numbers that count with the pages.
+    """
+    offsets = Counter()
+    for index, lines in enumerate(page_lines):
+        page_offsets = set()
+        for line in _outermost_lines(lines):
+            match = _BARE_NUMBER_RE.match(line)
+            if match:
+                page_offsets.add(int(match.group(1)) - index)
+        offsets.update(page_offsets)
+    return {offset for offset, n in offsets.items() if n >= min_pages}
+
+
+def _is_page_number(line: str, index: int, offsets: set) -> bool:
+    match = _BARE_NUMBER_RE.match(line)
+    return bool(match) and int(match.group(1)) - index in offsets
+
+
+# ---------------------------------------------------------------------
+# Compact the pages of one document before they are sent to the LLM
+# ---------------------------------------------------------------------
+def compact_pages(pages: list):
+    """
+    Returns (compacted page texts, stats). Empty pages are kept as "" so
+    page positions do not shift.
+
+    - whitespace runs and blank-line runs are collapsed
+    - known boilerplate lines ("continued", ...) are dropped, and so are
+      page markers on the first/last line of a page (bare numbers only
+      when they count up with the pages)
+    - header/footer lines repeated verbatim across pages are kept only the
+      first time they appear; lines with amounts are always kept
+    """
+    tokens_before = sum(estimate_tokens(p) for p in pages)
+
+    if not COMPACTION_ENABLED:
+        return list(pages), {
+            "enabled": False,
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_before,
+        }
+
+    page_lines = [_collapse_lines(p or "") for p in pages]
+
+    repeated = set()
+    page_offsets = set()
+    non_empty = sum(1 for lines in page_lines if lines)
+    if non_empty >= 2:
+        counts = Counter()
+        for lines in page_lines:
+            counts.update({_repeat_key(l) for l in _edge_lines(lines)} - {None})
+
+        min_pages = max(2, math.ceil(non_empty * REPEAT_MIN_SHARE))
+        repeated = {key for key, n in counts.items() if n >= min_pages}
+        page_offsets = _page_number_offsets(page_lines, min_pages)
+
+    seen = set()
+    removed_repeated = removed_boilerplate = 0
+    compacted = []
+
+    for index, lines in enumerate(page_lines):
+        edges = _edge_lines(lines)
+        outermost = _outermost_lines(lines)
+        kept = []
+
+        for line in lines:
+            if not line:
+                if kept and kept[-1]:
+                    kept.append(line)
+                continue
+
+            is_outermost = line in outermost
+            if is_boilerplate(line, outermost=is_outermost) or (
+                is_outermost and _is_page_number(line, index, page_offsets)
+            ):
+                removed_boilerplate += 1
+                continue
+
+            key = _repeat_key(line)
+            if key in repeated and line in edges:
+                if key in seen:
+                    removed_repeated += 1
+                    continue
+                seen.add(key)
+
+            kept.append(line)
+
+        compacted.append("\n".join(kept).strip())
+
+    tokens_after = sum(estimate_tokens(p) for p in compacted)
+
+    return compacted, {
+        "enabled": True,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "saved_ratio": round(1 - tokens_after / tokens_before, 3) if tokens_before else 0.0,
+        "repeated_lines_removed": removed_repeated,
+        "boilerplate_lines_removed": removed_boilerplate,
+    }
+
+
+def compact_text(pages: list, separator: str = "\n"):
+    """compact_pages() joined into one prompt text, skipping empty pages."""
+    compacted, stats = compact_pages(pages)
+    return separator.join(p for p in compacted if p), stats
+
+
+def log_compaction(name: str, stats: dict):
+    if stats.get("enabled"):
+        print(f"✂️ {name}: {stats['tokens_before']} → {stats['tokens_after']} tokens "
+              f"(-{stats['saved_ratio'] * 100:.0f}%, {stats['repeated_lines_removed']} repeated, "
+              f"{stats['boilerplate_lines_removed']} boilerplate lines)")
@@ -0,0 +1,69 @@
+import math
+import time
+from contextlib import contextmanager
+
+# Percentiles reported by the timings endpoint
+TIMING_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class StageTimer:
+    """
+    Wall-clock seconds per pipeline stage of one document.
+
+    Stages timed more than once (several LLM calls, OCR batches) add up.
+    Timings measured in a pool worker come back as a plain dict and are
+    merged in. Persisted as the `timings` sub-document of pdf_files /
+    extractions: {"total": s, "<stage>": s, ...}.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, stages: dict):
+        for stage, seconds in (stages or {}).items():
+            self.add(stage, seconds)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def as_dict(self) -> dict:
+        return {
+            "total": round(time.perf_counter() - self.started, 4),
+            **{stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+        }
+
+
+def percentile(values: list, share: float):
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def stage_percentiles(timings: list) -> dict:
+    """Per-stage count, mean and percentiles over a list of `timings` dicts."""
+    by_stage = {}
+    for record in timings:
+        for stage, seconds in (record or {}).items():
+            if isinstance(seconds, (int, float)):
+                by_stage.setdefault(stage, []).append(seconds)
+
+    stats = {}
+    for stage, values in sorted(by_stage.items()):
+        values.sort()
+        stats[stage] = {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 4),
+            **{f"p{round(p * 100)}": round(percentile(values, p), 4) for p in TIMING_PERCENTILES},
+            "max": round(values[-1], 4),
+        }
+    return stats
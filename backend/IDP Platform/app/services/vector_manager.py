@@ -1,7 +1,3 @@
-from app.services.qdrant_service import QdrantVector
-from app.services.chroma_service import ChromaVector
-from app.services.faiss_service import FaissVector
-
 class VectorManager:
 
     def __init__(self):
@@ -12,13 +8,17 @@ class VectorManager:
 
         provider = provider.lower()
 
+        # Backends are imported on demand (chromadb / faiss are slow to import)
         if provider == "qdrant":
+            from app.services.qdrant_service import QdrantVector
             self.engine = QdrantVector(**kwargs)
 
         elif provider == "chroma":
+            from app.services.chroma_service import ChromaVector
             self.engine = ChromaVector(**kwargs)
 
         elif provider == "faiss":
+            from app.services.faiss_service import FaissVector
             self.engine = FaissVector(**kwargs)
 
         else:
@@ -0,0 +1,66 @@
+import os
+import time
+import asyncio
+import traceback
+
+from app.services.cpu_pool import warm_process_pool, process_pool_warm
+from app.services.pipeline_builder import get_qdrant_client, qdrant_loaded
+from app.services.embedding_service import get_embedding_service, embedding_loaded
+
+# Engines warmed in the background at startup, e.g. "ocr_workers,qdrant_fastembed"
+WARMUP_ENGINES = [e for e in os.getenv("WARMUP_ENGINES", "").split(",") if e.strip()]
+
+# Engines that must be warm before /ready reports ready
+READINESS_ENGINES = [e for e in os.getenv("READINESS_ENGINES", "").split(",") if e.strip()]
+
+# name → (blocking loader, "is it loaded?" check)
+ENGINES = {
+    "ocr_workers": (warm_process_pool, process_pool_warm),
+    "qdrant_fastembed": (get_qdrant_client, qdrant_loaded),
+    "embedding_model": (get_embedding_service, embedding_loaded),
+}
+
+_warmup_state = {}
+
+
+async def warm_up(names=None):
+    """Load the given engines one after another in a worker thread."""
+    for name in names or WARMUP_ENGINES:
+        name = name.strip()
+        if name not in ENGINES:
+            print(f"Unknown warm-up engine: {name}")
+            continue
+
+        loader, _ = ENGINES[name]
+        _warmup_state[name] = {"status": "warming"}
+        started = time.perf_counter()
+
+        try:
+            await asyncio.to_thread(loader)
+            _warmup_state[name] = {
+                "status": "ready",
+                "seconds": round(time.perf_counter() - started, 2),
+            }
+        except Exception as e:
+            traceback.print_exc()
+            _warmup_state[name] = {"status": "failed", "error": str(e)}
+
+
+def engine_status():
+    """Per-engine state: ready (loaded by warm-up or first use), warming, failed or cold."""
+    status = {}
+    for name, (_, is_loaded) in ENGINES.items():
+        state = dict(_warmup_state.get(name, {"status": "cold"}))
+        if is_loaded():
+            state["status"] = "ready"
+        status[name] = state
+    return status
+
+
+def readiness():
+    engines = engine_status()
+    waiting = [
+        name.strip() for name in READINESS_ENGINES
+        if engines.get(name.strip(), {}).get("status") != "ready"
+    ]
+    return not waiting, {"ready": not waiting, "waiting_for": waiting, "engines": engines}
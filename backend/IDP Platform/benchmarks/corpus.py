@@ -0,0 +1,139 @@
+"""
+Synthetic invoice PDFs for the benchmarks, generated with PyMuPDF.
+
+Every document is a multi-page invoice: supplier header, invoice
+number/date, bill-to block, a line-item table continued across pages,
+totals on the last page, and a running header/footer on every page.
+Kinds:
+
+    text     embedded text on every page
+    scanned  every page rendered to an image (no fonts → OCR path)
+    mixed    odd pages scanned, even pages text
+
+Generation is deterministic for a given (kind, pages, seed).
+"""
+import random
+
+import fitz  # PyMuPDF
+
+KINDS = ("text", "scanned", "mixed")
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+SCAN_DPI = 120
+ROW_HEIGHT = 16
+TABLE_COLUMNS = (("Description", 50), ("Qty", 330), ("Unit Price", 390), ("Amount", 480))
+
+SUPPLIERS = ("Acme Supplies Ltd", "Northwind Traders", "Globex Industrial GmbH", "Initech Services LLC")
+CUSTOMERS = ("Umbrella Retail Inc", "Stark Logistics", "Wayne Facilities Co", "Tyrell Components")
+PRODUCTS = (
+    "Steel brackets 40mm", "Installation labour", "Cable tray section", "Maintenance visit",
+    "Safety gloves (box)", "Hydraulic pump service", "LED panel 60x60", "Consulting hours",
+)
+
+
+def invoice_data(pages: int, seed: int = 0):
+    rng = random.Random(f"{pages}-{seed}")
+    rows_per_page = (PAGE_HEIGHT - 420) // ROW_HEIGHT
+
+    items = []
+    for _ in range(rows_per_page * pages - 3):
+        quantity = rng.randint(1, 40)
+        unit_price = round(rng.uniform(2, 900), 2)
+        items.append({
+            "description": rng.choice(PRODUCTS),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "line_total": round(quantity * unit_price, 2),
+        })
+
+    subtotal = round(sum(i["line_total"] for i in items), 2)
+    tax = round(subtotal * 0.2, 2)
+    return {
+        "invoice_number": f"INV-{rng.randint(10000, 99999)}",
+        "invoice_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "supplier": rng.choice(SUPPLIERS),
+        "customer": rng.choice(CUSTOMERS),
+        "items": items,
+        "rows_per_page": rows_per_page,
+        "subtotal": subtotal,
+        "tax_amount": tax,
+        "total_amount": round(subtotal + tax, 2),
+    }
+
+
+def draw_page(page, data: dict, page_no: int, pages: int):
+    """Draw one invoice page as embedded text."""
+    # Running header / footer (repeated on every page)
+    page.insert_text((50, 30), f"{data['supplier']} — Invoice {data['invoice_number']}", fontsize=8)
+    page.insert_text((50, PAGE_HEIGHT - 25), f"Page {page_no + 1} of {pages}", fontsize=8)
+
+    y = 60
+    if page_no == 0:
+        page.insert_text((50, y + 20), data["supplier"], fontsize=20)
+        page.insert_text((50, y + 40), "1 Market Street, Springfield", fontsize=10)
+        page.insert_text((360, y + 20), "INVOICE", fontsize=18)
+        page.insert_text((360, y + 45), f"Invoice No: {data['invoice_number']}", fontsize=10)
+        page.insert_text((360, y + 60), f"Invoice Date: {data['invoice_date']}", fontsize=10)
+        page.insert_text((50, y + 90), "Bill To:", fontsize=10)
+        page.insert_text((50, y + 105), data["customer"], fontsize=10)
+        page.insert_text((50, y + 120), "42 Elm Road, Shelbyville", fontsize=10)
+    y = 220
+
+    # Line-item table
+    for title, x in TABLE_COLUMNS:
+        page.insert_text((x, y), title, fontsize=10)
+    page.draw_line((45, y + 5), (PAGE_WIDTH - 45, y + 5))
+
+    per_page = data["rows_per_page"]
+    for item in data["items"][page_no * per_page:(page_no + 1) * per_page]:
+        y += ROW_HEIGHT
+        cells = (item["description"], str(item["quantity"]),
+                 f"{item['unit_price']:,.2f}", f"{item['line_total']:,.2f}")
+        for (_, x), cell in zip(TABLE_COLUMNS, cells):
+            page.insert_text((x, y), cell, fontsize=9)
+
+    if page_no == pages - 1:
+        y += 2 * ROW_HEIGHT
+        for label, value in (("Subtotal", data["subtotal"]), ("Tax (20%)", data["tax_amount"]),
+                             ("Total", data["total_amount"])):
+            page.insert_text((390, y), f"{label}: {value:,.2f}", fontsize=10)
+            y += ROW_HEIGHT
+
+
+def scan_page(doc, text_page):
+    """Replace a text page with an image of itself (no fonts left)."""
+    pix = text_page.get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY)
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_image(page.rect, pixmap=pix)
+    return page
+
+
+def make_invoice(kind: str, pages: int, seed: int = 0) -> bytes:
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}, expected one of {KINDS}")
+
+    data = invoice_data(pages, seed)
+    doc = fitz.open()
+    scratch = fitz.open()
+
+    for page_no in range(pages):
+        scanned = kind == "scanned" or (kind == "mixed" and page_no % 2 == 1)
+        if not scanned:
+            draw_page(doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT), data, page_no, pages)
+            continue
+
+        text_page = scratch.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        draw_page(text_page, data, page_no, pages)
+        scan_page(doc, text_page)
+
+    pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    scratch.close()
+    return pdf_bytes
+
+
+def corpus(kinds=KINDS, page_counts=(1, 10, 50, 200), seed: int = 0):
+    """Yields (name, kind, pages, pdf_bytes) for every kind × page count."""
+    for kind in kinds:
+        for pages in page_counts:
+            yield f"{kind}-{pages}p", kind, pages, make_invoice(kind, pages, seed)
@@ -0,0 +1,366 @@
+"""
+Per-stage benchmarks of the extraction pipeline on a synthetic corpus
+(benchmarks/corpus.py).
+
+Stages, each timed on a freshly opened document (open cost included):
+
+    page_count        PdfDocument(...).page_count
+    invoice_text      extract_invoice_text (span-merged, compacted)
+    rag_pages         extract_pdf_pages_for_rag (includes OCR of scanned pages)
+    ocr               ocr_pdf_pages on up to --ocr-max-pages scanned pages
+    index             index_pages_into_qdrant (FastEmbed embedding + insert)
+    retrieve          fastembed_retrieve of the invoice query
+    json_cleanup      clean_llm_json + parse_llm_json + remove_nulls on a
+                      fenced LLM answer sized like the invoice
+    mongo_write       GridFS upload + node_extractions + pdf_files inserts
+                      (--mongo-uri, a throwaway database); without it the
+                      documents are only BSON-encoded ("mock")
+
+Model loading (DocTR, FastEmbed) is done once before timing.
+
+    python -m benchmarks.run_benchmarks --json results.json
+    python -m benchmarks.run_benchmarks --pages 1,10 --baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline benchmarks/baseline.json
+
+With --baseline, stages whose median is more than --threshold slower
+(and at least --min-delta-ms) are reported as regressions and the exit
+code is 1. Run from the `backend/IDP Platform` directory.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+import bson
+
+from benchmarks.corpus import KINDS, corpus, invoice_data
+from app.services import pipeline_builder
+from app.services.pdf_document import PdfDocument
+from app.services.ocr_handle import get_doctr_model
+from app.services.pipeline_builder import (
+    RETRIEVAL_QUERY,
+    extract_invoice_text,
+    extract_pdf_pages_for_rag,
+    find_ocr_pages,
+    ocr_pdf_pages,
+    index_pages_into_qdrant,
+    fastembed_retrieve,
+    delete_document_points,
+    get_qdrant_client,
+    close_qdrant_client,
+    clean_llm_json,
+    parse_llm_json,
+    remove_nulls,
+)
+
+BENCHMARK_DB = "idp_benchmark"
+
+
+# ---------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------
+def time_runs(fn, repeat: int):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - started)
+    return runs, result
+
+
+def stage_result(name: str, kind: str, pages: int, stage: str, runs: list, **extra):
+    return {
+        "document": name,
+        "kind": kind,
+        "pages": pages,
+        "stage": stage,
+        "median_s": round(statistics.median(runs), 6),
+        "min_s": round(min(runs), 6),
+        "max_s": round(max(runs), 6),
+        "runs": len(runs),
+        **extra,
+    }
+
+
+def skipped(name: str, kind: str, pages: int, stage: str, reason: str):
+    return {"document": name, "kind": kind, "pages": pages, "stage": stage, "skipped": reason}
+
+
+def llm_answer(pages: int) -> str:
+    """A fenced LLM answer with nulls, as the model would return it."""
+    data = invoice_data(pages)
+    invoice = {
+        "invoice_number": data["invoice_number"],
+        "invoice_date": data["invoice_date"],
+        "due_date": None,
+        "currency": "USD",
+        "supplier": {"name": data["supplier"], "address": None, "tax_id": None},
+        "customer": {"name": data["customer"], "address": None, "tax_id": None},
+        "line_items": data["items"],
+        "subtotal": data["subtotal"],
+        "tax_amount": data["tax_amount"],
+        "total_amount": data["total_amount"],
+        "payment_terms": None,
+        "purchase_order_number": None,
+        "other_references": None,
+    }
+    return "```json\n" + json.dumps(invoice, indent=2) + "\n```"
+
+
+# ---------------------------------------------------------------------
+# Mongo writes: real (local mongod) or mock (BSON encoding only)
+# ---------------------------------------------------------------------
+class MongoWriter:
+
+    def __init__(self, uri: str = None):
+        self.mode = "mock"
+        self.client = None
+        if uri:
+            from pymongo import MongoClient
+            import gridfs
+
+            self.client = MongoClient(uri, serverSelectionTimeoutMS=3000)
+            self.client.admin.command("ping")
+            self.db = self.client[BENCHMARK_DB]
+            self.fs = gridfs.GridFS(self.db, collection="documents")
+            self.mode = "mongod"
+
+    def write(self, name: str, pdf_bytes: bytes, extracted: dict):
+        node_doc = {"pdf_file_id": None, "extracted_json": extracted}
+        record = {
+            "status": "Success",
+            "filename": f"{name}.pdf",
+            "page_count": None,
+            "extracted_json": extracted,
+            "created_at": datetime.utcnow(),
+        }
+
+        if self.mode == "mock":
+            bson.encode({"data": pdf_bytes})
+            bson.encode(node_doc)
+            bson.encode(record)
+            return
+
+        file_id = self.fs.put(pdf_bytes, filename=f"{name}.pdf")
+        node_doc["pdf_file_id"] = file_id
+        self.db["node_extractions"].insert_one(node_doc)
+        self.db["pdf_files"].insert_one({**record, "pdf_gridfs_id": file_id})
+
+    def close(self):
+        if self.client is not None:
+            self.client.drop_database(BENCHMARK_DB)
+            self.client.close()
+
+
+# ---------------------------------------------------------------------
+# One document through every stage
+# ---------------------------------------------------------------------
+def bench_document(name: str, kind: str, pages: int, pdf_bytes: bytes, args, mongo: MongoWriter):
+    results = []
+
+    def add(stage, runs, **extra):
+        results.append(stage_result(name, kind, pages, stage, runs, **extra))
+
+    def page_count():
+        with PdfDocument(pdf_bytes, name) as pdf:
+            return pdf.page_count
+
+    def invoice_text():
+        with PdfDocument(pdf_bytes, name) as pdf:
+            return extract_invoice_text(pdf)
+
+    def rag_pages():
+        with PdfDocument(pdf_bytes, name) as pdf:
+            return extract_pdf_pages_for_rag(pdf)
+
+    runs, _ = time_runs(page_count, args.repeat)
+    add("page_count", runs)
+
+    runs, text = time_runs(invoice_text, args.repeat)
+    add("invoice_text", runs, chars=len(text))
+
+    with PdfDocument(pdf_bytes, name) as pdf:
+        ocr_pages = find_ocr_pages(pdf)
+
+    # Full-document OCR of long scans takes minutes on CPU
+    docs = metadata = None
+    if len(ocr_pages) <= args.ocr_max_pages:
+        runs, (docs, metadata, _) = time_runs(rag_pages, args.ocr_repeat if ocr_pages else args.repeat)
+        add("rag_pages", runs, ocr_pages=len(ocr_pages))
+    else:
+        results.append(skipped(name, kind, pages, "rag_pages",
+                               f"{len(ocr_pages)} OCR pages > --ocr-max-pages {args.ocr_max_pages}"))
+
+    if ocr_pages:
+        sample = ocr_pages[:args.ocr_max_pages]
+
+        def ocr():
+            with PdfDocument(pdf_bytes, name) as pdf:
+                return ocr_pdf_pages(pdf, sample)
+
+        runs, _ = time_runs(ocr, args.ocr_repeat)
+        add("ocr", runs, ocr_pages=len(sample),
+            per_page_s=round(statistics.median(runs) / len(sample), 6))
+
+    if docs and not args.skip_qdrant:
+        file_id = metadata[0]["file_id"]
+        index_runs, retrieve_runs = [], []
+        try:
+            for _ in range(args.repeat):
+                runs, _ = time_runs(lambda: index_pages_into_qdrant(docs, metadata), 1)
+                index_runs += runs
+                runs, _ = time_runs(lambda: fastembed_retrieve(RETRIEVAL_QUERY, top_k=7, file_id=file_id), 1)
+                retrieve_runs += runs
+                delete_document_points(file_id)
+        finally:
+            delete_document_points(file_id)
+        add("index", index_runs, indexed_pages=len(docs))
+        add("retrieve", retrieve_runs)
+    elif not args.skip_qdrant:
+        results.append(skipped(name, kind, pages, "index", "no RAG pages"))
+
+    answer = llm_answer(pages)
+    runs, extracted = time_runs(lambda: remove_nulls(parse_llm_json(clean_llm_json(answer))), args.repeat)
+    add("json_cleanup", runs, chars=len(answer))
+
+    runs, _ = time_runs(lambda: mongo.write(name, pdf_bytes, extracted), args.repeat)
+    add("mongo_write", runs, mode=mongo.mode, pdf_bytes=len(pdf_bytes))
+
+    return results
+
+
+# ---------------------------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------------------------
+def compare(results: list, baseline: dict, threshold: float, min_delta_s: float):
+    previous = {
+        (r["document"], r["stage"]): r["median_s"]
+        for r in baseline.get("results", []) if "median_s" in r
+    }
+
+    rows = []
+    for r in results:
+        before = previous.get((r["document"], r["stage"]))
+        if before is None or "median_s" not in r:
+            continue
+        after = r["median_s"]
+        change = (after - before) / before if before else 0.0
+        rows.append({
+            "document": r["document"],
+            "stage": r["stage"],
+            "baseline_s": before,
+            "current_s": after,
+            "change": round(change, 4),
+            "regression": change > threshold and after - before >= min_delta_s,
+        })
+    return rows
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--pages", default="1,10,50,200", help="comma-separated page counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ocr-repeat", type=int, default=1)
+    parser.add_argument("--ocr-max-pages", type=int, default=4)
+    parser.add_argument("--skip-qdrant", action="store_true")
+    parser.add_argument("--mongo-uri", help="e.g. mongodb://localhost:27017 (default: mock writes)")
+    parser.add_argument("--corpus-dir", help="also write the generated PDFs here")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    page_counts = [int(p) for p in args.pages.split(",") if p.strip()]
+
+    # Throwaway Qdrant store; the API's store stays untouched (and unlocked)
+    qdrant_dir = tempfile.mkdtemp(prefix="idp-bench-qdrant-")
+    pipeline_builder.QDRANT_DB_PATH = qdrant_dir
+
+    started = time.perf_counter()
+    get_doctr_model()
+    if not args.skip_qdrant:
+        get_qdrant_client()
+    warmup_s = time.perf_counter() - started
+
+    mongo = MongoWriter(args.mongo_uri)
+    results = []
+    try:
+        for name, kind, pages, pdf_bytes in corpus(kinds, page_counts, args.seed):
+            if args.corpus_dir:
+                os.makedirs(args.corpus_dir, exist_ok=True)
+                with open(os.path.join(args.corpus_dir, f"{name}.pdf"), "wb") as f:
+                    f.write(pdf_bytes)
+
+            print(f"▶ {name} ({len(pdf_bytes) / 1024:.0f} KB)")
+            for r in bench_document(name, kind, pages, pdf_bytes, args, mongo):
+                results.append(r)
+                if "skipped" in r:
+                    print(f"    {r['stage']:<14} skipped: {r['skipped']}")
+                else:
+                    print(f"    {r['stage']:<14} {r['median_s'] * 1000:>10.1f} ms")
+    finally:
+        mongo.close()
+        close_qdrant_client()
+        shutil.rmtree(qdrant_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "warmup_s": round(warmup_s, 3),
+            "mongo": mongo.mode,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            comparison = compare(results, json.load(f), args.threshold, args.min_delta_ms / 1000)
+        report["comparison"] = comparison
+        regressions = [c for c in comparison if c["regression"]]
+
+        print(f"\nCompared {len(comparison)} stages with {args.baseline}")
+        for c in comparison:
+            flag = "REGRESSION" if c["regression"] else ""
+            print(f"  {c['document']:<14} {c['stage']:<14} {c['baseline_s'] * 1000:>9.1f} → "
+                  f"{c['current_s'] * 1000:>9.1f} ms  {c['change']:+.0%} {flag}")
+
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, default=str)
+
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Load generator for the extraction endpoints.
+
+Sends --requests uploads with --concurrency in flight to one of:
+
+    zip         POST /api/pipelines/extract-zip       (--file a ZIP of PDFs)
+    playground  POST /api/playground/extract          (--file a PDF/image/DOCX)
+
+and reports throughput plus p50/p95/p99 latency. Pair it with
+scripts/mock_openrouter.py to size BATCH_CONCURRENCY, BATCH_CPU_WORKERS
+and rate limits without spending real LLM calls.
+
+Identical bytes would be answered from the content-hash dedup after the
+first request, so every upload is made unique: a per-request comment is
+appended to each PDF (inside a rebuilt ZIP for --target zip), and other
+files get trailing bytes. The extracted text stays the same, so start the
+API with the LLM cache (and, for worst-case numbers, layout templates)
+off, otherwise requests still skip the LLM:
+
+    LLM_CACHE_ENABLED=false LAYOUT_TEMPLATES_ENABLED=false uvicorn app.main:app
+
+--same-bytes sends the file unchanged, to measure the reuse path itself.
+
+    python scripts/load_test.py --target zip --file invoices.zip --requests 20 --concurrency 4
+    python scripts/load_test.py --target playground --file invoice.pdf --project-id <id> \\
+        --requests 200 --concurrency 16 --json results.json
+
+Run from the `backend/IDP Platform` directory.
+"""
+import io
+import os
+import json
+import math
+import time
+import asyncio
+import zipfile
+import argparse
+import mimetypes
+from uuid import uuid4
+from collections import Counter
+
+import httpx
+
+ENDPOINTS = {
+    "zip": "/api/pipelines/extract-zip",
+    "playground": "/api/playground/extract",
+}
+
+
+def percentile(values: list, share: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def unique_pdf(data: bytes, nonce: str) -> bytes:
+    # Bytes after %%EOF are ignored by PDF readers but change the content hash
+    return data + f"\n%load-test {nonce}\n".encode()
+
+
+def unique_upload(data: bytes, filename: str, nonce: str) -> bytes:
+    """The same document with different bytes, so dedup cannot match it."""
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return unique_pdf(data, nonce)
+
+    if name.endswith(".zip"):
+        out = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(data)) as src, \
+                zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                member = src.read(info)
+                if info.filename.lower().endswith(".pdf"):
+                    member = unique_pdf(member, nonce)
+                dst.writestr(info, member)
+        return out.getvalue()
+
+    # Images and DOCX tolerate trailing bytes
+    return data + nonce.encode()
+
+
+async def send(client: httpx.AsyncClient, args, data: bytes):
+    filename = os.path.basename(args.file)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    form = None
+    if args.target == "playground":
+        form = {"project_id": args.project_id, "document_type": args.document_type}
+
+    if not args.same_bytes:
+        data = await asyncio.to_thread(unique_upload, data, filename, uuid4().hex)
+
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            ENDPOINTS[args.target],
+            files={"file": (filename, data, content_type)},
+            data=form,
+        )
+    except httpx.HTTPError as e:
+        return {"seconds": time.perf_counter() - started, "status": type(e).__name__, "documents": 0}
+
+    seconds = time.perf_counter() - started
+    documents = 0
+    if response.status_code == 200:
+        body = response.json()
+        documents = len(body.get("files_processed") or []) if args.target == "zip" else 1
+
+    return {"seconds": seconds, "status": response.status_code, "documents": documents}
+
+
+async def run(args):
+    with open(args.file, "rb") as f:
+        data = f.read()
+
+    results = []
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            result = await send(client, args, data)
+            results.append(result)
+            if args.verbose:
+                print(f"{len(results)}/{args.requests}  {result['status']}  {result['seconds']:.2f}s")
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return elapsed, results
+
+
+def summarise(args, elapsed: float, results: list) -> dict:
+    ok = [r["seconds"] for r in results if r["status"] == 200]
+    documents = sum(r["documents"] for r in results)
+
+    return {
+        "target": args.target,
+        "file": args.file,
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "unique_uploads": not args.same_bytes,
+        "elapsed_seconds": round(elapsed, 2),
+        "succeeded": len(ok),
+        "statuses": {str(k): v for k, v in Counter(r["status"] for r in results).items()},
+        "requests_per_second": round(len(ok) / elapsed, 3) if elapsed else None,
+        "documents_per_second": round(documents / elapsed, 3) if elapsed else None,
+        "latency_seconds": {
+            "p50": percentile(ok, 0.50),
+            "p95": percentile(ok, 0.95),
+            "p99": percentile(ok, 0.99),
+            "max": max(ok) if ok else None,
+            "mean": sum(ok) / len(ok) if ok else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--target", choices=sorted(ENDPOINTS), required=True)
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--project-id", help="required for --target playground")
+    parser.add_argument("--document-type", default="invoice")
+    parser.add_argument("--same-bytes", action="store_true",
+                        help="upload identical bytes every time (measures the dedup/reuse path)")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.target == "playground" and not args.project_id:
+        parser.error("--project-id is required for --target playground")
+
+    elapsed, results = asyncio.run(run(args))
+    summary = summarise(args, elapsed, results)
+
+    latency = summary["latency_seconds"]
+    print(f"{args.target}: {summary['succeeded']}/{summary['requests']} ok in {summary['elapsed_seconds']}s "
+          f"(concurrency {args.concurrency})")
+    print(f"throughput: {summary['requests_per_second']} req/s, {summary['documents_per_second']} docs/s")
+    if latency["p50"] is not None:
+        print(f"latency: p50 {latency['p50']:.2f}s  p95 {latency['p95']:.2f}s  "
+              f"p99 {latency['p99']:.2f}s  max {latency['max']:.2f}s")
+    print(f"statuses: {summary['statuses']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
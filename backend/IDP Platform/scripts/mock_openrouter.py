@@ -0,0 +1,224 @@
+"""
+Local stand-in for the OpenRouter chat completions API, for load tests.
+
+Answers every request with canned JSON after a sampled latency, and can
+inject 429s, 5xx errors and malformed output. Supports streamed (SSE)
+responses, packed multi-document prompts (invoice_packer) and image OCR
+prompts.
+
+    python scripts/mock_openrouter.py --port 8900 --latency lognormal:2:0.5 --rate-429 0.05
+
+Then start the API against it (any API key is accepted):
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8900/api/v1 OPENROUTER_API_KEY=mock uvicorn app.main:app
+
+Latency specs (seconds): fixed:S, uniform:LO:HI, normal:MEAN:STD,
+lognormal:MEDIAN:SIGMA, exp:MEAN. --model-latency MODEL=SPEC overrides
+the default for one model (repeatable). GET /stats returns counters.
+
+Run from the `backend/IDP Platform` directory.
+"""
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_INVOICE = {
+    "invoice_number": "INV-1001",
+    "invoice_date": "2024-03-15",
+    "due_date": "2024-04-14",
+    "currency": "USD",
+    "supplier": {"name": "Acme Supplies Ltd", "address": "1 Market Street, Springfield", "tax_id": "US123456789"},
+    "customer": {"name": "Globex Corporation", "address": "42 Elm Road, Shelbyville", "tax_id": None},
+    "line_items": [
+        {"description": "Widgets", "quantity": 10, "unit_price": 12.5, "line_total": 125.0},
+        {"description": "Installation", "quantity": 1, "unit_price": 75.0, "line_total": 75.0},
+    ],
+    "subtotal": 200.0,
+    "tax_amount": 20.0,
+    "total_amount": 220.0,
+    "payment_terms": "Net 30",
+    "purchase_order_number": "PO-7788",
+    "other_references": None,
+}
+
+CANNED_OCR_TEXT = (
+    "# INVOICE\n\nInvoice No: INV-1001\nDate: 2024-03-15\n\n"
+    "| Description | Qty | Unit Price | Amount |\n|---|---|---|---|\n"
+    "| Widgets | 10 | 12.50 | 125.00 |\n\nTotal: 220.00"
+)
+
+DOCUMENT_ID_RE = re.compile(r"<<<DOCUMENT (\S+)>>>")
+STREAM_CHUNK_CHARS = 24
+
+
+# ---------------------------------------------------------------------
+# Latency distributions
+# ---------------------------------------------------------------------
+def parse_latency(spec: str):
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+
+    samplers = {
+        "fixed": lambda s: s,
+        "uniform": lambda lo, hi: random.uniform(lo, hi),
+        "normal": lambda mean, std: random.gauss(mean, std),
+        "lognormal": lambda median, sigma: random.lognormvariate(math.log(median), sigma),
+        "exp": lambda mean: random.expovariate(1 / mean),
+    }
+    if kind not in samplers:
+        raise argparse.ArgumentTypeError(f"unknown latency distribution {kind!r}")
+
+    sampler = samplers[kind]
+    try:
+        sampler(*values)
+    except TypeError:
+        raise argparse.ArgumentTypeError(f"wrong number of parameters in {spec!r}")
+
+    return lambda: max(0.0, sampler(*values))
+
+
+def model_latency_arg(value: str):
+    model, sep, spec = value.rpartition("=")
+    if not sep or not model:
+        raise argparse.ArgumentTypeError(f"expected MODEL=SPEC, got {value!r}")
+    parse_latency(spec)
+    return model, spec
+
+
+# ---------------------------------------------------------------------
+# Canned answers
+# ---------------------------------------------------------------------
+class Answers:
+
+    def __init__(self, path: str = None):
+        answers = [CANNED_INVOICE]
+        if path:
+            with open(path, encoding="utf-8") as f:
+                loaded = json.load(f)
+            answers = loaded if isinstance(loaded, list) else [loaded]
+        self.answers = answers
+        self._next = 0
+
+    def invoice(self) -> dict:
+        answer = self.answers[self._next % len(self.answers)]
+        self._next += 1
+        return answer
+
+    def content(self, payload: dict) -> str:
+        messages = payload.get("messages") or []
+        user = messages[-1].get("content") if messages else ""
+
+        # Vision OCR prompt (PlaygroundService._call_gemma_image_ocr)
+        if isinstance(user, list):
+            return CANNED_OCR_TEXT
+
+        # Packed request: one keyed entry per document
+        ids = DOCUMENT_ID_RE.findall(user or "")
+        if ids:
+            return json.dumps({"documents": [{"id": i, "invoice": self.invoice()} for i in ids]})
+
+        return json.dumps(self.invoice())
+
+
+def completion_body(model: str, content: str) -> dict:
+    return {
+        "id": f"mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4, "total_tokens": len(content) // 4},
+    }
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Mock OpenRouter")
+    answers = Answers(args.answers)
+    default_latency = parse_latency(args.latency)
+    model_latency = {model: parse_latency(spec) for model, spec in args.model_latency}
+    stats = Counter()
+
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "")
+        stats["requests"] += 1
+
+        roll = random.random()
+        if roll < args.rate_429:
+            stats["429"] += 1
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Rate limit exceeded (mock)"}},
+                status_code=429,
+                headers={"Retry-After": str(args.retry_after)},
+            )
+        if roll < args.rate_429 + args.rate_500:
+            stats["500"] += 1
+            return JSONResponse({"error": {"code": 500, "message": "Internal error (mock)"}}, status_code=500)
+
+        latency = model_latency.get(model, default_latency)()
+        content = answers.content(payload)
+        if random.random() < args.malformed_rate:
+            stats["malformed"] += 1
+            content = "Sure! Here is the invoice data: " + content[: len(content) // 2]
+
+        if not payload.get("stream"):
+            await asyncio.sleep(latency)
+            stats["completed"] += 1
+            return JSONResponse(completion_body(model, content))
+
+        async def events():
+            # First token after part of the latency, the rest spread evenly
+            chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            await asyncio.sleep(latency * args.first_token_share)
+            step = latency * (1 - args.first_token_share) / max(1, len(chunks))
+
+            yield ": OPENROUTER PROCESSING\n\n"
+            for chunk in chunks:
+                event = {"model": model, "choices": [{"index": 0, "delta": {"content": chunk}}]}
+                yield f"data: {json.dumps(event)}\n\n"
+                await asyncio.sleep(step)
+            yield "data: [DONE]\n\n"
+            stats["completed"] += 1
+
+        stats["streamed"] += 1
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_api_route("/api/v1/chat/completions", chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal:2:0.5")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        type=model_latency_arg)
+    parser.add_argument("--first-token-share", type=float, default=0.3,
+                        help="share of the latency before the first streamed token")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--answers", help="JSON file with one canned invoice or a list (used round-robin)")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Import-time profile of the API.
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter and
+reports the slowest modules by cumulative import time.
+
+    python scripts/profile_imports.py                 # top 25 table
+    python scripts/profile_imports.py --json out.json # machine-readable
+    python scripts/profile_imports.py --budget-ms 3000  # exit 1 if slower
+
+Run from the `backend/IDP Platform` directory.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def profile(module: str):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import {module} failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        rows.append({
+            "module": name.strip(),
+            "depth": len(indent) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+
+    total_ms = next(
+        (r["cumulative_ms"] for r in rows if r["module"] == module),
+        sum(r["self_ms"] for r in rows),
+    )
+    return total_ms, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--budget-ms", type=float)
+    args = parser.parse_args()
+
+    total_ms, rows = profile(args.module)
+    slowest = sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:args.top]
+
+    print(f"import {args.module}: {total_ms:.0f} ms total, {len(rows)} modules\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for r in slowest:
+        print(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>9.1f}  {r['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"module": args.module, "total_ms": total_ms, "modules": rows}, f, indent=2)
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nImport time {total_ms:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()